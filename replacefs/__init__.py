@@ -1 +1,3 @@
 name = "replacefs"
+
+from .replacefs import Replacer, ReplaceOptions, ReplaceResult, ReplaceError, undo, UndoResult
@@ -0,0 +1,277 @@
+"""benchmarks of the replacefs hot spots
+
+    python -m replacefs.bench [--scale SCALE] [--output RESULTS_PATH] [--compare PREVIOUS_RESULTS_PATH]
+
+The tree benchmarks run on a synthetic corpus (many small files, a few huge files, very long lines, binary blobs, deep
+directories, mixed case and unicode content) built again in a temporary directory before each run, since a run
+replaces its occurrences. Each one runs in its own process, so that its peak RSS is its own. The results are saved as
+json, and compared to the results of a previous run with --compare.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import timeit
+import resource
+import tempfile
+import contextlib
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from .colors import *
+from . import replacefs
+
+LINE_PATTERN = "var titi = {\"Été\": [1, 2, 3], \"TiTi\": null}; "
+LINE_LENGTHS = [1000, 10000, 100000, 1000000]
+# above these lengths the previous quadratic implementations take minutes
+QUADRATIC_MAX_LINE_LENGTHS = {True: 100000, False: 10000}
+
+# corpus sizes at scale 1, about 100 MB
+SMALL_FILES_NB = 2000
+SMALL_FILE_LINES_NB = 40
+HUGE_FILES_NB = 2
+HUGE_FILE_SIZE = 32 * 1024 * 1024
+LONG_LINE_FILES_NB = 4
+LONG_LINE_LENGTH = 2 * 1024 * 1024
+BINARY_FILES_NB = 50
+BINARY_FILE_SIZE = 256 * 1024
+DEEP_DIRECTORIES_NB = 40
+MIXED_FILES_NB = 200
+CORPUS_SEED = 42
+TEXT_SIZE = 16 * 1024 * 1024
+INIT_STR = "titi"
+DEST_STR = "toto"
+WORDS = ["var", "function", "return", "value", "index", "titi", "titan", "it", "tit", "replace", "file", "path"]
+MIXED_WORDS = ["TiTi", "TITI", "titi", "Été", "ÉTÉ", "straße", "STRASSE", "ﬁle", "naïve", "日本語", "Ωmega", "tīti"]
+
+
+def _quadratic_str_positions_in_lines(string, line, case_sensitive):
+    # the implementation of _get_str_positions_in_lines before the str.find based one, kept as a reference
+    def normalize_case_less(string):
+        return unicodedata.normalize("NFKD", string.casefold())
+
+    start_string_indexes = []
+    if case_sensitive:
+        for index in range(len(line)):
+            if line[index:].startswith(string):
+                start_string_indexes.append(index)
+    if not case_sensitive:
+        for index in range(len(line)):
+            if normalize_case_less(line)[index:].startswith(normalize_case_less(string)):
+                start_string_indexes.append(index)
+    return start_string_indexes
+
+
+def _time(function, *args):
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=3))
+
+
+def bench_str_positions_in_lines():
+    print(WHITE + "\n\t_get_str_positions_in_lines on long lines\n" + BASE_C)
+    for case_sensitive in [True, False]:
+        for line_length in LINE_LENGTHS:
+            line = (LINE_PATTERN * (line_length // len(LINE_PATTERN) + 1))[:line_length]
+            new_time = _time(replacefs._get_str_positions_in_lines, "titi", line, case_sensitive)
+            if line_length <= QUADRATIC_MAX_LINE_LENGTHS[case_sensitive]:
+                old_time = _time(_quadratic_str_positions_in_lines, "titi", line, case_sensitive)
+                speedup = "%.0fx" % (old_time / new_time)
+                old_time = "%.4fs" % old_time
+            else:
+                old_time = speedup = "-"
+            print("\t    case sensitive: %-5s  line length: %-7s  quadratic: %-9s  linear: %.4fs  speedup: %s"
+                  % (case_sensitive, line_length, old_time, new_time, speedup))
+
+
+def _scaled(count, scale):
+    return max(1, int(count * scale))
+
+
+def _text_lines(rng, words, lines_nb, words_nb_by_line=12):
+    return "".join(" ".join(rng.choice(words) for _ in range(words_nb_by_line)) + "\n" for _ in range(lines_nb))
+
+
+def _write_text(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding=replacefs.ENCODING_INPUT_FILES) as file:
+        file.write(text)
+
+
+def build_corpus(root_path, scale=1.0):
+    # deterministic: the same scale always gives the same tree
+    rng = random.Random(CORPUS_SEED)
+    for file_index in range(_scaled(SMALL_FILES_NB, scale)):
+        _write_text(os.path.join(root_path, "small", "%02d" % (file_index % 50), "file_%04d.txt" % file_index),
+                    _text_lines(rng, WORDS, SMALL_FILE_LINES_NB))
+
+    huge_chunk = _text_lines(rng, WORDS, 1000)
+    for file_index in range(HUGE_FILES_NB):
+        huge_size = _scaled(HUGE_FILE_SIZE, scale)
+        _write_text(os.path.join(root_path, "huge", "huge_%d.txt" % file_index),
+                    huge_chunk * (huge_size // len(huge_chunk) + 1))
+
+    for file_index in range(_scaled(LONG_LINE_FILES_NB, scale)):
+        line = " ".join(rng.choice(WORDS) for _ in range(_scaled(LONG_LINE_LENGTH, scale) // 6))
+        _write_text(os.path.join(root_path, "long_lines", "minified_%d.js" % file_index), line + "\n")
+
+    binary_directory_path = os.path.join(root_path, "binary")
+    os.makedirs(binary_directory_path, exist_ok=True)
+    for file_index in range(_scaled(BINARY_FILES_NB, scale)):
+        with open(os.path.join(binary_directory_path, "blob_%d.dat" % file_index), "wb") as file:
+            file.write(rng.randbytes(_scaled(BINARY_FILE_SIZE, scale)) + INIT_STR.encode())
+
+    deep_directory_path = os.path.join(root_path, "deep")
+    for depth in range(DEEP_DIRECTORIES_NB):
+        deep_directory_path = os.path.join(deep_directory_path, "level_%d" % depth)
+        _write_text(os.path.join(deep_directory_path, "file.txt"), _text_lines(rng, WORDS, 5))
+
+    for file_index in range(_scaled(MIXED_FILES_NB, scale)):
+        _write_text(os.path.join(root_path, "mixed", "mixed_%d.txt" % file_index),
+                    _text_lines(rng, MIXED_WORDS, SMALL_FILE_LINES_NB))
+
+
+def _corpus_stats(root_path):
+    files_nb = 0
+    bytes_nb = 0
+    for directory_path, _, file_names in os.walk(root_path):
+        for file_name in file_names:
+            files_nb += 1
+            bytes_nb += os.path.getsize(os.path.join(directory_path, file_name))
+    return files_nb, bytes_nb
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in KiB on linux and in bytes on macOS. The jobs of --jobs are children of the measured process
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _quiet_replacefs():
+    # the benchmarks measure the work, not the terminal
+    replacefs._set_output_mode(False, replacefs.QUIET_VERBOSITY)
+    replacefs._reset_counts()
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _run_tree_case(case_name, scale, case_sensitive, jobs_nb, dry_run):
+    # run in a fresh process: the corpus is built, then only the replacement is timed
+    root_path = tempfile.mkdtemp(prefix="replacefs_bench_")
+    try:
+        build_corpus(root_path, scale)
+        files_nb, bytes_nb = _corpus_stats(root_path)
+        matcher = replacefs.StringMatcher(INIT_STR, DEST_STR, case_sensitive)
+        with _quiet_replacefs():
+            start_time = time.perf_counter()
+            if case_name == "replace_specific":
+                file_paths = [os.path.join(directory_path, file_name)
+                              for directory_path, _, file_names in os.walk(os.path.join(root_path, "small"))
+                              for file_name in file_names]
+                files_nb = len(file_paths)
+                bytes_nb = sum(os.path.getsize(file_path) for file_path in file_paths)
+                replacefs._replace_specific(file_paths, matcher, True, False, False, False, dry_run=dry_run)
+            else:
+                path_filter = replacefs.PathFilter(True, [], [], [], [])
+                replacefs._replace_local_recursive(root_path, matcher, path_filter, False, False, False, False,
+                                                   jobs_nb, dry_run=dry_run)
+            duration = time.perf_counter() - start_time
+        return {"files": files_nb, "bytes": bytes_nb, "found": replacefs.state.found_nb, "time": duration,
+                "files_per_s": files_nb / duration, "mb_per_s": bytes_nb / duration / 1e6,
+                "peak_rss_mb": _peak_rss_bytes() / 1e6}
+    finally:
+        shutil.rmtree(root_path, ignore_errors=True)
+
+
+def _run_text_case(case_sensitive):
+    rng = random.Random(CORPUS_SEED)
+    words = WORDS if case_sensitive else MIXED_WORDS
+    chunk = _text_lines(rng, [word for word in words if word.lower() != INIT_STR], 1000)
+    text = (chunk * (TEXT_SIZE // len(chunk) + 1))[:TEXT_SIZE]
+    duration = _time(replacefs._check_init_str_in_text, text, INIT_STR, case_sensitive)
+    return {"bytes": len(text.encode()), "time": duration, "mb_per_s": len(text.encode()) / duration / 1e6,
+            "peak_rss_mb": _peak_rss_bytes() / 1e6}
+
+
+def _run_positions_case(case_sensitive):
+    line = (LINE_PATTERN * (LINE_LENGTHS[-1] // len(LINE_PATTERN) + 1))[:LINE_LENGTHS[-1]]
+    duration = _time(replacefs._get_str_positions_in_lines, INIT_STR, line, case_sensitive)
+    return {"bytes": len(line.encode()), "time": duration, "mb_per_s": len(line.encode()) / duration / 1e6,
+            "peak_rss_mb": _peak_rss_bytes() / 1e6}
+
+
+def _cases(scale):
+    jobs_nb = max(2, os.cpu_count() or 1)
+    return [
+        ("replace_local_recursive", _run_tree_case, ("replace_local_recursive", scale, True, 1, False)),
+        ("replace_local_recursive case insensitive", _run_tree_case,
+         ("replace_local_recursive", scale, False, 1, False)),
+        ("replace_local_recursive dry run", _run_tree_case, ("replace_local_recursive", scale, True, 1, True)),
+        ("replace_local_recursive %s jobs" % jobs_nb, _run_tree_case,
+         ("replace_local_recursive", scale, True, jobs_nb, False)),
+        ("replace_specific", _run_tree_case, ("replace_specific", scale, True, 1, False)),
+        ("check_init_str_in_text", _run_text_case, (True,)),
+        ("check_init_str_in_text case insensitive", _run_text_case, (False,)),
+        ("get_str_positions_in_lines", _run_positions_case, (True,)),
+        ("get_str_positions_in_lines case insensitive", _run_positions_case, (False,)),
+    ]
+
+
+def bench_cases(scale=1.0):
+    print(WHITE + "\n\tsynthetic corpus, scale %s\n" % scale + BASE_C)
+    results = {}
+    for case_name, case_function, case_args in _cases(scale):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(case_function, *case_args).result()
+        results[case_name] = result
+        files_per_s = "%.0f files/s" % result["files_per_s"] if "files_per_s" in result else ""
+        print("\t    %-45s %8.3fs  %15s  %9.1f MB/s  peak RSS: %.0f MB"
+              % (case_name, result["time"], files_per_s, result["mb_per_s"], result["peak_rss_mb"]))
+    return results
+
+
+def compare_results(results, previous_results):
+    print(WHITE + "\n\tcompared to the previous results\n" + BASE_C)
+    for case_name, result in results.items():
+        previous_result = previous_results.get("cases", {}).get(case_name)
+        if previous_result is None:
+            continue
+        ratio = previous_result["time"] / result["time"]
+        color = GREEN if ratio >= 1 else RED
+        print("\t    %-45s " % case_name + color + "%.2fx" % ratio + BASE_C +
+              "  peak RSS: %.0f MB -> %.0f MB" % (previous_result["peak_rss_mb"], result["peak_rss_mb"]))
+
+
+def _get_option_value(args, option):
+    if option in args:
+        option_index = args.index(option)
+        if option_index + 1 < len(args):
+            return args[option_index + 1]
+        print(RED + "\n\tthe option %s needs a value" % option + BASE_C)
+        exit(1)
+    return None
+
+
+def main():
+    args = sys.argv[1:]
+    scale = float(_get_option_value(args, "--scale") or 1.0)
+    output_path = _get_option_value(args, "--output") or "replacefs_bench_%s.json" % time.strftime("%Y%m%d_%H%M%S")
+    previous_results_path = _get_option_value(args, "--compare")
+
+    bench_str_positions_in_lines()
+    results = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0], "scale": scale,
+               "cases": bench_cases(scale)}
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(WHITE + "\n\tresults saved in %s" % output_path + BASE_C)
+
+    if previous_results_path is not None:
+        with open(previous_results_path) as previous_results_file:
+            previous_results = json.load(previous_results_file)
+        if previous_results.get("scale") != scale:
+            print(ORANGE + "\n\tthe previous results were measured at scale %s, their times are not comparable"
+                  % previous_results.get("scale") + BASE_C)
+        compare_results(results["cases"], previous_results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""gitignore rules, compiled once per directory of a walk
+
+The .gitignore and .ignore files follow the gitignore syntax: blank lines and lines starting by # are ignored, a
+leading ! negates the pattern, a trailing / only matches directories, a pattern owning another / is relative to the
+directory of its ignore file and a pattern without / matches a name at any depth. * and ? don't match /, ** matches
+any number of directories. The rules of the deepest ignore files come last and win, the last matching rule decides.
+"""
+import os
+import re
+
+IGNORE_FILE_NAMES = [".gitignore", ".ignore"]
+# never descended when the ignore rules are respected
+VCS_DIRECTORY_NAMES = [".git", ".hg", ".svn"]
+
+
+class IgnoreRule:
+
+    def __init__(self, regex, negated, directory_only):
+        self.regex = regex
+        self.negated = negated
+        self.directory_only = directory_only
+
+
+def _translate_glob(glob):
+    regex = ""
+    index = 0
+    while index < len(glob):
+        char = glob[index]
+        if glob.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+            continue
+        if glob.startswith("**", index):
+            regex += ".*"
+            index += 2
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "\\" and index + 1 < len(glob):
+            index += 1
+            regex += re.escape(glob[index])
+        elif char == "[" and "]" in glob[index + 2:]:
+            end_index = glob.index("]", index + 2)
+            char_class = glob[index + 1:end_index].replace("\\", "\\\\")
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex += "[" + char_class + "]"
+            index = end_index
+        else:
+            regex += re.escape(char)
+        index += 1
+    return regex
+
+
+def parse_ignore_line(line):
+    """the IgnoreRule of an ignore file line, None for blank and comment lines"""
+    line = line.rstrip("\r\n")
+    # trailing spaces are ignored unless escaped
+    stripped_line = line.rstrip(" ")
+    if stripped_line.endswith("\\") and len(stripped_line) < len(line):
+        stripped_line += " "
+    line = stripped_line
+    if not line or line.startswith("#"):
+        return None
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+
+    directory_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # a pattern owning a / is anchored to the ignore file directory, otherwise it matches a name at any depth
+    anchored = "/" in line
+    line = line.lstrip("/")
+    prefix = "" if anchored else "(?:.*/)?"
+    return IgnoreRule(re.compile("^" + prefix + _translate_glob(line) + "$"), negated, directory_only)
+
+
+def parse_ignore_file(ignore_file_path):
+    try:
+        with open(ignore_file_path, encoding="utf8", errors="replace") as ignore_file:
+            rules = [parse_ignore_line(line) for line in ignore_file]
+    except OSError:
+        return []
+    return [rule for rule in rules if rule is not None]
+
+
+def _find_repository_root(directory_path):
+    # the ignore files of the parent directories up to the repository root apply too
+    path = directory_path
+    while True:
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            return directory_path
+        path = parent_path
+
+
+class IgnoreTree:
+    """the ignore rules applying in each directory of a walk from root_path
+
+    The rules of a directory are its parent directory rules followed by the ones of its own ignore files. They are
+    parsed and compiled the first time the directory is reached, then cached.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.repository_root_path = _find_repository_root(root_path)
+        self._rules_by_directory = {}
+
+    def _directory_rules(self, directory_path):
+        rules = self._rules_by_directory.get(directory_path)
+        if rules is not None:
+            return rules
+
+        parent_path = os.path.dirname(directory_path)
+        if directory_path == self.repository_root_path or parent_path == directory_path:
+            rules = []
+        else:
+            rules = list(self._directory_rules(parent_path))
+        for ignore_file_name in IGNORE_FILE_NAMES:
+            rules += [(directory_path, rule)
+                      for rule in parse_ignore_file(os.path.join(directory_path, ignore_file_name))]
+        self._rules_by_directory[directory_path] = rules
+        return rules
+
+    def is_ignored(self, path, is_directory):
+        if is_directory and os.path.basename(path) in VCS_DIRECTORY_NAMES:
+            return True
+        for base_path, rule in reversed(self._directory_rules(os.path.dirname(path))):
+            if rule.directory_only and not is_directory:
+                continue
+            if rule.regex.match(path[len(base_path.rstrip(os.sep)) + 1:]):
+                return not rule.negated
+        return False
@@ -0,0 +1,104 @@
+"""persistent content index, used to skip the files that can't own the initial string
+
+For each indexed file the index keeps, under its path, the (inode, size, mtime_ns) the file had when it was indexed and
+a bloom filter of the trigrams of its bytes. While the file keeps the same inode, size and mtime_ns, a needle with a
+trigram missing from the filter is proven not to be in the file, and the file doesn't need to be opened. An entry
+whose key doesn't match the file anymore is stale: it is ignored and replaced the next time the file is read.
+"""
+import os
+import zlib
+import sqlite3
+
+INDEX_VERSION = 1
+# the trigrams of bigger files would make the first run too slow, they are always read
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+BITS_NB_BY_TRIGRAM = 8
+MIN_BITS_NB = 512
+
+
+def default_index_path():
+    cache_dir_path = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir_path, "replacefs", "index.sqlite")
+
+
+def _trigram_bits(trigram, bits_nb):
+    # two independent hashes per trigram, bits_nb is a power of 2
+    return zlib.crc32(trigram) & (bits_nb - 1), zlib.crc32(trigram, 0x5bd1e995) & (bits_nb - 1)
+
+
+class TrigramFilter:
+    """bloom filter of the trigrams of a file content"""
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    @classmethod
+    def from_content(cls, file_content):
+        trigrams = {file_content[index:index + 3] for index in range(len(file_content) - 2)}
+        bits_nb = MIN_BITS_NB
+        while bits_nb < BITS_NB_BY_TRIGRAM * len(trigrams):
+            bits_nb *= 2
+        bits = bytearray(bits_nb // 8)
+        for trigram in trigrams:
+            for bit in _trigram_bits(trigram, bits_nb):
+                bits[bit >> 3] |= 1 << (bit & 7)
+        return cls(bytes(bits))
+
+    def may_contain(self, needle):
+        # needles shorter than a trigram can't be excluded
+        bits_nb = len(self.bits) * 8
+        for index in range(len(needle) - 2):
+            for bit in _trigram_bits(needle[index:index + 3], bits_nb):
+                if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                    return False
+        return True
+
+
+class ContentIndex:
+    """sqlite index of the TrigramFilter of the files, keyed by path
+
+    The connection is opened lazily and is not pickled, so each worker process of the --jobs mode opens its own one.
+    Every update is committed at once: the index is a cache, it is rebuilt if lost, so it is not synced to disk.
+    """
+
+    def __init__(self, index_path=None, rebuild=False):
+        self.index_path = index_path or default_index_path()
+        self._connection = None
+        if rebuild:
+            self._connect().execute("DELETE FROM files")
+
+    def __getstate__(self):
+        return {"index_path": self.index_path, "_connection": None}
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            self._connection = sqlite3.connect(self.index_path, isolation_level=None, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=OFF")
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS files")
+                self._connection.execute("PRAGMA user_version=%d" % INDEX_VERSION)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, inode INTEGER, "
+                                     "size INTEGER, mtime_ns INTEGER, trigrams BLOB)")
+        return self._connection
+
+    def get(self, file_path, file_stat):
+        """the TrigramFilter of the file, None if the file is not indexed or has changed since"""
+        row = self._connect().execute("SELECT inode, size, mtime_ns, trigrams FROM files WHERE path = ?",
+                                      (file_path,)).fetchone()
+        if row is None or row[:3] != (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns):
+            return None
+        return TrigramFilter(row[3])
+
+    def add(self, file_path, file_stat, file_content):
+        if len(file_content) > MAX_INDEXED_FILE_SIZE:
+            return
+        self._connect().execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                (file_path, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns,
+                                 TrigramFilter.from_content(file_content).bits))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
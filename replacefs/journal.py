@@ -0,0 +1,90 @@
+"""undo journal of the replaced files, written with --journal and read by --undo
+
+Each replaced file gets one record: a json line with its path, the size and modification time of its replaced content
+and the (gap, length, original length) of each change, followed by the original bytes of the changes. The gap is the
+number of unchanged bytes since the end of the previous change, so that the small numbers of a file owning many
+changes stay short. Only the spans that changed are kept, not copies of the files.
+
+The worker processes of --jobs share the journal, opened in append mode: each record is appended by one write, which
+keeps it in one piece in practice. A write cut short, by a full disk or a record above the 2 GB a write takes on Linux,
+has its rest appended by the next writes, and a record of another process may then land in the middle.
+"""
+import os
+import json
+import collections
+
+JOURNAL_HEADER = b"replacefs undo journal 1\n"
+
+# a record read back from a journal, changes are (offset, length, original bytes) in the replaced content
+JournalRecord = collections.namedtuple("JournalRecord", ["path", "size", "mtime_ns", "changes"])
+
+
+class JournalError(Exception):
+    pass
+
+
+class Journal:
+    """undo journal open for appending records"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        journal_stat = os.fstat(self._fd)
+        self._file_id = (journal_stat.st_dev, journal_stat.st_ino)
+        if journal_stat.st_size == 0:
+            os.write(self._fd, JOURNAL_HEADER)
+
+    def is_journal(self, file_stat):
+        # a journal in a replaced tree must not be replaced itself
+        return (file_stat.st_dev, file_stat.st_ino) == self._file_id
+
+    def add(self, file_path, file_stat, changes):
+        # changes are the (offset, length, original bytes) of the replaced content whose stat is file_stat
+        spans = []
+        position = 0
+        for offset, length, original in changes:
+            spans.extend([offset - position, length, len(original)])
+            position = offset + length
+        header = {"path": file_path, "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "changes": spans}
+        # ascii json: the paths not decodable by the file system encoding are escaped as well
+        header_line = json.dumps(header, separators=(",", ":")).encode("ascii") + b"\n"
+        record = memoryview(b"".join([header_line] + [original for _, _, original in changes]))
+        # one write for the whole record, see the module docstring
+        written = os.write(self._fd, record)
+        while written < len(record):
+            written += os.write(self._fd, record[written:])
+
+    def sync(self):
+        os.fsync(self._fd)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_journal(path):
+    # returns the records of the journal in the order they were written
+    records = []
+    with open(path, "rb") as file:
+        if file.readline() != JOURNAL_HEADER:
+            raise JournalError("%s is not an undo journal" % path)
+        while True:
+            header_line = file.readline()
+            if not header_line:
+                return records
+            try:
+                header = json.loads(header_line)
+                spans = header["changes"]
+                changes = []
+                position = 0
+                for span_index in range(0, len(spans) - 2, 3):
+                    gap, length, original_length = spans[span_index:span_index + 3]
+                    original = file.read(original_length)
+                    if len(original) != original_length:
+                        raise JournalError("the record of %s is truncated" % header["path"])
+                    changes.append((position + gap, length, original))
+                    position += gap + length
+                records.append(JournalRecord(header["path"], header["size"], header["mtime_ns"], changes))
+            except (ValueError, KeyError, TypeError) as e:
+                raise JournalError("the journal %s is corrupted\n\t%s" % (path, e))
@@ -0,0 +1,114 @@
+"""buffered binary output of a replaced file
+
+The replaced text is encoded once per write and kept in memory until FLUSH_SIZE bytes are pending, so the temporary
+file receives a few big writes instead of one per line. When the decoded text has the same offsets as the bytes of the
+source file (ascii text whose newlines were not translated), the spans without occurrences are copied from the
+source bytes without being encoded again, and the big ones are copied by the kernel from the source file.
+"""
+import os
+
+FLUSH_SIZE = 1024 * 1024
+# below this size a kernel copy doesn't save anything over a write of the buffered bytes
+KERNEL_COPY_MIN_SIZE = 1024 * 1024
+
+
+class OutputFile:
+    """replaced content of a file, written to an unbuffered binary file whose path is path"""
+
+    def __init__(self, file, encoding, path=None, track_changes=False):
+        self._file = file
+        self.path = path
+        # number of bytes written so far, and among them the ones copied by the kernel
+        self.size = 0
+        self.kernel_copied_size = 0
+        # for the undo journal, the (offset, length, source bytes) of the spans written in place of source spans.
+        # whole_source_changed when the copied spans differ from the source bytes as well
+        self.changes = [] if track_changes else None
+        self.whole_source_changed = False
+        self._encoding = encoding
+        self._parts = []
+        self._pending_size = 0
+        self._source_text = None
+        self._source_content = None
+        self._source_path = None
+        self._source_fd = None
+        self._kernel_copy = hasattr(os, "copy_file_range") or hasattr(os, "sendfile")
+
+    def set_source(self, source_text, source_content=None, source_path=None):
+        # source_content, the bytes source_text was decoded from, is only given when their offsets are the same
+        self._source_text = source_text
+        self._source_content = source_content
+        self._source_path = source_path
+
+    def write(self, text):
+        self.write_bytes(text.encode(self._encoding))
+
+    def add_change(self, start, source_text):
+        # what was written since the offset start replaces source_text
+        if self.changes is not None:
+            self.changes.append((start, self.size - start, source_text.encode(self._encoding)))
+
+    def copy_source(self, start, end):
+        # writes source_text[start:end]
+        if end <= start:
+            return
+        if self._source_content is None:
+            self.write(self._source_text[start:end])
+        elif end - start >= KERNEL_COPY_MIN_SIZE and self._copy_source_by_kernel(start, end):
+            return
+        else:
+            self.write_bytes(self._source_content[start:end])
+
+    def flush(self):
+        if self._parts:
+            self._file.write(b"".join(self._parts))
+            self._parts = []
+            self._pending_size = 0
+
+    def sync(self):
+        # the content is on the disk when it returns
+        self.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._source_fd is not None:
+                os.close(self._source_fd)
+                self._source_fd = None
+            self._file.close()
+
+    def write_bytes(self, data):
+        self.size += len(data)
+        self._parts.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= FLUSH_SIZE:
+            self.flush()
+
+    def _copy_source_by_kernel(self, start, end):
+        # the kernel copies from the current offset of the output file, everything written before has to be there
+        if not self._kernel_copy or self._source_path is None:
+            return False
+        self.flush()
+        offset = start
+        try:
+            if self._source_fd is None:
+                self._source_fd = os.open(self._source_path, os.O_RDONLY)
+            output_fd = self._file.fileno()
+            while offset < end:
+                if hasattr(os, "copy_file_range"):
+                    copied = os.copy_file_range(self._source_fd, output_fd, end - offset, offset)
+                else:
+                    copied = os.sendfile(output_fd, self._source_fd, offset, end - offset)
+                if copied == 0:
+                    break
+                offset += copied
+                self.size += copied
+                self.kernel_copied_size += copied
+        except OSError:
+            # not supported between these files: the rest is written from the bytes, the next copies as well
+            self._kernel_copy = False
+        if offset < end:
+            self.write_bytes(self._source_content[offset:end])
+        return True
@@ -0,0 +1,33 @@
+"""bounded read ahead of the files to process, used by --pipeline
+
+The calling thread walks and processes the files in order while a few reader threads fetch the next ones, so the read
+latency of cold disks and network filesystems overlaps the scan and the rewrite of the current file. The walk only runs
+depth files ahead of the processing: it stops while the window is full, which bounds the memory held by the fetched
+contents.
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prefetched(items, fetch, readers_nb, depth, release=None):
+    # yields (item, fetch(item)) in the order of items, fetch runs in the reader threads and must not raise. When the
+    # consumer stops early, release is called on the results fetched but not yielded
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=readers_nb, thread_name_prefix="replacefs-reader") as executor:
+        try:
+            for item in items:
+                pending.append((item, executor.submit(fetch, item)))
+                if len(pending) >= depth:
+                    yield _pop_fetched(pending)
+            while pending:
+                yield _pop_fetched(pending)
+        finally:
+            # the consumer stopped early: the fetches not started yet are dropped, the others released once done
+            for _, future in pending:
+                if not future.cancel() and release is not None:
+                    release(future.result())
+
+
+def _pop_fetched(pending):
+    item, future = pending.popleft()
+    return item, future.result()
@@ -1,14 +1,42 @@
 #!/usr/bin/python
 import os
+import io
 import re
 import sys
 import getpass
+import sqlite3
 import unicodedata
 import copy
+import mmap
+import logging
+import threading
+import bisect
+import fnmatch
+import itertools
+import collections
+import contextlib
+import functools
+import tempfile
+import shutil
+import json
+import time
+import cProfile
+import shlex
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os import stat
 from pwd import getpwuid
+from stat import S_ISREG
 from .colors import *
 from . import log
+from . import index
+from . import ignore
+from . import output
+from . import stats
+from . import prefetch
+from . import review
+from . import journal
+from . import watch
 
 if __name__ == "__main__":
     logger = log.gen(mode="dev")
@@ -43,6 +71,25 @@ NO_BINARY_INDICATORS_STRINGS = ["--binary_exclusion", "--no_binary"]
 BINARY_INDICATORS_STRINGS = ["--binary_accepted", "--no_binary_exclusion", "--binary"]
 NO_SYMLINK_INDICATORS_STRINGS = ["--symlink_exclusion", "--no_symlink"]
 SYMLINK_INDICATORS_STRINGS = ["--symlink_accepted", "--no_symlink_exclusion", "--symlink"]
+JOBS_INDICATORS_STRINGS = ["--jobs", "--jobs_nb"]
+MAPPING_FILE_INDICATORS_STRINGS = ["--mapping_file", "--batch_file"]
+INDEX_INDICATORS_STRINGS = ["--index", "--use_index"]
+REBUILD_INDEX_INDICATORS_STRINGS = ["--rebuild_index", "--rebuild-index"]
+RESPECT_GITIGNORE_INDICATORS_STRINGS = ["--respect_gitignore", "--respect-gitignore"]
+REGEX_INDICATORS_STRINGS = ["--regex", "--regexp"]
+DURABILITY_INDICATORS_STRINGS = ["--durability"]
+DRY_RUN_INDICATORS_STRINGS = ["--dry_run", "--dry-run", "--count"]
+JSON_INDICATORS_STRINGS = ["--json"]
+QUIET_INDICATORS_STRINGS = ["--quiet"]
+VERBOSE_INDICATORS_STRINGS = ["--verbose"]
+STATS_INDICATORS_STRINGS = ["--stats"]
+PROFILE_INDICATORS_STRINGS = ["--profile"]
+PIPELINE_INDICATORS_STRINGS = ["--pipeline", "--prefetch"]
+REVIEW_INDICATORS_STRINGS = ["--review"]
+REVIEW_PATCH_INDICATORS_STRINGS = ["--review_patch", "--review-patch"]
+JOURNAL_INDICATORS_STRINGS = ["--journal", "--undo_journal"]
+UNDO_INDICATORS_STRINGS = ["--undo"]
+WATCH_INDICATORS_STRINGS = ["--watch"]
 END_INDICATORS_STRINGS = ["end_last_param", "--end_param", "--end"]
 
 # black list extensions
@@ -57,10 +104,123 @@ PROGRAMMING_EXTENSIONS = ["class", "CLASS"]
 BLACK_LIST_EXTENSIONS_LIST = AUDIO_EXTENSIONS + IMAGE_EXTENSIONS + VIDEO_EXTENSIONS + PROGRAMMING_EXTENSIONS
 
 # supported short indicators
-SUPPORTED_SHORT_INDICATORS = ['l', 'r', 's', 'a', 'c']
+SUPPORTED_SHORT_INDICATORS = ['l', 'r', 's', 'a', 'c', 'q', 'v']
+
+# files from this size are memory mapped instead of read: the search is done on the bytes of the mapping and only the
+# files owning an occurrence are decoded
+MMAP_MIN_FILE_SIZE = 1024 * 1024
+
+# without asking confirmation, files from this size are rewritten chunk by chunk instead of line by line: the memory
+# used stays the same whatever the length of their lines
+STREAMING_MIN_FILE_SIZE = 16 * 1024 * 1024
+STREAMING_CHUNK_SIZE = 1024 * 1024
+
+# number of files sent at once to a worker process when --jobs is used
+JOBS_CHUNK_SIZE = 16
+# chunks submitted ahead by job: the walk only runs this far ahead of the results
+JOBS_WINDOW_CHUNKS_NB = 4
 
-found_nb = 0
-replaced_nb = 0
+# with --pipeline, files walked ahead of the processing and threads reading them. The files above MMAP_MIN_FILE_SIZE
+# are memory mapped, not read, so the window holds at most PIPELINE_DEPTH * MMAP_MIN_FILE_SIZE bytes
+PIPELINE_DEPTH = 32
+PIPELINE_READERS_NB = 4
+
+# what is on the disk when a replaced file is committed: nothing more than the atomic rename, the file and its
+# directory, or the files and their directories, synced together at the end of the run
+NO_DURABILITY = "none"
+FILE_DURABILITY = "file"
+BATCH_DURABILITY = "batch"
+DURABILITIES = [NO_DURABILITY, FILE_DURABILITY, BATCH_DURABILITY]
+
+# with --json, the records are written to stdout by blocks of this number of lines
+JSON_FLUSH_RECORDS_NB = 1000
+# the match records of a file rewritten chunk by chunk are held until it is committed, on disk above this size
+JSON_SPOOL_MAX_SIZE = 1024 * 1024
+
+# -q only shows the errors, -v shows each skipped file instead of their counts by reason at the end
+QUIET_VERBOSITY = 0
+NORMAL_VERBOSITY = 1
+VERBOSE_VERBOSITY = 2
+
+
+class _RunState:
+    """the counters, output mode and resources of a run
+
+    The helpers use the state of the current thread through the module attribute state. A Replacer installs its own
+    state in the thread of each of its runs and gives the previous one back after, see _running_state: the runs of
+    several Replacers, in the same thread or not, or of a Replacer and of the command line, don't mix their counters
+    nor their output modes.
+    """
+
+    def __init__(self):
+        self.found_nb = 0
+        self.replaced_nb = 0
+        self.found_nb_by_init_str = {}
+        self.replaced_nb_by_init_str = {}
+        # files committed with the batch durability, not synced yet
+        self.committed_file_paths = []
+        # with --json, nothing but the json records is written to stdout
+        self.json_output = False
+        self.json_records = []
+        self.verbosity = NORMAL_VERBOSITY
+        # the lowest level of the logger records shown, see _OutputModeFilter
+        self.log_level = logging.DEBUG
+        self.skipped_nb_by_reason = {}
+        # with --stats, the counters and phase timers of the run
+        self.run_stats = None
+        # in the asking mode, the thread committing the replaced files while the next occurrences are asked
+        self.committer = None
+        self.commit_futures = []
+        # with --review, the scan writes the patches of the files owning occurrences to review_patch_file. The workers
+        # of --jobs keep them in review_patches for the main process
+        self.reviewing = False
+        self.review_patch_file = None
+        self.review_patches = []
+        # with --journal, the undo journal the replaced files are recorded in before being committed
+        self.undo_journal = None
+        # with --watch, the file_signature of each file replaced by the run: the watch doesn't process its own commits
+        # again
+        self.replaced_file_signatures = None
+
+
+# the state of the command line, of the worker processes and of the threads not running a Replacer
+_default_state = _RunState()
+_thread_states = threading.local()
+
+
+def _current_state():
+    return getattr(_thread_states, "run_state", _default_state)
+
+
+def _set_current_state(run_state):
+    # also the initializer of the threads working for a run, like the committer thread
+    _thread_states.run_state = run_state
+
+
+class _CurrentState:
+    """the attributes of the _RunState of the current thread"""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(_current_state(), name)
+
+    def __setattr__(self, name, value):
+        setattr(_current_state(), name, value)
+
+
+state = _CurrentState()
+
+
+class _OutputModeFilter(logging.Filter):
+    """the records below the log_level of the current state are dropped: the logger level, shared by the threads, is
+    left as it is"""
+
+    def filter(self, record):
+        return record.levelno >= state.log_level
+
+
+logger.addFilter(_OutputModeFilter())
 
 
 def _help_requested(arguments):
@@ -83,6 +243,24 @@ def _help_requested(arguments):
         exit()
 
 
+def _undo_requested(arguments):
+    # rp --undo JOURNAL_PATH restores the files recorded in the journal
+    if len(arguments) == 2 and arguments[0] in UNDO_INDICATORS_STRINGS:
+        try:
+            result = undo(arguments[1], verbosity=NORMAL_VERBOSITY)
+        except ReplaceError as e:
+            logger.error("%s" % e)
+            exit(1)
+        logger.info(CFILE_PATHS + "%s" % len(result.restored_file_paths) + BASE_C + " file%s restored" %
+                    ("s" if len(result.restored_file_paths) > 1 else "") + " in %.3f s" % result.duration)
+        if result.changed_file_paths:
+            logger.warning(CFILE_PATHS + "%s" % len(result.changed_file_paths) + BASE_C +
+                           " file%s changed since the replacement, not restored" %
+                           ("s" if len(result.changed_file_paths) > 1 else ""))
+            exit(1)
+        exit()
+
+
 def _check_input_args(args):
     if len(args) < 2:
         logger.error("not enough arguments, needs at least the initial string and the destination string\n\tneeds the "
@@ -104,8 +282,26 @@ def _init_indicators():
     excluded_strings = []
     excluded_extensions = []
     excluded_paths = []
+    jobs_nb = 1  # default
+    use_index = False  # default
+    rebuild_index = False  # default
+    respect_gitignore = False  # default
+    regex = False  # default
+    durability = NO_DURABILITY  # default
+    dry_run = False  # default
+    json_requested = False  # default
+    verbosity_level = NORMAL_VERBOSITY  # default
+    stats_requested = False  # default
+    profile_path = None  # default
+    pipeline = False  # default
+    review_requested = False  # default
+    review_patch_path = None  # default
+    journal_path = None  # default
+    watch_requested = False  # default
     return file_name_must_end_by, local, recursive, specific, ask_replace, case_sensitive, black_list_extensions, + \
-        binary_accepted, symlink_accepted, excluded_strings, excluded_extensions, excluded_paths
+        binary_accepted, symlink_accepted, excluded_strings, excluded_extensions, excluded_paths, jobs_nb, \
+        use_index, rebuild_index, respect_gitignore, regex, durability, dry_run, json_requested, verbosity_level, \
+        stats_requested, profile_path, pipeline, review_requested, review_patch_path, journal_path, watch_requested
 
 
 def _init_args():
@@ -113,15 +309,18 @@ def _init_args():
     dest_str = None
     dir_path_to_apply = None
     file_paths_to_apply = []
-    return init_str, dest_str, dir_path_to_apply, file_paths_to_apply
+    mapping_file_path = None
+    return init_str, dest_str, dir_path_to_apply, file_paths_to_apply, mapping_file_path
 
 
 def _treat_input_args(input_args):
     file_name_must_end_by, local, recursive, specific, ask_replace, case_sensitive, \
     black_list_extensions, binary_accepted, symlink_accepted, excluded_strings, \
-    excluded_extensions, excluded_paths = _init_indicators()
+    excluded_extensions, excluded_paths, jobs_nb, use_index, rebuild_index, respect_gitignore, \
+    regex, durability, dry_run, json_requested, verbosity_level, stats_requested, profile_path, \
+        pipeline, review_requested, review_patch_path, journal_path, watch_requested = _init_indicators()
 
-    init_str, dest_str, dir_path_to_apply, file_paths_to_apply = _init_args()
+    init_str, dest_str, dir_path_to_apply, file_paths_to_apply, mapping_file_path = _init_args()
 
     nb_args = len(input_args)
     not_compatible_shorts_indicators = []
@@ -136,7 +335,14 @@ def _treat_input_args(input_args):
                     BLACK_LIST_EXTENSIONS_INDICATORS_STRINGS + ADD_EXCLUDED_EXTENSIONS_INDICATORS_STRINGS + \
                     EXCLUDED_PATHS_INDICATORS_STRINGS + ADD_EXCLUDED_STRINGS_INDICATORS_STRINGS + \
                     BINARY_INDICATORS_STRINGS + NO_BINARY_INDICATORS_STRINGS + \
-                    SYMLINK_INDICATORS_STRINGS + NO_SYMLINK_INDICATORS_STRINGS + END_INDICATORS_STRINGS:
+                    SYMLINK_INDICATORS_STRINGS + NO_SYMLINK_INDICATORS_STRINGS + JOBS_INDICATORS_STRINGS + \
+                    MAPPING_FILE_INDICATORS_STRINGS + INDEX_INDICATORS_STRINGS + \
+                    REBUILD_INDEX_INDICATORS_STRINGS + RESPECT_GITIGNORE_INDICATORS_STRINGS + \
+                    REGEX_INDICATORS_STRINGS + DURABILITY_INDICATORS_STRINGS + DRY_RUN_INDICATORS_STRINGS + \
+                    JSON_INDICATORS_STRINGS + QUIET_INDICATORS_STRINGS + VERBOSE_INDICATORS_STRINGS + \
+                    STATS_INDICATORS_STRINGS + PROFILE_INDICATORS_STRINGS + PIPELINE_INDICATORS_STRINGS + \
+                    REVIEW_INDICATORS_STRINGS + REVIEW_PATCH_INDICATORS_STRINGS + JOURNAL_INDICATORS_STRINGS + \
+                    WATCH_INDICATORS_STRINGS + END_INDICATORS_STRINGS:
 
                 if arg in ASK_CONFIRMATION_INDICATORS_STRINGS:
                     ask_replace = True
@@ -158,6 +364,31 @@ def _treat_input_args(input_args):
                     symlink_accepted = True
                 elif arg in NO_SYMLINK_INDICATORS_STRINGS:
                     symlink_accepted = False
+                elif arg in INDEX_INDICATORS_STRINGS:
+                    use_index = True
+                elif arg in REBUILD_INDEX_INDICATORS_STRINGS:
+                    use_index = True
+                    rebuild_index = True
+                elif arg in RESPECT_GITIGNORE_INDICATORS_STRINGS:
+                    respect_gitignore = True
+                elif arg in REGEX_INDICATORS_STRINGS:
+                    regex = True
+                elif arg in DRY_RUN_INDICATORS_STRINGS:
+                    dry_run = True
+                elif arg in JSON_INDICATORS_STRINGS:
+                    json_requested = True
+                elif arg in QUIET_INDICATORS_STRINGS:
+                    verbosity_level = QUIET_VERBOSITY
+                elif arg in VERBOSE_INDICATORS_STRINGS:
+                    verbosity_level = VERBOSE_VERBOSITY
+                elif arg in STATS_INDICATORS_STRINGS:
+                    stats_requested = True
+                elif arg in PIPELINE_INDICATORS_STRINGS:
+                    pipeline = True
+                elif arg in WATCH_INDICATORS_STRINGS:
+                    watch_requested = True
+                elif arg in REVIEW_INDICATORS_STRINGS:
+                    review_requested = True
                 elif arg in END_INDICATORS_STRINGS:
                     pass
 
@@ -213,6 +444,25 @@ def _treat_input_args(input_args):
                     elif arg in DIRECTORY_PATH_TO_APPLY_INDICATORS_STRINGS:
                         dir_path_to_apply = input_args[arg_index + 1]
                         args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in JOBS_INDICATORS_STRINGS:
+                        jobs_nb = _get_jobs_nb(input_args[arg_index + 1])
+                        args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in MAPPING_FILE_INDICATORS_STRINGS:
+                        mapping_file_path = input_args[arg_index + 1]
+                        args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in DURABILITY_INDICATORS_STRINGS:
+                        durability = _get_durability(input_args[arg_index + 1])
+                        args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in PROFILE_INDICATORS_STRINGS:
+                        profile_path = input_args[arg_index + 1]
+                        args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in REVIEW_PATCH_INDICATORS_STRINGS:
+                        review_requested = True
+                        review_patch_path = input_args[arg_index + 1]
+                        args_not_used_indexes.remove(arg_index + 1)
+                    elif arg in JOURNAL_INDICATORS_STRINGS:
+                        journal_path = input_args[arg_index + 1]
+                        args_not_used_indexes.remove(arg_index + 1)
                     elif arg in LIST_FILES_PATHS_TO_APPLY_INDICATORS_STRINGS:
                         for potential_file_path_to_replace_index, potential_file_path_to_replace in enumerate(
                                 input_args[arg_index + 1:]):
@@ -260,11 +510,38 @@ def _treat_input_args(input_args):
                     ask_replace = True
                 elif short_indicator == 'c':
                     case_sensitive = True
+                elif short_indicator == 'q':
+                    verbosity_level = QUIET_VERBOSITY
+                elif short_indicator == 'v':
+                    verbosity_level = VERBOSE_VERBOSITY
 
             args_not_used_indexes.remove(arg_index)
     return file_name_must_end_by, init_str, dest_str, dir_path_to_apply, file_paths_to_apply, local, recursive, \
            specific, ask_replace, case_sensitive, black_list_extensions, binary_accepted, symlink_accepted, \
-           excluded_strings, excluded_extensions, excluded_paths, args_not_used_indexes
+           excluded_strings, excluded_extensions, excluded_paths, jobs_nb, mapping_file_path, use_index, \
+           rebuild_index, respect_gitignore, regex, durability, dry_run, json_requested, verbosity_level, \
+           stats_requested, profile_path, pipeline, review_requested, review_patch_path, journal_path, \
+           watch_requested, args_not_used_indexes
+
+
+def _get_jobs_nb(jobs_arg):
+    try:
+        jobs_nb = int(jobs_arg)
+    except ValueError:
+        jobs_nb = 0
+    if jobs_nb < 1:
+        logger.error("the number of jobs must be a positive integer and is: %s" % jobs_arg +
+                     "\n\ta correct command would be: " + WHITE + "replace -r --jobs 4 titi toto ." + BASE_C)
+        exit(1)
+    return jobs_nb
+
+
+def _get_durability(durability_arg):
+    if durability_arg not in DURABILITIES:
+        logger.error("the durability must be one of %s and is: %s" % (DURABILITIES, durability_arg) +
+                     "\n\ta correct command would be: " + WHITE + "replace -r --durability file titi toto ." + BASE_C)
+        exit(1)
+    return durability_arg
 
 
 def _check_only_one_replace_mode_picked(local, specific, recursive):
@@ -280,7 +557,7 @@ def _check_only_one_replace_mode_picked(local, specific, recursive):
 
 
 def _get_final_args_local_recursive(dir_path_to_apply, dest_str, init_str, local, recursive, input_args,
-                                    args_not_used_indexes):
+                                    args_not_used_indexes, mapping_file_path=None):
     if dir_path_to_apply is None:
         if not args_not_used_indexes:
             logger.error("arguments are missing ... please review the command syntax.")
@@ -288,6 +565,12 @@ def _get_final_args_local_recursive(dir_path_to_apply, dest_str, init_str, local
 
         dir_path_to_apply = input_args[args_not_used_indexes[-1]]
         args_not_used_indexes.pop()
+    if mapping_file_path is not None:
+        _check_no_str_with_mapping_file(init_str, dest_str)
+        if args_not_used_indexes:
+            logger.error("too much args entered ... please review the command syntax.")
+            _args_local_recursive_error(local, recursive)
+        return dir_path_to_apply, dest_str, init_str
     if dest_str is None:
         if not args_not_used_indexes:
             logger.error("arguments are missing ... please review the command syntax.")
@@ -328,8 +611,11 @@ def _args_local_recursive_error(local, recursive):
         exit(1)
 
 
-def _get_final_args_specific(file_paths_to_apply, dest_str, init_str, specific, input_args, args_not_used_indexes):
-    if init_str is None:
+def _get_final_args_specific(file_paths_to_apply, dest_str, init_str, specific, input_args, args_not_used_indexes,
+                             mapping_file_path=None):
+    if mapping_file_path is not None:
+        _check_no_str_with_mapping_file(init_str, dest_str)
+    elif init_str is None:
         if not args_not_used_indexes:
             logger.error("arguments are missing ... please review the command syntax.")
             _args_specific_error(specific)
@@ -337,7 +623,7 @@ def _get_final_args_specific(file_paths_to_apply, dest_str, init_str, specific,
         init_str = input_args[args_not_used_indexes[0]]
         args_not_used_indexes.pop(0)
 
-    if dest_str is None:
+    if dest_str is None and mapping_file_path is None:
         if not args_not_used_indexes:
             logger.error("arguments are missing ... please review the command syntax.")
             _args_specific_error(specific)
@@ -360,6 +646,20 @@ def _get_final_args_specific(file_paths_to_apply, dest_str, init_str, specific,
     return file_paths_to_apply, dest_str, init_str
 
 
+def _check_no_str_with_mapping_file(init_str, dest_str):
+    if init_str is not None or dest_str is not None:
+        logger.error("the initial and destination strings are given by the mapping file" +
+                     "\n\tplease remove the initial and destination strings from the command")
+        exit(1)
+
+
+def _check_no_regex_with_mapping_file(regex):
+    if regex:
+        logger.error("the initial strings of a mapping file are literals, they can't be used with the regex mode"
+                     "\n\tplease remove the --regex option from the command")
+        exit(1)
+
+
 def _args_specific_error(specific):
     if specific:
         logger.error("for a \"specific replace\" please precise the \"initial string\", "
@@ -370,43 +670,66 @@ def _args_specific_error(specific):
         exit(1)
 
 
-def _check_init_str_in_file(file_path, init_str, case_sensitive):
-    try:
-        if case_sensitive:
-            for line in open(file_path, 'r', encoding=ENCODING_INPUT_FILES):
-                if init_str in line:
-                    return True
-            return False
-        elif not case_sensitive:
-            for line in open(file_path, 'r', encoding=ENCODING_INPUT_FILES):
-                if _case_less_str1_in_str2(init_str, line):
-                    return True
-            return False
+def _check_init_str_in_text(text, init_str, case_sensitive):
+    if case_sensitive:
+        return init_str in text
+    return _case_less_needle_in_text(_normalize_case_less_needle(init_str), text)
 
-    except PermissionError:
-        logger.warning("\tyou don't have the permission to access the file " + CFILE_PATHS + "%s" % file_path + BASE_C)
-        _skipped()
-        return False
+
+def _decode_file_content(file_path, file_content):
+    try:
+        # str() decodes a memory mapped file as well without copying it into a bytes object first
+        return str(file_content, ENCODING_INPUT_FILES)
     except UnicodeDecodeError:
-        logger.warning("\tthe file " + CFILE_PATHS + "%s" % file_path + BASE_C + " owns non unicode characters")
-        _skipped()
-        return False
-    except:
-        logger.error("the file %s seems to cause problem to be opened" % file_path)
-        exit(1)
+        _skip_file(NON_UNICODE_FILE, SKIP_MESSAGES[NON_UNICODE_FILE], file_path)
+        return None
 
 
 def _get_str_positions_in_lines(string, line, case_sensitive):
-    start_string_indexes = []
+    return [start for start, end in _get_str_spans_in_line(string, line, case_sensitive)]
+
+
+def _get_str_spans_in_line(string, line, case_sensitive, normalized_string=None):
+    # (start, end) indexes of the non overlapping occurrences of string in line, one str.find per occurrence. For a
+    # case less search, normalized_string is string already normalized by _normalize_case_less_needle
+    if not string:
+        return []
     if case_sensitive:
-        for index in range(len(line)):
-            if line[index:].startswith(string):
-                start_string_indexes.append(index)
-    if not case_sensitive:
-        for index in range(len(line)):
-            if _normalize_case_less(line)[index:].startswith(_normalize_case_less(string)):
-                start_string_indexes.append(index)
-    return start_string_indexes
+        spans = []
+        index = line.find(string)
+        while index != -1:
+            spans.append((index, index + len(string)))
+            index = line.find(string, index + len(string))
+        return spans
+    if normalized_string is None:
+        normalized_string = _normalize_case_less_needle(string)
+    return _get_case_less_str_spans_in_line(normalized_string, line)
+
+
+def _get_case_less_str_spans_in_line(normalized_string, line):
+    # an ascii char is normalized to its lower case: the indexes of the lowered line are the indexes of the line
+    if line.isascii():
+        return _get_str_spans_in_line(normalized_string, line.lower(), True)
+
+    # the search is done in the normalized line, built char by char so that each normalized index can be mapped back
+    # to the line char it comes from. An occurrence must start and end on line chars boundaries: "e" doesn't match
+    # the "e" of the normalized "é"
+    normalized_chars = [_normalize_case_less_char(char) for char in line]
+    normalized_line = "".join(normalized_chars)
+    normalized_starts = [0] + list(itertools.accumulate(map(len, normalized_chars)))
+
+    spans = []
+    index = normalized_line.find(normalized_string)
+    while index != -1:
+        end_index = index + len(normalized_string)
+        start = bisect.bisect_left(normalized_starts, index)
+        end = bisect.bisect_left(normalized_starts, end_index)
+        if normalized_starts[start] == index and normalized_starts[end] == end_index:
+            spans.append((start, end))
+            index = normalized_line.find(normalized_string, end_index)
+        else:
+            index = normalized_line.find(normalized_string, index + 1)
+    return spans
 
 
 # def ok(msg=""):
@@ -426,15 +749,34 @@ def _get_str_positions_in_lines(string, line, case_sensitive):
 
 
 def _skipped():
+    if state.json_output:
+        return
     print(BLUE + "\n\t\t\tskipped\n\n" + BASE_C)
 
 
-def _check_user_rights(file_path):
-    current_user = getpass.getuser()
-    owner_file = getpwuid(stat(file_path).st_uid).pw_name
-    if owner_file != current_user:
-        logger.warning("the file " + CFILE_PATHS + "%s" % file_path + BASE_C + " is owned by " + CFILE_PATHS +
-                       "%s" % owner_file + BASE_C + ", might be necessary to manage its permissions")
+@functools.lru_cache(maxsize=None)
+def _get_current_user():
+    return getpass.getuser()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_owner_name(uid):
+    try:
+        return getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def _check_user_rights(file_path, file_stat=None):
+    # the users names are looked up once, the files owned by another user are counted and only listed with -v
+    if file_stat is None:
+        file_stat = stat(file_path)
+    owner_file = _get_owner_name(file_stat.st_uid)
+    if owner_file != _get_current_user():
+        state.skipped_nb_by_reason[OWNED_BY_OTHER_USER] = state.skipped_nb_by_reason.get(OWNED_BY_OTHER_USER, 0) + 1
+        if state.verbosity >= VERBOSE_VERBOSITY:
+            logger.warning("the file %s is owned by %s, might be necessary to manage its permissions",
+                           file_path, owner_file)
 
 
 def _print_prev_lines(previous_lines, line_nb):
@@ -445,36 +787,55 @@ def _print_prev_lines(previous_lines, line_nb):
         print(YELLOW + "\t    %s: " % (line_nb - 1) + CTEXT_FILES + "%s" % previous_lines[0] + BASE_C, end='')
 
 
-def _display_line_highlighting_init_strs(line, line_nb, start_string_positions, init_str, previous_lines):
-    if len(start_string_positions) > 1:
+def _display_line_highlighting_init_strs(line, line_nb, occurrences, init_str_label, previous_lines):
+    if len(occurrences) > 1:
         logger.info(
-            "\n\tthere are several occurrences of " + COCCURRENCES + "\"%s\"" % init_str + BASE_C + " in this line:\n")
+            "\n\tthere are several occurrences of " + COCCURRENCES + "%s" % init_str_label + BASE_C + " in this line:\n")
 
     _print_prev_lines(previous_lines, line_nb)
 
-    print(COCCURRENCES + "\t    %s: " % line_nb + CTEXT_FILES + "%s" % line[0:start_string_positions[0]], end='')
-    for string_list_index, string_index in enumerate(start_string_positions):
-        print(COCCURRENCES + "%s" % init_str + BASE_C, end='')
-        if string_list_index == len(start_string_positions) - 1:
-            print(CTEXT_FILES + "%s" % line[string_index + len(init_str):] + BASE_C, end='')
+    print(COCCURRENCES + "\t    %s: " % line_nb + CTEXT_FILES + "%s" % line[0:occurrences[0].start], end='')
+    for occurrence_index, occurrence in enumerate(occurrences):
+        print(COCCURRENCES + "%s" % line[occurrence.start:occurrence.end] + BASE_C, end='')
+        if occurrence_index == len(occurrences) - 1:
+            print(CTEXT_FILES + "%s" % line[occurrence.end:] + BASE_C, end='')
         else:
-            print(CTEXT_FILES + "%s" % line[string_index + len(init_str):start_string_positions[
-                string_list_index + 1]] + BASE_C, end='')
-    return start_string_positions
+            print(CTEXT_FILES + "%s" % line[occurrence.end:occurrences[occurrence_index + 1].start] + BASE_C, end='')
+    return occurrences
 
 
-def _display_line_highlighting_defined_init_str(new_line, line, init_str,
-                                                defined_init_str_start_position):
+def _display_line_highlighting_defined_init_str(new_line, line, occurrence):
     print(CTEXT_FILES + "\t\t%s" % new_line, end='')
-    print(COCCURRENCES + "%s" % init_str + BASE_C, end='')
-    print(CTEXT_FILES + "%s" %
-          line[defined_init_str_start_position + len(init_str):] + BASE_C, end='')
+    print(COCCURRENCES + "%s" % line[occurrence.start:occurrence.end] + BASE_C, end='')
+    print(CTEXT_FILES + "%s" % line[occurrence.end:] + BASE_C, end='')
 
 
 def _normalize_case_less(string):
     return unicodedata.normalize("NFKD", string.casefold())
 
 
+_normalized_case_less_chars = {}
+
+
+def _normalize_case_less_char(char):
+    normalized_char = _normalized_case_less_chars.get(char)
+    if normalized_char is None:
+        normalized_char = _normalized_case_less_chars[char] = _normalize_case_less(char)
+    return normalized_char
+
+
+def _normalize_case_less_needle(string):
+    # normalized char by char, like the lines it is searched in
+    return "".join(_normalize_case_less_char(char) for char in string)
+
+
+def _case_less_needle_in_text(normalized_string, text):
+    # casefold and NFKD turn an ascii text into its lower case, no need to normalize it
+    if text.isascii():
+        return normalized_string in text.lower()
+    return normalized_string in _normalize_case_less(text)
+
+
 def _case_less_equal(str1, str2):
     return _normalize_case_less(str1) == _normalize_case_less(str2)
 
@@ -486,8 +847,217 @@ def _case_less_str1_in_str2(str1, str2):
         return False
 
 
-class Abort(Exception):
-    pass
+# an occurrence of init_str found in a line, from the start index to the end index of the line
+Occurrence = collections.namedtuple("Occurrence", ["start", "end", "init_str", "dest_str"])
+
+
+class StringMatcher:
+    """searches and replaces one initial string"""
+
+    def __init__(self, init_str, dest_str, case_sensitive):
+        self.init_str = init_str
+        self.dest_str = dest_str
+        self.case_sensitive = case_sensitive
+        self.pairs = [(init_str, dest_str)]
+        self.init_str_label = "\"%s\"" % init_str
+        self.dest_str_label = "\"%s\"" % dest_str
+        self._encoded_init_str = init_str.encode(ENCODING_INPUT_FILES)
+        self.encoded_init_strs = [self._encoded_init_str]
+        self.max_init_str_length = len(init_str)
+        # occurrences of a case less search or spreading over several lines can't be found chunk by chunk
+        self.streamable = case_sensitive and "\n" not in init_str
+        # the case less search looks for the normalized init_str, normalized once for all the files
+        self._case_less_init_str = None if case_sensitive else _normalize_case_less_needle(init_str)
+        self._encoded_case_less_init_str = None if case_sensitive else \
+            self._case_less_init_str.encode(ENCODING_INPUT_FILES)
+
+    def may_be_in_bytes(self, file_content):
+        # utf-8 is self synchronizing: the encoded init_str is in the bytes if and only if init_str is in the text.
+        # The case less search depends on the normalization of the text, it can only be decided on ascii bytes, whose
+        # normalization is their lower case
+        if not self.case_sensitive:
+            if isinstance(file_content, bytes) and file_content.isascii():
+                return self._encoded_case_less_init_str in file_content.lower()
+            return True
+        return file_content.find(self._encoded_init_str) != -1
+
+    def count_in_bytes(self, file_content):
+        # the occurrences of a streamable init_str are the ones of the encoded init_str in the bytes, None otherwise
+        if not self.streamable or not self.init_str:
+            return None
+        count = 0
+        index = file_content.find(self._encoded_init_str)
+        while index != -1:
+            count += 1
+            index = file_content.find(self._encoded_init_str, index + len(self._encoded_init_str))
+        return count
+
+    def in_text(self, text):
+        if self.case_sensitive:
+            return self.init_str in text
+        return _case_less_needle_in_text(self._case_less_init_str, text)
+
+    def find_occurrences(self, line):
+        # the case less spans are built from the normalized line, not worth it when the line doesn't own init_str
+        if not self.case_sensitive and not self.in_text(line):
+            return []
+        return [Occurrence(start, end, self.init_str, self.dest_str)
+                for start, end in _get_str_spans_in_line(self.init_str, line, self.case_sensitive,
+                                                         self._case_less_init_str)]
+
+    def replace_all(self, line):
+        # init_str and dest_str are literals: no regex, no backslash escapes
+        if self.case_sensitive:
+            return line.replace(self.init_str, self.dest_str)
+        return _substitute_occurrences(line, self.find_occurrences(line))
+
+
+class RegexMatcher:
+    """searches and replaces the matches of a regular expression
+
+    The pattern is compiled once. The destination string may refer to the groups of the pattern (\\1, \\g<name>), it is
+    expanded for each match. A match can't spread over several lines.
+    """
+
+    def __init__(self, pattern, dest_str, case_sensitive):
+        self.pattern = pattern
+        self.dest_str = dest_str
+        self.case_sensitive = case_sensitive
+        self.pairs = [(pattern, dest_str)]
+        self.init_str_label = "the pattern \"%s\"" % pattern
+        self.dest_str_label = "\"%s\"" % dest_str
+        self._regex = re.compile(pattern, 0 if case_sensitive else re.I)
+        # nothing literal to look for in the bytes or in the index
+        self.encoded_init_strs = []
+        self.max_init_str_length = None
+        self.streamable = False
+
+    def may_be_in_bytes(self, file_content):
+        return True
+
+    def count_in_bytes(self, file_content):
+        return None
+
+    def in_text(self, text):
+        # searched line by line like find_occurrences, with the same newlines translation as the replacement: ^, $
+        # and the patterns able to match a newline give the same answer as on the lines
+        return any(self._regex.search(line) is not None for line in io.StringIO(text, newline=None))
+
+    def find_occurrences(self, line):
+        return [Occurrence(match.start(), match.end(), self.pattern, match.expand(self.dest_str))
+                for match in self._regex.finditer(line)]
+
+    def replace_all(self, line):
+        return self._regex.sub(self.dest_str, line)
+
+
+class MultiStringMatcher:
+    """searches and replaces all the initial strings of a mapping file in one pass
+
+    The initial strings are compiled in one alternation regex, longest first. At a given position the regex takes the
+    first alternative that matches, so the occurrences are leftmost-longest: the leftmost occurrence wins and, among
+    the initial strings starting there, the longest one. Occurrences never overlap, the scan restarts after each one.
+    """
+
+    def __init__(self, pairs, case_sensitive):
+        self.case_sensitive = case_sensitive
+        self.pairs = pairs
+        self.init_str_label = "the %s initial strings of the mapping file" % len(pairs)
+        self.dest_str_label = "their destination strings"
+        # the regex group of an alternative gives back its pair
+        self._sorted_pairs = sorted(pairs, key=lambda pair: len(pair[0]), reverse=True)
+        self._regex = re.compile("|".join("(%s)" % re.escape(init_str) for init_str, _ in self._sorted_pairs),
+                                 0 if case_sensitive else re.I)
+        self.max_init_str_length = len(self._sorted_pairs[0][0])
+        self.streamable = case_sensitive and not any("\n" in init_str for init_str, _ in pairs)
+        self.encoded_init_strs = [init_str.encode(ENCODING_INPUT_FILES) for init_str, _ in self._sorted_pairs]
+        self._bytes_regex = re.compile(b"|".join(re.escape(encoded_init_str)
+                                                 for encoded_init_str in self.encoded_init_strs))
+
+    def may_be_in_bytes(self, file_content):
+        # re.I only folds the ascii letters of bytes, the case less search has to be done on the text
+        if not self.case_sensitive:
+            return True
+        return self._bytes_regex.search(file_content) is not None
+
+    def count_in_bytes(self, file_content):
+        # the counts by initial string need the occurrences of the text
+        return None
+
+    def in_text(self, text):
+        return self._regex.search(text) is not None
+
+    def find_occurrences(self, line):
+        return [Occurrence(match.start(), match.end(), *self._sorted_pairs[match.lastindex - 1])
+                for match in self._regex.finditer(line)]
+
+    def replace_all(self, line):
+        return self._regex.sub(lambda match: self._sorted_pairs[match.lastindex - 1][1], line)
+
+
+def _read_mapping_file(mapping_file_path):
+    # one "initial string<TAB>destination string" pair per line, empty lines and lines starting by # are ignored
+    pairs = []
+    init_strs = set()
+    try:
+        mapping_file = open(mapping_file_path, encoding=ENCODING_INPUT_FILES)
+    except (OSError, UnicodeDecodeError) as e:
+        logger.error("the mapping file " + CFILE_PATHS + "%s" % mapping_file_path + BASE_C + " can not be read\n\t%s" % e)
+        exit(1)
+
+    with mapping_file:
+        for line_index, line in enumerate(mapping_file):
+            line = line.rstrip("\r\n")
+            if not line or line.startswith("#"):
+                continue
+            init_str, separator, dest_str = line.partition("\t")
+            if not separator or not init_str:
+                logger.error("the line %s of the mapping file %s is not valid: %s" % (line_index + 1, mapping_file_path,
+                                                                                    line) +
+                             "\n\teach line must be the initial string and the destination string separated by a tab")
+                exit(1)
+            if init_str in init_strs:
+                logger.error("the initial string \"%s\" is defined several times in the mapping file %s"
+                             % (init_str, mapping_file_path) + "\n\tplease keep only one destination string for it")
+                exit(1)
+            init_strs.add(init_str)
+            pairs.append((init_str, dest_str))
+
+    if not pairs:
+        logger.error("the mapping file %s doesn't own any pair of initial and destination strings" % mapping_file_path)
+        exit(1)
+    return pairs
+
+
+def _add_found_occurrences(occurrences):
+    state.found_nb += len(occurrences)
+    for occurrence in occurrences:
+        state.found_nb_by_init_str[occurrence.init_str] = state.found_nb_by_init_str.get(occurrence.init_str, 0) + 1
+
+
+def _add_found_nb(init_str, file_found_nb):
+    state.found_nb += file_found_nb
+    state.found_nb_by_init_str[init_str] = state.found_nb_by_init_str.get(init_str, 0) + file_found_nb
+
+
+def _add_replaced_nb(init_str, file_replaced_nb):
+    state.replaced_nb += file_replaced_nb
+    state.replaced_nb_by_init_str[init_str] = state.replaced_nb_by_init_str.get(init_str, 0) + file_replaced_nb
+
+
+def _add_replaced_occurrences(occurrences):
+    state.replaced_nb += len(occurrences)
+    for occurrence in occurrences:
+        state.replaced_nb_by_init_str[occurrence.init_str] = \
+            state.replaced_nb_by_init_str.get(occurrence.init_str, 0) + 1
+
+
+class ReplaceError(Exception):
+    """error of a Replacer, the command line logs it and exits"""
+
+
+class Abort(ReplaceError):
+    """the replacement was aborted while asking confirmation"""
 
 
 def _abort_process(temporary_file, temporary_file_path):
@@ -497,75 +1067,64 @@ def _abort_process(temporary_file, temporary_file_path):
     raise Abort
 
 
-def _complete_new_line(new_line, line, start_string_index, nb_occurrences_in_line, start_string_position,
-                       start_string_positions, len_init_str):
-    if start_string_index == nb_occurrences_in_line - 1:
-        new_line += line[start_string_position + len_init_str:]
-    else:
-        new_line += line[start_string_position + len_init_str:start_string_positions[start_string_index + 1]]
-    return new_line
+def _substitute_occurrences(line, occurrences):
+    # the occurrences are the ones already found in line, it is not searched again
+    parts = []
+    position = 0
+    for occurrence in occurrences:
+        parts.append(line[position:occurrence.start])
+        parts.append(occurrence.dest_str)
+        position = occurrence.end
+    parts.append(line[position:])
+    return "".join(parts)
 
 
-def _build_new_line(new_line, line, start_string_index, nb_occurrences_in_line, start_string_position,
-                    start_string_positions, init_str):
-    new_line += init_str
-    new_line = _complete_new_line(new_line, line, start_string_index, nb_occurrences_in_line,
-                                  start_string_position,
-                                  start_string_positions, len(init_str))
+def _complete_new_line(new_line, line, occurrence_index, occurrences):
+    if occurrence_index == len(occurrences) - 1:
+        new_line += line[occurrences[occurrence_index].end:]
+    else:
+        new_line += line[occurrences[occurrence_index].end:occurrences[occurrence_index + 1].start]
     return new_line
 
 
-def _multi_replacement_on_same_line(line, start_string_positions, init_str, dest_str, temporary_file,
-                                    temporary_file_path, skip_file):
-    global replaced_nb
-    new_line = line[:start_string_positions[0]]
-    nb_occurrences_in_line = len(start_string_positions)
+def _multi_replacement_on_same_line(line, occurrences, temporary_file, skip_file):
+    new_line = line[:occurrences[0].start]
 
-    for start_string_index, start_string_position in enumerate(start_string_positions):
+    for occurrence_index, occurrence in enumerate(occurrences):
 
         if skip_file:
-            new_line = _build_new_line(new_line, line, start_string_index, nb_occurrences_in_line,
-                                       start_string_position,
-                                       start_string_positions, init_str)
+            new_line += line[occurrence.start:occurrence.end]
         else:
-            print(YELLOW + "\n\toccurrence %s:" % (start_string_index + 1) + BASE_C)
-            _display_line_highlighting_defined_init_str(new_line, line, init_str, start_string_position)
+            print(YELLOW + "\n\toccurrence %s:" % (occurrence_index + 1) + BASE_C)
+            _display_line_highlighting_defined_init_str(new_line, line, occurrence)
             replace_conf = input("\n\tperform replacement for this occurrence?\n\t\t[Enter] to proceed\t\t[fF] to "
                                  "skip the rest of the file\n\t\t[oO] to skip this occurrence\t[aA] to abort "
                                  "the replace process\n\t")
             if replace_conf == "":
 
                 print(CFILE_PATHS + "\t\t\tdone\n\n" + BASE_C)
-                new_line += dest_str
-                new_line = _complete_new_line(new_line, line, start_string_index, nb_occurrences_in_line,
-                                              start_string_position,
-                                              start_string_positions, len(init_str))
-
-                replaced_nb += 1
+                new_line += occurrence.dest_str
+                _add_replaced_occurrences([occurrence])
             elif replace_conf in ["a", "A"]:
                 raise Abort
                 # _abort_process(temporary_file, temporary_file_path)
             else:
-                new_line = _build_new_line(new_line, line, start_string_index, nb_occurrences_in_line,
-                                           start_string_position, start_string_positions, init_str)
+                new_line += line[occurrence.start:occurrence.end]
                 _skipped()
 
             if replace_conf in ["f", "F"]:
                 skip_file = True
 
+        new_line = _complete_new_line(new_line, line, occurrence_index, occurrences)
+
     temporary_file.write(new_line)
     return skip_file
 
 
-def _replace_one_occurrence_asked(replace_conf, temporary_file, temporary_file_path, init_str,
-                                  dest_str, line, case_sensitive, skip_file):
-    global replaced_nb
+def _replace_one_occurrence_asked(replace_conf, temporary_file, matcher, line, occurrences, skip_file):
     if replace_conf == "":
-        if case_sensitive:
-            temporary_file.write(re.sub(init_str, dest_str, line))
-        else:
-            temporary_file.write(re.sub(init_str, dest_str, line, flags=re.I))
-        replaced_nb += 1
+        temporary_file.write(_substitute_occurrences(line, occurrences))
+        _add_replaced_occurrences(occurrences)
         print(CFILE_PATHS + "\t\t\tdone\n\n" + BASE_C)
     elif replace_conf in ["a", "A"]:
         raise Abort
@@ -592,326 +1151,1057 @@ def _update_previous_lines(previous_lines, line):
         exit(1)
 
 
-def _find_tmp_file_not_existing(file_path):
-    for i in range(9):
-        temporary_file_path = file_path + ".rp0" + str(i + 1) + ".tmp"
-        if not os.path.exists(temporary_file_path):
-            return temporary_file_path
-    logger.error("all the available tmp extensions are used for the %s path" % file_path)
-    exit(1)
-
-
-def _file_replace(file_path, temporary_file_path, init_str, dest_str, ask_replace, case_sensitive, file_mask):
-    global found_nb
-    global replaced_nb
-
+def _file_replace(file_path, file_content, file_text, matcher, ask_replace, file_mask, durability=NO_DURABILITY,
+                  file_stat=None):
+    # file_stat is the stat of file_content, the file is only committed if it still has it once the occurrences are
+    # asked
     if not os.path.isfile(file_path):
         logger.error("The file %s doesn't exist" % file_path)
         return
 
-    temporary_file = open(temporary_file_path, "w")
+    temporary_file = _create_temporary_file(file_path, file_mask)
+    if temporary_file is None:
+        return
+
+    # same newlines translation as a file opened in text mode. Without translation, an ascii text has the offsets of
+    # the file bytes: the lines without occurrences are copied from them
+    if "\r" in file_text:
+        file_text = file_text.replace("\r\n", "\n").replace("\r", "\n")
+        temporary_file.set_source(file_text)
+        temporary_file.whole_source_changed = True
+    elif len(file_text) == len(file_content):
+        temporary_file.set_source(file_text, file_content, file_path)
+    else:
+        temporary_file.set_source(file_text)
 
-    logger.info("There is " + COCCURRENCES + "\"%s\"" % init_str + BASE_C + " in the file "
+    logger.info("There is " + COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " in the file "
                 + CFILE_PATHS + "%s" % file_path + BASE_C)
-    logger.info("Replacing " + COCCURRENCES + "\"%s\"" % init_str + BASE_C + " by " + COCCURRENCES + "\"%s\""
-                % dest_str + BASE_C + " in " + CFILE_PATHS + "%s" % file_path + BASE_C + " for the following lines:")
+    logger.info("Replacing " + COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " by " + COCCURRENCES +
+                "%s" % matcher.dest_str_label + BASE_C + " in " + CFILE_PATHS + "%s" % file_path + BASE_C +
+                " for the following lines:")
 
     previous_lines = []
     skip_file = False
+    counts = _get_counts() if ask_replace else None
+    # the text before position is already in the temporary file
+    position = 0
+    line_start = 0
 
     try:
 
-        for line_index, line in enumerate(open(file_path, encoding=ENCODING_INPUT_FILES)):
+        for line_index, line in enumerate(io.StringIO(file_text)):
             line_nb = line_index + 1
-            if case_sensitive:
-                if init_str in line and not skip_file:
-                    start_string_positions = _get_str_positions_in_lines(init_str, line, case_sensitive)
-                    _display_line_highlighting_init_strs(line, line_nb, start_string_positions, init_str,
+            line_end = line_start + len(line)
+            occurrences = [] if skip_file else matcher.find_occurrences(line)
+            if occurrences:
+                temporary_file.copy_source(position, line_start)
+                change_start = temporary_file.size
+                position = line_end
+                if state.json_output:
+                    _add_json_match_records(file_path, line, line_nb, occurrences)
+                elif ask_replace or state.verbosity > QUIET_VERBOSITY:
+                    _display_line_highlighting_init_strs(line, line_nb, occurrences, matcher.init_str_label,
                                                          previous_lines)
-                    found_nb += len(start_string_positions)
-                    if not ask_replace:
-                        temporary_file.write(re.sub(init_str, dest_str, line))
-                        replaced_nb += len(start_string_positions)
-                    elif ask_replace:
-                        if len(start_string_positions) == 1:
-                            replace_conf = input("\n\tperform replacement?\n\t\t[Enter] to proceed\t\t[fF] to skip "
-                                                 "the rest of the file\n\t\t[oO] to skip this occurrence\t"
-                                                 "[aA] to abort the replace process\n\t")
-
-                            skip_file = _replace_one_occurrence_asked(replace_conf,
-                                                                      temporary_file,
-                                                                      temporary_file_path,
-                                                                      init_str,
-                                                                      dest_str, line,
-                                                                      case_sensitive, skip_file)
-                        else:
-                            skip_file = _multi_replacement_on_same_line(line,
-                                                                        start_string_positions,
-                                                                        init_str,
-                                                                        dest_str,
-                                                                        temporary_file,
-                                                                        temporary_file_path,
-                                                                        skip_file)
-
-                    else:
-                        logger.error("the ask_replace parameter can only be \"True\" or \"False\"" +
-                                     "the ask_replace parameter can not be %s" % ask_replace)
-                        exit(1)
+                _add_found_occurrences(occurrences)
+                if not ask_replace:
+                    temporary_file.write(_substitute_occurrences(line, occurrences))
+                    _add_replaced_occurrences(occurrences)
+                elif len(occurrences) == 1:
+                    replace_conf = input("\n\tperform replacement?\n\t\t[Enter] to proceed\t\t[fF] to skip "
+                                         "the rest of the file\n\t\t[oO] to skip this occurrence\t"
+                                         "[aA] to abort the replace process\n\t")
+
+                    skip_file = _replace_one_occurrence_asked(replace_conf, temporary_file, matcher, line,
+                                                              occurrences, skip_file)
                 else:
-                    temporary_file.write(line)
-
-            elif not case_sensitive:
-                if _case_less_str1_in_str2(init_str, line) and not skip_file:
-                    start_string_positions = _get_str_positions_in_lines(init_str, line, case_sensitive)
-                    _display_line_highlighting_init_strs(line, line_nb, start_string_positions,
-                                                         init_str, previous_lines)
-                    found_nb += len(start_string_positions)
-                    if not ask_replace:
-                        replaced_nb += len(start_string_positions)
-                        temporary_file.write(re.sub(init_str, dest_str, line, flags=re.I))
-                    elif ask_replace:
-
-                        if len(start_string_positions) == 1:
-                            replace_conf = input("\n\tPerform replacement?\n\t\t[Enter] to proceed\t\t[fF] to skip "
-                                                 "The rest of the file\n\t\t[oO] to skip this occurrence\t[aA] to abort "
-                                                 "The replace process\n\t")
-
-                            skip_file = _replace_one_occurrence_asked(replace_conf,
-                                                                      temporary_file,
-                                                                      temporary_file_path,
-                                                                      init_str,
-                                                                      dest_str, line,
-                                                                      case_sensitive, skip_file)
-
-                        else:
-                            skip_file = _multi_replacement_on_same_line(line,
-                                                                        start_string_positions,
-                                                                        init_str,
-                                                                        dest_str,
-                                                                        temporary_file,
-                                                                        temporary_file_path,
-                                                                        skip_file)
-                    else:
-                        logger.error("The ask_replace parameter can only be \"True\" or \"False\"" +
-                                     "The ask_replace parameter can not be %s" % ask_replace)
-                        exit(1)
-                else:
-                    temporary_file.write(line)
-
-            else:
-                logger.error("The case_sensitive parameter can only be \"True\" or \"False\"" +
-                             "The case_sensitive parameter can not be %s" % case_sensitive)
-                exit(1)
+                    skip_file = _multi_replacement_on_same_line(line, occurrences, temporary_file, skip_file)
+                temporary_file.add_change(change_start, line)
 
             _update_previous_lines(previous_lines, line)
+            line_start = line_end
+        temporary_file.copy_source(position, len(file_text))
 
     except UnicodeDecodeError as e:
         logger.error("File with utf-8 encoding issue\n\t%s" % e)
-        temporary_file.close()
-        os.remove(temporary_file_path)
+        _remove_temporary_file(temporary_file)
         return
     except Abort:
-        temporary_file.close()
-        os.remove(temporary_file_path)
-        logger.info(YELLOW + "\n\t\t\taborted ...\n\t\t\t\tSee you later" + BASE_C)
-        exit(0)
+        _remove_temporary_file(temporary_file)
+        raise
     except:
         logger.error("Issue while parsing file\n\t%s" % sys.exc_info()[0])
 
-    temporary_file.close()
-    os.remove(file_path)
-    os.rename(temporary_file_path, file_path)
-    os.chmod(file_path, int(file_mask, 8))
+    if ask_replace and file_stat is not None and _file_changed(file_path, file_stat):
+        # written meanwhile, maybe while the user was deciding: the replacements done on the content read would
+        # overwrite the new one, they are dropped and not counted
+        _remove_temporary_file(temporary_file)
+        _set_counts(counts)
+        _skip_file(CHANGED_WHILE_ASKED, "the file %s changed while its occurrences were asked, it is not replaced",
+                   file_path)
+        return
+    return _replace_file_by_temporary(file_path, temporary_file, durability)
 
 
-def _check_file_extension_in_blacklist(file_path):
-    for black_list_extension in BLACK_LIST_EXTENSIONS_LIST:
-        if file_path.endswith(black_list_extension):
-            logger.warning("the file %s owns the extension %s that is not accepted by default\n\t"
-                           "use one of these parameters %s if you want to perform replacement in this kind of file "
-                           "anyway" % (file_path, black_list_extension, NO_BLACK_LIST_EXTENSIONS_INDICATORS_STRINGS))
-            _skipped()
-            return True
-    return False
+def _file_changed(file_path, file_stat):
+    # a file written since file_stat has another inode, size or modification time
+    try:
+        return watch.file_signature(os.stat(file_path)) != watch.file_signature(file_stat)
+    except OSError:
+        return True
 
 
-def _check_file_name_must_end_by(file_name_must_end_by, file_path):
-    for acceptable_file_name_end in file_name_must_end_by:
-        if file_path.endswith(acceptable_file_name_end):
-            return True
-    logger.warning(
-        "the file %s doesn't end by the acceptable end extensions you entered: %s" % (file_path, file_name_must_end_by))
-    _skipped()
-    return False
+def _remove_temporary_file(temporary_file):
+    temporary_file.close()
+    os.remove(temporary_file.path)
 
 
-def _check_file_owns_excluded_path(excluded_paths, file_path):
-    for excluded_path in excluded_paths:
-        if file_path.startswith(excluded_path):
-            logger.warning(
-                "the file %s is excluded regarding the excluded path %s you entered" % (file_path, excluded_path))
-            _skipped()
-            return True
-    return False
+def _replace_file_by_temporary(file_path, temporary_file, durability=NO_DURABILITY):
+    # os.replace is atomic: the file path always gives either the old or the new content. The temporary file already
+    # has the permission mask of the file. Returns the number of bytes written, known before the commit
+    if state.committer is not None:
+        state.commit_futures.append(state.committer.submit(_commit_temporary_file, file_path, temporary_file,
+                                                           durability))
+    else:
+        with _phase("commit"):
+            _commit_temporary_file(file_path, temporary_file, durability)
+    if durability == BATCH_DURABILITY:
+        state.committed_file_paths.append(file_path)
+    _count_stat("files replaced")
+    _count_stat("bytes written", temporary_file.size)
+    _count_stat("bytes copied by the kernel", temporary_file.kernel_copied_size)
+    return temporary_file.size
+
+
+def _commit_temporary_file(file_path, temporary_file, durability):
+    # only I/O, it may run in the committer thread
+    if durability == FILE_DURABILITY:
+        temporary_file.sync()
+    temporary_file.close()
+    if state.undo_journal is not None:
+        _journal_temporary_file(file_path, temporary_file, durability)
+    if state.replaced_file_signatures is not None:
+        # the rename keeps the inode, the size and the modification time of the temporary file
+        state.replaced_file_signatures[file_path] = watch.file_signature(os.stat(temporary_file.path))
+    os.replace(temporary_file.path, file_path)
+    if durability == FILE_DURABILITY:
+        _sync_directories([file_path])
+
+
+def _journal_temporary_file(file_path, temporary_file, durability):
+    # recorded before the rename, while the file still has its original content. When the copied spans were
+    # translated as well, the whole original content is recorded
+    replaced_stat = os.stat(temporary_file.path)
+    changes = temporary_file.changes
+    if temporary_file.whole_source_changed:
+        with open(file_path, 'rb') as file:
+            changes = [(0, replaced_stat.st_size, file.read())]
+    state.undo_journal.add(file_path, replaced_stat, changes)
+    if durability == FILE_DURABILITY:
+        state.undo_journal.sync()
+
+
+@contextlib.contextmanager
+def _background_commits():
+    # the files replaced meanwhile are committed by the committer thread, all of them are when it exits. The
+    # committed_file_paths of the batch durability are only synced after it
+    state.committer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replacefs-committer",
+                                         initializer=_set_current_state, initargs=(_current_state(),))
+    try:
+        yield
+    finally:
+        state.committer.shutdown()
+        state.committer = None
+        futures = list(state.commit_futures)
+        state.commit_futures.clear()
+        for future in futures:
+            future.result()
+
+
+def _sync_directories(file_paths):
+    # a rename is only durable once the directory owning the file is synced, each directory is synced once
+    for directory_path in dict.fromkeys(os.path.dirname(file_path) for file_path in file_paths):
+        try:
+            directory_fd = os.open(directory_path, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+        except OSError as e:
+            logger.warning("the directory " + CFILE_PATHS + "%s" % directory_path + BASE_C +
+                           " can not be synced\n\t%s" % e)
+
+
+def _sync_committed_files():
+    # the files committed with the batch durability are synced, then their directories
+    if state.committed_file_paths and state.undo_journal is not None:
+        state.undo_journal.sync()
+    for file_path in state.committed_file_paths:
+        try:
+            file_fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(file_fd)
+            finally:
+                os.close(file_fd)
+        except OSError as e:
+            logger.warning("the file " + CFILE_PATHS + "%s" % file_path + BASE_C + " can not be synced\n\t%s" % e)
+    _sync_directories(state.committed_file_paths)
+    state.committed_file_paths.clear()
+
+
+def _stream_chunks_replace(file, temporary_file, matcher, file_path=None, match_records=None):
+    # an occurrence starting in the last max_init_str_length - 1 chars of a chunk may end in the next chunk: this tail
+    # is kept and searched again with the next chunk. The occurrences starting before it always fit in the buffer, so
+    # the occurrences found are the same as the ones found in the whole text. Returns the number of occurrences
+    # replaced by initial string, only counted once the file is committed: the decode may fail in a later chunk.
+    # With match_records, the json match records are written to it, with the line and the column of each occurrence
+    overlap = matcher.max_init_str_length - 1
+    pending = ""
+    replaced_nb_by_init_str_in_file = {}
+    # the newlines are counted up to the scanned index of the buffer, line_start is the index where its line starts
+    scanned = 0
+    line_nb = 1
+    line_start = 0
+    while True:
+        chunk = file.read(STREAMING_CHUNK_SIZE)
+        buffer = pending + chunk
+        safe_end = max(len(buffer) - overlap, 0) if chunk else len(buffer)
+        position = 0
+        for occurrence in matcher.find_occurrences(buffer):
+            if occurrence.start >= safe_end:
+                break
+            temporary_file.write(buffer[position:occurrence.start])
+            change_start = temporary_file.size
+            temporary_file.write(occurrence.dest_str)
+            temporary_file.add_change(change_start, buffer[occurrence.start:occurrence.end])
+            position = occurrence.end
+            replaced_nb_by_init_str_in_file[occurrence.init_str] = \
+                replaced_nb_by_init_str_in_file.get(occurrence.init_str, 0) + 1
+            if match_records is not None:
+                line_nb, line_start = _count_lines(buffer, scanned, occurrence.start, line_nb, line_start)
+                scanned = occurrence.start
+                match_records.write(json.dumps(_json_match_record(file_path, line_nb,
+                                                                  occurrence.start - line_start + 1,
+                                                                  buffer[occurrence.start:occurrence.end],
+                                                                  occurrence.dest_str), ensure_ascii=False) + "\n")
+
+        pending_start = max(position, safe_end)
+        temporary_file.write(buffer[position:pending_start])
+        pending = buffer[pending_start:]
+        if match_records is not None:
+            # the indexes of the next buffer start at pending_start
+            line_nb, line_start = _count_lines(buffer, scanned, pending_start, line_nb, line_start)
+            scanned = 0
+            line_start -= pending_start
+        if not chunk:
+            return replaced_nb_by_init_str_in_file
+
+
+def _count_lines(text, start, end, line_nb, line_start):
+    # the line number and the line start index at end, from the ones at start
+    newlines_nb = text.count("\n", start, end)
+    if not newlines_nb:
+        return line_nb, line_start
+    return line_nb + newlines_nb, text.rindex("\n", start, end) + 1
+
+
+def _file_stream_replace(file_path, matcher, file_mask, durability=NO_DURABILITY):
+    if not os.path.isfile(file_path):
+        logger.error("The file %s doesn't exist" % file_path)
+        return
+
+    temporary_file = _create_temporary_file(file_path, file_mask)
+    if temporary_file is None:
+        return
 
+    logger.info("There is " + COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " in the file "
+                + CFILE_PATHS + "%s" % file_path + BASE_C)
+    logger.info("Replacing " + COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " by " + COCCURRENCES +
+                "%s" % matcher.dest_str_label + BASE_C + " in " + CFILE_PATHS + "%s" % file_path + BASE_C +
+                " chunk by chunk, the lines are not displayed")
 
-def _check_file_owns_excluded_extension(excluded_extensions, file_path):
-    for excluded_extension in excluded_extensions:
-        if file_path.endswith(excluded_extension):
-            logger.warning("the file %s is excluded regarding the "
-                           "excluded extension %s you entered" % (file_path, excluded_extension))
-            _skipped()
-            return True
-    return False
+    # like the counts, the match records are only written once the file is committed
+    match_records = tempfile.SpooledTemporaryFile(JSON_SPOOL_MAX_SIZE, "w+", encoding=ENCODING_INPUT_FILES) \
+        if state.json_output else None
+    try:
+        # same newlines translation as the line by line replacement
+        with open(file_path, encoding=ENCODING_INPUT_FILES) as file:
+            replaced_nb_by_init_str_in_file = _stream_chunks_replace(file, temporary_file, matcher, file_path,
+                                                                     match_records)
+            if file.newlines not in (None, "\n"):
+                temporary_file.whole_source_changed = True
+    except UnicodeDecodeError:
+        # found after some chunks were already replaced, the file is skipped like a file not decoded at once
+        _remove_temporary_file(temporary_file)
+        if match_records is not None:
+            match_records.close()
+        _skip_file(NON_UNICODE_FILE, SKIP_MESSAGES[NON_UNICODE_FILE], file_path)
+        return
 
+    bytes_written_nb = _replace_file_by_temporary(file_path, temporary_file, durability)
+    if match_records is not None:
+        with match_records:
+            _flush_json_records()
+            match_records.seek(0)
+            shutil.copyfileobj(match_records, sys.stdout)
+            sys.stdout.flush()
+    for init_str, file_replaced_nb in replaced_nb_by_init_str_in_file.items():
+        _add_found_nb(init_str, file_replaced_nb)
+        _add_replaced_nb(init_str, file_replaced_nb)
+    logger.info(CFILE_PATHS + "%s" % sum(replaced_nb_by_init_str_in_file.values()) + BASE_C +
+                " occurrences replaced in " + CFILE_PATHS + "%s" % file_path + BASE_C)
+    return bytes_written_nb
+
+
+# reasons why a path is filtered
+EXCLUDED_PATH = "excluded path"
+EXCLUDED_EXTENSION = "excluded extension"
+EXCLUDED_STRING = "excluded string"
+BLACK_LIST_EXTENSION = "black list extension"
+FILE_NAME_MUST_END_BY = "file name must end by"
+# reasons why a file is skipped once its path is accepted
+BINARY_FILE = "binary file"
+SYMLINK_FILE = "symlink"
+NON_UNICODE_FILE = "non unicode content"
+PERMISSION_DENIED = "permission denied"
+UNREADABLE_FILE = "unreadable file"
+CHANGED_WHILE_ASKED = "changed while asked"
+# not a skip: the file is processed, but may not be writable
+OWNED_BY_OTHER_USER = "owned by another user"
+
+# messages of the skips found by the content checks, also replayed after a search done ahead
+SKIP_MESSAGES = {BINARY_FILE: "the file %s is a binary file", NON_UNICODE_FILE: "the file %s owns non unicode characters"}
+
+
+def _is_glob(pattern):
+    return any(glob_char in pattern for glob_char in "*?[")
+
+
+def _compile_rules(patterns):
+    # one regex for all the patterns, the named group of the matching alternative gives back its pattern: the groups
+    # fnmatch.translate may add don't shift the alternatives
+    if not patterns:
+        return None
+    return re.compile("|".join("(?P<rule%s>%s)" % (index, pattern) for index, pattern in enumerate(patterns)))
+
+
+def _matching_rule(regex, rules, string, glob=False):
+    # a string rule is found anywhere in the string, a glob rule matches the whole name like fnmatch
+    match = regex.fullmatch(string) if glob else regex.search(string)
+    if match is None:
+        return None
+    return rules[int(match.lastgroup[len("rule"):])]
+
+
+class PathFilter:
+    """the path rules compiled once: extension suffixes as tuples for a single str.endswith call, the excluded strings
+    in one regex and the excluded paths as a prefixes tuple. classify() gives the reason and the rule filtering a path,
+    or None if the path is accepted.
+
+    The excluded strings, excluded extensions and acceptable end strings owning *, ? or [ are glob patterns: the
+    excluded strings globs are matched against each whole name of the path, so they prune directories too, the others
+    against the whole file name.
+    """
+
+    def __init__(self, black_list_extensions, excluded_paths, excluded_extensions, excluded_strings,
+                 file_name_must_end_by):
+        self.excluded_paths = tuple(excluded_paths)
+        self.excluded_extensions = tuple(extension for extension in excluded_extensions if not _is_glob(extension))
+        self.black_list_extensions = tuple(BLACK_LIST_EXTENSIONS_LIST) if black_list_extensions else ()
+        self.file_name_must_end_by = tuple(end for end in file_name_must_end_by if not _is_glob(end))
+
+        self._excluded_strings = [string for string in excluded_strings if not _is_glob(string)]
+        self._excluded_strings_regex = _compile_rules([re.escape(string) for string in self._excluded_strings])
+        self._excluded_names = [string for string in excluded_strings if _is_glob(string)]
+        self._excluded_names_regex = _compile_rules([fnmatch.translate(name) for name in self._excluded_names])
+        self._excluded_extensions_globs = [extension for extension in excluded_extensions if _is_glob(extension)]
+        self._excluded_extensions_regex = _compile_rules([fnmatch.translate(extension)
+                                                          for extension in self._excluded_extensions_globs])
+        self._must_end_by_globs = [end for end in file_name_must_end_by if _is_glob(end)]
+        self._must_end_by_regex = _compile_rules([fnmatch.translate(end) for end in self._must_end_by_globs])
+        self.filters_file_name_end = bool(file_name_must_end_by)
+
+    def _classify_path(self, path, names):
+        if self.excluded_paths and path.startswith(self.excluded_paths):
+            return EXCLUDED_PATH, next(excluded for excluded in self.excluded_paths if path.startswith(excluded))
+        if self._excluded_strings_regex is not None:
+            excluded_string = _matching_rule(self._excluded_strings_regex, self._excluded_strings, path)
+            if excluded_string is not None:
+                return EXCLUDED_STRING, excluded_string
+        if self._excluded_names_regex is not None:
+            for name in names:
+                excluded_name = _matching_rule(self._excluded_names_regex, self._excluded_names, name, True)
+                if excluded_name is not None:
+                    return EXCLUDED_STRING, excluded_name
+        return None
+
+    def classify_directory(self, directory_path):
+        # all the files of the directory would be filtered by the same path or string
+        return self._classify_path(directory_path, [os.path.basename(directory_path)])
+
+    def classify(self, file_path):
+        file_name = os.path.basename(file_path)
+        if self.excluded_extensions and file_path.endswith(self.excluded_extensions):
+            return EXCLUDED_EXTENSION, next(extension for extension in self.excluded_extensions
+                                            if file_path.endswith(extension))
+        if self._excluded_extensions_regex is not None:
+            excluded_extension = _matching_rule(self._excluded_extensions_regex, self._excluded_extensions_globs,
+                                                file_name, True)
+            if excluded_extension is not None:
+                return EXCLUDED_EXTENSION, excluded_extension
+
+        reason_and_rule = self._classify_path(file_path, file_path.split(os.sep))
+        if reason_and_rule is not None:
+            return reason_and_rule
+
+        if self.black_list_extensions and file_path.endswith(self.black_list_extensions):
+            return BLACK_LIST_EXTENSION, next(extension for extension in self.black_list_extensions
+                                              if file_path.endswith(extension))
+
+        if self.filters_file_name_end:
+            if not (file_path.endswith(self.file_name_must_end_by) or
+                    (self._must_end_by_regex is not None and self._must_end_by_regex.fullmatch(file_name))):
+                return FILE_NAME_MUST_END_BY, self.file_name_must_end_by + tuple(self._must_end_by_globs)
+        return None
+
+
+def _path_filtered(path, reason_and_rule, path_kind="file"):
+    if reason_and_rule is None:
+        return False
+    reason, rule = reason_and_rule
+    if reason == BLACK_LIST_EXTENSION:
+        _skip_file(reason, "the file %s owns the extension %s that is not accepted by default\n\t"
+                           "use one of these parameters %s if you want to perform replacement in this kind of file "
+                           "anyway", path, rule, NO_BLACK_LIST_EXTENSIONS_INDICATORS_STRINGS)
+    elif reason == FILE_NAME_MUST_END_BY:
+        _skip_file(reason, "the file %s doesn't end by the acceptable end extensions you entered: %s", path, list(rule))
+    else:
+        _skip_file(reason, "the %s %s is excluded regarding the %s %s you entered", path_kind, path, reason, rule)
+    return True
 
-def _check_file_owns_excluded_str(excluded_strings, file_path):
-    for excluded_string in excluded_strings:
-        if excluded_string in file_path:
-            logger.warning(
-                "the file %s is excluded regarding the excluded string %s you entered" % (file_path, excluded_string))
-            _skipped()
-            return True
-    return False
 
+def _skip_file(reason, message, *message_args):
+    # the skipped files are counted by reason, the message is only formatted when it is shown
+    state.skipped_nb_by_reason[reason] = state.skipped_nb_by_reason.get(reason, 0) + 1
+    if state.verbosity >= VERBOSE_VERBOSITY:
+        logger.warning(message, *message_args)
+        _skipped()
 
-def _check_able_open_file(file_path):
 
+def _read_file_content(file_path):
+    # the only read of the file: the binary, match and replace steps all work on the returned content
     try:
-        open_test = open(file_path, 'r', encoding=ENCODING_INPUT_FILES)
-        open_test.close()
-        return True
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size >= MMAP_MIN_FILE_SIZE:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return file.read()
     except FileNotFoundError:
-        logger.error("The file " + CFILE_PATHS + "%s" % file_path + BASE_C + " doesn't exist")
-        _skipped()
-        return False
+        _skip_file(UNREADABLE_FILE, "The file %s doesn't exist", file_path)
+        return None
     except PermissionError:
-        logger.error("You don't have the permission to access the file " + CFILE_PATHS + "%s" % file_path + BASE_C)
-        _skipped()
-        return False
+        _skip_file(PERMISSION_DENIED, "You don't have the permission to access the file %s", file_path)
+        return None
     except IsADirectoryError:
-        logger.error("The path " + CFILE_PATHS + "%s" % file_path + BASE_C + "is a directory, not a file")
-        _skipped()
-        return False
+        _skip_file(UNREADABLE_FILE, "The path %s is a directory, not a file", file_path)
+        return None
     except OSError:
-        logger.error("No such device or address " + CFILE_PATHS + "%s" % file_path + BASE_C)
-        _skipped()
-        return False
-    except UnicodeDecodeError as e:
-        print("Decode byte error for file %s\n%s" % (file_path, e))
-        return False
+        _skip_file(UNREADABLE_FILE, "No such device or address %s", file_path)
+        return None
+
 
+PrefetchedFile = collections.namedtuple("PrefetchedFile", ["file_stat", "file_content", "searched"])
+# skip_reason is BINARY_FILE, NON_UNICODE_FILE or None, file_text is only kept when it owns an occurrence
+SearchedFile = collections.namedtuple("SearchedFile", ["skip_reason", "in_bytes", "file_text"])
 
-def _check_able_create_temporary(temporary_file_path, file_mask):
+
+def _prefetch_file(walked_file, symlink_accepted, content_read, search=None):
+    # run by the reader threads of --pipeline and of the asking mode, without logging nor counting: on failure the
+    # stat or the content is None and _process_file does them again to report the error. The memory mapped contents
+    # are read ahead by the kernel, only the contents read are searched with search, to bound the memory held
+    file_path, is_symlink = walked_file
     try:
-        open_test = open(temporary_file_path, 'w+')
-        open_test.close()
-        os.chmod(temporary_file_path, int(file_mask, 8))
-        os.remove(temporary_file_path)
-        return True
+        file_stat = os.stat(file_path)
+    except OSError:
+        return PrefetchedFile(None, None, None)
+    if not content_read or not S_ISREG(file_stat.st_mode) or (is_symlink and not symlink_accepted):
+        return PrefetchedFile(file_stat, None, None)
+    try:
+        with open(file_path, 'rb') as file:
+            if file_stat.st_size < MMAP_MIN_FILE_SIZE:
+                file_content = file.read()
+                return PrefetchedFile(file_stat, file_content, search and search(file_content))
+            file_content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return PrefetchedFile(file_stat, None, None)
+    if hasattr(mmap, "MADV_WILLNEED"):
+        file_content.madvise(mmap.MADV_WILLNEED)
+    return PrefetchedFile(file_stat, file_content, None)
+
+
+def _release_prefetched_file(prefetched):
+    # the memory mapped content is closed at once, not when the prefetched file is garbage collected. Closing it
+    # again after _process_file is harmless
+    if isinstance(prefetched.file_content, mmap.mmap):
+        prefetched.file_content.close()
+
+
+def _search_file(file_content, matcher, binary_accepted):
+    # the checks of _process_file_content up to the replacement, done ahead for the asking mode
+    if not binary_accepted and _is_binary_content(file_content):
+        return SearchedFile(BINARY_FILE, False, None)
+    if not matcher.may_be_in_bytes(file_content):
+        return SearchedFile(None, False, None)
+    try:
+        file_text = str(file_content, ENCODING_INPUT_FILES)
+    except UnicodeDecodeError:
+        return SearchedFile(NON_UNICODE_FILE, True, None)
+    return SearchedFile(None, True, file_text if matcher.in_text(file_text) else None)
+
+
+def _create_temporary_file(file_path, file_mask):
+    # created next to the file, on the same file system, so that it can be renamed over it. Its unique name can't
+    # clash with an existing file and it has the permission mask of the file before anything is written
+    directory_path, file_name = os.path.split(file_path)
+    temporary_file_path = os.path.join(directory_path, "." + file_name + ".tmp")
+    try:
+        temporary_fd, temporary_file_path = tempfile.mkstemp(prefix="." + file_name + ".", suffix=".tmp",
+                                                             dir=directory_path)
+        os.fchmod(temporary_fd, int(file_mask, 8))
+        return output.OutputFile(open(temporary_fd, 'wb', buffering=0), ENCODING_INPUT_FILES, temporary_file_path,
+                                 state.undo_journal is not None)
     except FileNotFoundError:
         logger.error("the file " + CFILE_PATHS + "%s" % temporary_file_path + BASE_C + " doesn't exist")
         _skipped()
-        return False
+        return None
     except PermissionError:
         logger.error(
             "you don't have the permission to create the file " + CFILE_PATHS + "%s" % temporary_file_path + BASE_C)
         _skipped()
-        return False
+        return None
     except IsADirectoryError:
         logger.error(" the path " + CFILE_PATHS + "%s" % temporary_file_path + BASE_C + "is a directory, not a file")
         _skipped()
-        return False
+        return None
 
 
-def _check_binary_file(file_path):
-    textchars = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
-    is_binary_string = lambda bytes: bool(bytes.translate(None, textchars))
-    try:
-        if is_binary_string(open(file_path, 'rb').read(1024)):
-            logger.warning("the file %s is a binary file" % file_path)
-            _skipped()
-            return True
-        return False
-    except PermissionError:
-        logger.error("you don't have the permission to access the file " + CFILE_PATHS + "%s" % file_path + BASE_C)
-        _skipped()
+TEXT_CHARS = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+
+def _is_binary_content(file_content):
+    return bool(file_content[:1024].translate(None, TEXT_CHARS))
+
+
+def _check_binary_content(file_path, file_content):
+    if _is_binary_content(file_content):
+        _skip_file(BINARY_FILE, SKIP_MESSAGES[BINARY_FILE], file_path)
         return True
+    return False
 
 
-def _check_symlink_path(file_path):
-    if os.path.islink(file_path):
-        logger.warning("the file %s is a symlink file" % file_path)
-        _skipped()
+def _check_symlink_path(file_path, is_symlink=None):
+    if is_symlink is None:
+        is_symlink = os.path.islink(file_path)
+    if is_symlink:
+        _skip_file(SYMLINK_FILE, "the file %s is a symlink file", file_path)
         return True
     return False
 
 
-def _get_temporary_file_path(file_path, excluded_paths):
-    temporary_file_path = file_path + ".tmp"
-    if os.path.exists(temporary_file_path):
-        temporary_file_path = _find_tmp_file_not_existing(file_path)
-    excluded_paths.append(temporary_file_path)
-    return temporary_file_path
+def _get_file_permission_mask(file_path, file_stat=None):
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    return oct(file_stat.st_mode & 0o777)
 
 
-def _get_file_permission_mask(file_path):
-    return oct(os.stat(file_path).st_mode & 0o777)
+def _check_excluded_by_index(trigram_filter, matcher):
+    # the index works on bytes, like may_be_in_bytes it can't decide for a case less search nor for a regex
+    if trigram_filter is None or not matcher.case_sensitive or not matcher.encoded_init_strs:
+        return False
+    return not any(trigram_filter.may_contain(encoded_init_str) for encoded_init_str in matcher.encoded_init_strs)
 
 
-def _replace_local_recursive(directory_path, init_str, dest_str, black_list_extensions, file_name_must_end_by,
-                             excluded_paths, excluded_strings, excluded_extensions, local, ask_replace, case_sensitive,
-                             binary_accepted, symlink_accepted):
-    for directory_path, directory_names, file_names in os.walk(directory_path):
-        for file_name in file_names:
+def _get_file_stat(file_path):
+    try:
+        return os.stat(file_path)
+    except OSError:
+        _skip_file(UNREADABLE_FILE, "the file path %s seems to cause problem, might be a broken symlink", file_path)
+        return None
+
+
+def _process_file(file_path, matcher, ask_replace, binary_accepted, symlink_accepted, content_index=None,
+                  is_symlink=None, durability=NO_DURABILITY, dry_run=False, prefetched=None):
+    # the path rules are checked before, by the walk or by _replace_specific
+    # the only stat of the file, its result is used for the owner, the permission mask and the index key
+    # prefetched is the PrefetchedFile read ahead by _prefetch_file
+    _count_stat("files visited")
+    prefetched_stat, prefetched_content, searched = prefetched if prefetched is not None else (None, None, None)
+    with _phase("stat"):
+        file_stat = prefetched_stat if prefetched_stat is not None else _get_file_stat(file_path)
+    if file_stat is None:
+        return
+    if state.undo_journal is not None and state.undo_journal.is_journal(file_stat):
+        return
 
-            file_path = os.path.join(directory_path, file_name)
+    _check_user_rights(file_path, file_stat)
 
-            if _check_file_owns_excluded_path(excluded_paths, file_path):
-                continue
+    if not symlink_accepted:
+        if _check_symlink_path(file_path, is_symlink):
+            return
 
-            if _check_file_owns_excluded_extension(excluded_extensions, file_path):
-                continue
+    trigram_filter = None
+    if content_index is not None:
+        trigram_filter = content_index.get(file_path, file_stat)
+        if _check_excluded_by_index(trigram_filter, matcher):
+            _count_stat("reads avoided by the index")
+            return
 
-            if _check_file_owns_excluded_str(excluded_strings, file_path):
-                continue
+    if prefetched_content is not None:
+        file_content = prefetched_content
+        _count_stat("files prefetched")
+    else:
+        with _phase("read"):
+            file_content = _read_file_content(file_path)
+    if file_content is None:
+        return
+    _count_stat("bytes read", len(file_content))
+    if isinstance(file_content, mmap.mmap):
+        _count_stat("files memory mapped")
 
-            if not _check_path_exists(file_path):
-                logger.warning("the file path " + CFILE_PATHS + "%s" % file_path + BASE_C +
-                               " seems to cause problem, might be a broken symlink")
-                continue
+    if content_index is not None and trigram_filter is None:
+        content_index.add(file_path, file_stat, file_content)
 
-            _check_user_rights(file_path)
-            if not _check_able_open_file(file_path):
-                continue
+    start_time = time.perf_counter()
+    file_found_nb = state.found_nb
+    file_replaced_nb = state.replaced_nb
+    try:
+        if searched is not None:
+            bytes_written_nb = _process_searched_file(file_path, file_stat, file_content, searched, matcher,
+                                                      ask_replace, durability)
+        else:
+            bytes_written_nb = _process_file_content(file_path, file_stat, file_content, matcher, ask_replace,
+                                                     binary_accepted, durability, dry_run)
+    finally:
+        if isinstance(file_content, mmap.mmap):
+            file_content.close()
+
+    if state.json_output and state.found_nb > file_found_nb:
+        _add_json_file_record(file_path, state.found_nb - file_found_nb, state.replaced_nb - file_replaced_nb,
+                              bytes_written_nb or 0, time.perf_counter() - start_time)
+
+
+def _process_file_content(file_path, file_stat, file_content, matcher, ask_replace, binary_accepted,
+                          durability=NO_DURABILITY, dry_run=False):
+    # returns the number of bytes written when the file is replaced
+    if not binary_accepted:
+        with _phase("binary check"):
+            if _check_binary_content(file_path, file_content):
+                return
+
+    # most of the files don't own any occurrence, they are rejected before paying the decoding
+    with _phase("byte scan"):
+        if not matcher.may_be_in_bytes(file_content):
+            _count_stat("decodes avoided by the byte scan")
+            return
+
+    if state.run_stats is not None:
+        matcher = state.run_stats.timed_methods(matcher, ["in_text", "find_occurrences"], "match")
+
+    if dry_run:
+        with _phase("count", ["decode", "match"]):
+            if state.reviewing:
+                _review_file_occurrences(file_path, file_content, matcher)
+            else:
+                _count_file_occurrences(file_path, file_content, matcher)
+        return
 
-            if black_list_extensions:
-                if _check_file_extension_in_blacklist(file_path):
-                    continue
+    if not ask_replace and matcher.streamable and len(file_content) >= STREAMING_MIN_FILE_SIZE:
+        file_mask = _get_file_permission_mask(file_path, file_stat)
+        with _phase("rewrite", ["match", "commit"]):
+            return _file_stream_replace(file_path, matcher, file_mask, durability)
 
-            if not symlink_accepted:
-                if _check_symlink_path(file_path):
-                    continue
+    with _phase("decode"):
+        file_text = _decode_file_content(file_path, file_content)
+    if file_text is None:
+        return
 
-            if not binary_accepted:
-                if _check_binary_file(file_path):
-                    continue
+    if matcher.in_text(file_text):
+        # the temporary file is only needed, and created, once an occurrence is found
+        file_mask = _get_file_permission_mask(file_path, file_stat)
+        with _phase("rewrite", ["match", "commit"]):
+            return _file_replace(file_path, file_content, file_text, matcher, ask_replace, file_mask, durability,
+                                 file_stat)
+
+
+def _process_searched_file(file_path, file_stat, file_content, searched, matcher, ask_replace,
+                           durability=NO_DURABILITY):
+    # same as _process_file_content, from the result of _search_file: its skips are counted and logged in the walk order
+    if searched.skip_reason is not None:
+        _skip_file(searched.skip_reason, SKIP_MESSAGES[searched.skip_reason], file_path)
+    elif not searched.in_bytes:
+        _count_stat("decodes avoided by the byte scan")
+    elif searched.file_text is not None:
+        file_mask = _get_file_permission_mask(file_path, file_stat)
+        if state.run_stats is not None:
+            matcher = state.run_stats.timed_methods(matcher, ["find_occurrences"], "match")
+        with _phase("rewrite", ["match", "commit"]):
+            return _file_replace(file_path, file_content, searched.file_text, matcher, ask_replace, file_mask,
+                                 durability, file_stat)
+
+
+def _count_file_occurrences(file_path, file_content, matcher):
+    # read only: nothing is displayed but the count of the file, no temporary file is created
+    file_found_nb = matcher.count_in_bytes(file_content)
+    if file_found_nb is not None:
+        # like the replacement, the files that are not unicode are skipped
+        if file_found_nb == 0 or _decode_file_content(file_path, file_content) is None:
+            return
+        _add_found_nb(matcher.init_str, file_found_nb)
+    else:
+        file_text = _decode_file_content(file_path, file_content)
+        if file_text is None or not matcher.in_text(file_text):
+            return
+        file_found_nb = 0
+        # same newlines translation as the replacement
+        for line in io.StringIO(file_text, newline=None):
+            occurrences = matcher.find_occurrences(line)
+            _add_found_occurrences(occurrences)
+            file_found_nb += len(occurrences)
+        if file_found_nb == 0:
+            return
+
+    logger.info(CFILE_PATHS + "%s" % file_found_nb + BASE_C + " occurrence%s of " % ("s" if file_found_nb > 1 else "") +
+                COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " in " + CFILE_PATHS + "%s" % file_path + BASE_C)
+
+
+def _review_file_occurrences(file_path, file_content, matcher):
+    # read only as well: the replacements of the file are proposed in the review patch, with the line endings of the
+    # file, like the count of the dry run nothing else is displayed
+    file_text = _decode_file_content(file_path, file_content)
+    if file_text is None or not matcher.in_text(file_text):
+        return
+    lines = list(io.StringIO(file_text))
+    new_lines_by_index = {}
+    file_found_nb = 0
+    for line_index, line in enumerate(lines):
+        occurrences = matcher.find_occurrences(line)
+        if occurrences:
+            _add_found_occurrences(occurrences)
+            file_found_nb += len(occurrences)
+            new_lines_by_index[line_index] = _substitute_occurrences(line, occurrences)
+    if not new_lines_by_index:
+        return
+
+    _add_review_patch(review.format_file_patch(file_path, lines, new_lines_by_index))
+    logger.info(CFILE_PATHS + "%s" % file_found_nb + BASE_C + " occurrence%s of " % ("s" if file_found_nb > 1 else "") +
+                COCCURRENCES + "%s" % matcher.init_str_label + BASE_C + " proposed in " + CFILE_PATHS +
+                "%s" % file_path + BASE_C)
 
-            if file_name_must_end_by:
-                if not _check_file_name_must_end_by(file_name_must_end_by, file_path):
-                    continue
 
-            file_mask = _get_file_permission_mask(file_path)
+def _add_review_patch(file_patch):
+    # the workers of --jobs return their patches, the main process writes them in the walk order
+    if state.review_patch_file is not None:
+        state.review_patch_file.write(file_patch)
+    else:
+        state.review_patches.append(file_patch)
 
-            temporary_file_path = _get_temporary_file_path(file_path, excluded_paths)
-            if not _check_able_create_temporary(temporary_file_path, file_mask):
+
+def _apply_file_hunks(file_path, hunks, matcher, durability=NO_DURABILITY):
+    # the hunks left by the review are applied at once, unless the file changed since the review
+    file_stat = _get_file_stat(file_path)
+    if file_stat is None:
+        return
+    file_content = _read_file_content(file_path)
+    if file_content is None:
+        return
+    try:
+        temporary_file = _write_file_hunks(file_path, file_stat, file_content, hunks)
+    finally:
+        if isinstance(file_content, mmap.mmap):
+            file_content.close()
+    if temporary_file is None:
+        return
+    # the occurrences replaced are the ones of the removed lines, the context lines don't own any
+    for _, old_lines, _ in hunks:
+        for line in old_lines:
+            occurrences = matcher.find_occurrences(line)
+            _add_found_occurrences(occurrences)
+            _add_replaced_occurrences(occurrences)
+    _replace_file_by_temporary(file_path, temporary_file, durability)
+    logger.info(CFILE_PATHS + "%s" % len(hunks) + BASE_C + " hunk%s applied in " % ("s" if len(hunks) > 1 else "") +
+                CFILE_PATHS + "%s" % file_path + BASE_C)
+
+
+def _write_file_hunks(file_path, file_stat, file_content, hunks):
+    # returns the temporary file with the hunks applied, None when they can't be
+    file_text = _decode_file_content(file_path, file_content)
+    if file_text is None:
+        return None
+    lines = list(io.StringIO(file_text))
+    located_hunks = review.locate_hunks(lines, hunks)
+    if located_hunks is None:
+        logger.warning(CFILE_PATHS + "%s" % file_path + BASE_C + " changed since the review, its hunks are not applied")
+        return None
+
+    temporary_file = _create_temporary_file(file_path, _get_file_permission_mask(file_path, file_stat))
+    if temporary_file is None:
+        return None
+    # the lines between the hunks are copied as they are, the offsets of the text are the ones of the bytes when
+    # they have the same length
+    if len(file_text) == len(file_content):
+        temporary_file.set_source(file_text, file_content, file_path)
+    else:
+        temporary_file.set_source(file_text)
+    line_offsets = list(itertools.accumulate([0] + [len(line) for line in lines]))
+    position = 0
+    for start, end, new_lines in located_hunks:
+        temporary_file.copy_source(position, line_offsets[start])
+        change_start = temporary_file.size
+        temporary_file.write("".join(new_lines))
+        position = line_offsets[end]
+        temporary_file.add_change(change_start, file_text[line_offsets[start]:position])
+    temporary_file.copy_source(position, len(file_text))
+    return temporary_file
+
+
+class _RecordedStream(io.TextIOBase):
+    """stdout or stderr of a worker process: the writes to both are kept in their order in writes, as (stream name,
+    text) pairs, to be replayed to the same streams by the main process"""
+
+    def __init__(self, writes, stream_name):
+        self._writes = writes
+        self._stream_name = stream_name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._writes.append((self._stream_name, text))
+        return len(text)
+
+
+@contextlib.contextmanager
+def _recorded_output(writes, stderr_recorded=True):
+    # the prints and, with stderr_recorded, the logger records and the other writes to stderr of the current process
+    # are kept in writes
+    stdout = _RecordedStream(writes, "stdout")
+    if not stderr_recorded:
+        with contextlib.redirect_stdout(stdout):
+            yield
+        return
+    stderr = _RecordedStream(writes, "stderr")
+    handlers_streams = [(handler, handler.setStream(stderr)) for handler in logger.handlers
+                        if isinstance(handler, logging.StreamHandler)]
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            yield
+    finally:
+        for handler, stream in handlers_streams:
+            handler.setStream(stream)
+
+
+def _joined_writes(writes):
+    # the consecutive writes to the same stream in one text
+    return [(stream_name, "".join(text for _, text in stream_writes))
+            for stream_name, stream_writes in itertools.groupby(writes, key=lambda write: write[0])]
+
+
+def _replay_output(writes):
+    # the output of a worker process, in one block per file and on the streams it was written to
+    for stream_name, text in writes:
+        stream = sys.stdout if stream_name == "stdout" else sys.stderr
+        stream.write(text)
+        stream.flush()
+
+
+def _get_counts():
+    return state.found_nb, state.replaced_nb, dict(state.found_nb_by_init_str), dict(state.replaced_nb_by_init_str)
+
+
+def _set_counts(counts):
+    state.found_nb, state.replaced_nb, found_nb_by_init_str, replaced_nb_by_init_str = counts
+    state.found_nb_by_init_str.clear()
+    state.found_nb_by_init_str.update(found_nb_by_init_str)
+    state.replaced_nb_by_init_str.clear()
+    state.replaced_nb_by_init_str.update(replaced_nb_by_init_str)
+
+
+def _reset_counts():
+    state.found_nb = 0
+    state.replaced_nb = 0
+    state.found_nb_by_init_str.clear()
+    state.replaced_nb_by_init_str.clear()
+    state.committed_file_paths.clear()
+    state.skipped_nb_by_reason.clear()
+    state.review_patches.clear()
+    if state.replaced_file_signatures is not None:
+        state.replaced_file_signatures.clear()
+
+
+def _process_file_job(process_file_args):
+    # run in a worker process: the counters are reset so that the parent only adds the ones of this file
+    _reset_counts()
+    writes = []
+    # the warnings of the json mode stay on stderr, written at once: only the records are ordered with the results
+    with _recorded_output(writes, not state.json_output):
+        _process_file(*process_file_args)
+        _flush_json_records()
+    # copies: with a chunk of several files, the results are only pickled once the whole chunk is processed
+    return state.found_nb, state.replaced_nb, dict(state.found_nb_by_init_str), dict(state.replaced_nb_by_init_str), \
+        list(state.committed_file_paths), dict(state.skipped_nb_by_reason), \
+        state.run_stats and state.run_stats.take(), list(state.review_patches), \
+        state.replaced_file_signatures and dict(state.replaced_file_signatures), _joined_writes(writes)
+
+
+def _process_file_jobs(process_files_args):
+    # a chunk of files in one task, so that the results are pickled once by chunk
+    return [_process_file_job(process_file_args) for process_file_args in process_files_args]
+
+
+def _submitted_in_order(executor, function, items, window):
+    # like executor.map, but the items are taken lazily from items: only window of them are submitted and not
+    # consumed at a time
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # the consumer stopped early: the tasks not started yet are dropped
+        for future in pending:
+            future.cancel()
+
+
+def _add_counts_by_key(counts_by_key, file_counts_by_key):
+    for key, count in file_counts_by_key.items():
+        counts_by_key[key] = counts_by_key.get(key, 0) + count
+
+
+def _scan_directory(directory_path):
+    _count_stat("directories scanned")
+    try:
+        with os.scandir(directory_path) as entries:
+            return list(entries)
+    except OSError as e:
+        logger.warning("the directory " + CFILE_PATHS + "%s" % directory_path + BASE_C + " can not be listed\n\t%s" % e)
+        return []
+
+
+def _walk_files_to_process(directory_path, path_filter, local, ignore_tree=None):
+    # same order as a top down os.walk, but the excluded and ignored directories are pruned before being listed and
+    # the symlink status of the files comes from their DirEntry. Yields the (file_path, is_symlink) accepted by
+    # path_filter and not ignored by ignore_tree
+    if _path_filtered(directory_path, path_filter.classify_directory(directory_path), "directory"):
+        return
+    directory_paths = [directory_path]
+    while directory_paths:
+        sub_directory_paths = []
+        for entry in _scan_directory(directory_paths.pop()):
+            try:
+                # like os.walk, the symlinks to directories are listed with the directories but never followed
+                is_directory = entry.is_dir()
+            except OSError:
+                is_directory = False
+
+            if ignore_tree is not None and ignore_tree.is_ignored(entry.path, is_directory):
                 continue
 
-            if _check_init_str_in_file(file_path, init_str, case_sensitive):
-                _file_replace(file_path, temporary_file_path, init_str, dest_str,
-                              ask_replace, case_sensitive, file_mask)
-        if local:
-            break
+            if is_directory:
+                if not local and not entry.is_symlink() and \
+                        not _path_filtered(entry.path, path_filter.classify_directory(entry.path), "directory"):
+                    sub_directory_paths.append(entry.path)
+                continue
+
+            if _path_filtered(entry.path, path_filter.classify(entry.path)):
+                continue
+
+            yield entry.path, entry.is_symlink()
+        directory_paths.extend(reversed(sub_directory_paths))
+
+
+def _replace_local_recursive(directory_path, matcher, path_filter, local, ask_replace, binary_accepted,
+                             symlink_accepted, jobs_nb=1, content_index=None, respect_gitignore=False,
+                             durability=NO_DURABILITY, dry_run=False, pipeline=False):
+
+    ignore_tree = ignore.IgnoreTree(directory_path) if respect_gitignore else None
+    if state.run_stats is not None:
+        path_filter = state.run_stats.timed_methods(path_filter, ["classify", "classify_directory"], "filter")
+        if ignore_tree is not None:
+            ignore_tree = state.run_stats.timed_methods(ignore_tree, ["is_ignored"], "filter")
+    file_paths = _walk_files_to_process(directory_path, path_filter, local, ignore_tree)
+    if state.run_stats is not None:
+        file_paths = state.run_stats.timed_iterator(file_paths, "walk", ["filter"])
+
+    if jobs_nb > 1 and ask_replace:
+        logger.warning("the --jobs option is only available with the no asking mode, processing files one by one"
+                       "\n\tuse one of these parameters %s to run %s jobs" % (NO_ASK_CONFIRMATION_INDICATORS_STRINGS,
+                                                                               jobs_nb))
+        jobs_nb = 1
+
+    if jobs_nb > 1 and pipeline:
+        logger.warning("the --pipeline option is only used with one job, the jobs already overlap their reads")
+
+    if jobs_nb == 1 and (pipeline or ask_replace):
+        # with the content index, the reads avoided by the index must not be done ahead: only the stats are. The
+        # asking mode searches ahead as well, so that the next occurrence is ready when the previous one is answered,
+        # and commits the replaced files in the background
+        search = None
+        if ask_replace:
+            search = functools.partial(_search_file, matcher=matcher, binary_accepted=binary_accepted)
+        prefetched_files = prefetch.prefetched(file_paths, functools.partial(_prefetch_file,
+                                                                             symlink_accepted=symlink_accepted,
+                                                                             content_read=content_index is None,
+                                                                             search=search),
+                                               PIPELINE_READERS_NB, PIPELINE_DEPTH, _release_prefetched_file)
+        walked_files = prefetched_files
+        if state.run_stats is not None:
+            walked_files = state.run_stats.timed_iterator(walked_files, "read", ["walk", "filter"])
+        # on an abort or an error, the files read ahead are released at once, not when the traceback is dropped
+        with contextlib.closing(prefetched_files), \
+                _background_commits() if ask_replace else contextlib.nullcontext():
+            for (file_path, is_symlink), prefetched in walked_files:
+                try:
+                    _process_file(file_path, matcher, ask_replace, binary_accepted, symlink_accepted, content_index,
+                                  is_symlink, durability, dry_run, prefetched)
+                finally:
+                    # also when _process_file returns before reading it, like for a symlink or a file of the index
+                    _release_prefetched_file(prefetched)
+        return
+
+    if jobs_nb == 1:
+        for file_path, is_symlink in file_paths:
+            _process_file(file_path, matcher, ask_replace, binary_accepted, symlink_accepted, content_index,
+                          is_symlink, durability, dry_run)
+        return
+
+    jobs = ((file_path, matcher, ask_replace, binary_accepted, symlink_accepted, content_index, is_symlink, durability,
+             dry_run) for file_path, is_symlink in file_paths)
+    jobs_chunks = iter(lambda: list(itertools.islice(jobs, JOBS_CHUNK_SIZE)), [])
+    with ProcessPoolExecutor(max_workers=jobs_nb, initializer=_init_worker,
+                             initargs=(state.json_output, state.verbosity, state.run_stats is not None, state.reviewing,
+                                       state.undo_journal and state.undo_journal.path,
+                                       state.replaced_file_signatures is not None)) as executor:
+        # results come back in the walk order, the output of each file is printed in one block. The files committed
+        # with the batch durability are synced by this process
+        results = itertools.chain.from_iterable(_submitted_in_order(executor, _process_file_jobs, jobs_chunks,
+                                                                    JOBS_WINDOW_CHUNKS_NB * jobs_nb))
+        for file_found_nb, file_replaced_nb, file_found_nb_by_init_str, file_replaced_nb_by_init_str, \
+                file_committed_paths, file_skipped_nb_by_reason, file_stats, file_review_patches, \
+                file_replaced_signatures, output in results:
+            state.found_nb += file_found_nb
+            state.replaced_nb += file_replaced_nb
+            state.committed_file_paths.extend(file_committed_paths)
+            _add_counts_by_key(state.found_nb_by_init_str, file_found_nb_by_init_str)
+            _add_counts_by_key(state.replaced_nb_by_init_str, file_replaced_nb_by_init_str)
+            _add_counts_by_key(state.skipped_nb_by_reason, file_skipped_nb_by_reason)
+            if file_stats is not None:
+                state.run_stats.merge(file_stats)
+            for file_patch in file_review_patches:
+                _add_review_patch(file_patch)
+            if file_replaced_signatures:
+                state.replaced_file_signatures.update(file_replaced_signatures)
+            _replay_output(output)
 
 
 def _check_folder_path_exists(folder_path):
@@ -928,46 +2218,192 @@ def _check_path_exists(path):
     return True
 
 
-def _replace_specific(file_paths_to_apply, init_str, dest_str, black_list_extensions, ask_replace, case_sensitive,
-                      binary_accepted, symlink_accepted):
+def _replace_specific(file_paths_to_apply, matcher, black_list_extensions, ask_replace, binary_accepted,
+                      symlink_accepted, content_index=None, durability=NO_DURABILITY, dry_run=False):
+    # only the black list extensions apply to the files given one by one
+    path_filter = PathFilter(black_list_extensions, [], [], [], [])
     for file_path in file_paths_to_apply:
-
-        if not _check_path_exists(file_path):
-            logger.warning("the file path %s seems to cause problem, might be a broken symlink" % file_path)
-            _skipped()
+        if _path_filtered(file_path, path_filter.classify(file_path)):
             continue
+        _process_file(file_path, matcher, ask_replace, binary_accepted, symlink_accepted, content_index,
+                      durability=durability, dry_run=dry_run)
+
+
+def _set_output_mode(json_enabled, verbosity_level):
+    # the info records are replaced by the json records, the warnings and errors still go to stderr
+    state.json_output = json_enabled
+    state.verbosity = verbosity_level
+    if state.verbosity == QUIET_VERBOSITY:
+        state.log_level = logging.ERROR
+    elif state.json_output:
+        state.log_level = logging.WARNING
+    else:
+        state.log_level = logging.DEBUG
 
-        _check_user_rights(file_path)
-        if not _check_able_open_file(file_path):
-            continue
 
-        if black_list_extensions:
-            if _check_file_extension_in_blacklist(file_path):
-                continue
+def _init_worker(json_enabled, verbosity_level, stats_enabled, review_enabled, journal_path, watching):
+    # a state of its own, not the one of the forking thread
+    _set_current_state(_RunState())
+    _set_output_mode(json_enabled, verbosity_level)
+    _set_run_stats(stats_enabled)
+    # the review patch file inherited by a forked worker is only written by the main process
+    state.reviewing = review_enabled
+    state.review_patch_file = None
+    # each worker appends its records to its own descriptor of the journal
+    state.undo_journal = journal.Journal(journal_path) if journal_path is not None else None
+    state.replaced_file_signatures = {} if watching else None
 
-        if not symlink_accepted:
-            if _check_symlink_path(file_path):
-                continue
 
-        if not binary_accepted:
-            if _check_binary_file(file_path):
-                continue
-        #
-        # except UnicodeDecodeError as e:
-        # print("Decode byte error for file %s\n%s" % (file_path, e))
+def _open_undo_journal(journal_path):
+    if journal_path is None:
+        return
+    try:
+        state.undo_journal = journal.Journal(journal_path)
+    except OSError as e:
+        raise ReplaceError("the undo journal %s can not be opened\n\t%s" % (journal_path, e))
 
-        file_mask = _get_file_permission_mask(file_path)
-        temporary_file_path = _get_temporary_file_path(file_path, [])
-        if not _check_able_create_temporary(temporary_file_path, file_mask):
-            continue
 
-        if _check_init_str_in_file(file_path, init_str, case_sensitive):
-            _file_replace(file_path, temporary_file_path, init_str, dest_str, ask_replace, case_sensitive, file_mask)
+def _close_undo_journal():
+    if state.undo_journal is not None:
+        state.undo_journal.close()
+        state.undo_journal = None
+
+
+def _set_run_stats(enabled):
+    state.run_stats = stats.RunStats() if enabled else None
+
+
+@contextlib.contextmanager
+def _running_state(run_state, json_enabled, verbosity_level, stats_enabled):
+    # run_state, reset, is the state of the current thread in the with block, the previous one is given back after
+    previous_state = _current_state()
+    _set_current_state(run_state)
+    try:
+        _reset_counts()
+        _set_output_mode(json_enabled, verbosity_level)
+        _set_run_stats(stats_enabled)
+        yield
+    finally:
+        _set_current_state(previous_state)
+
+
+def _phase(phase_name, nested_phase_names=()):
+    # times the with block in phase_name when --stats is used
+    if state.run_stats is None:
+        return contextlib.nullcontext()
+    return state.run_stats.phase(phase_name, nested_phase_names)
+
+
+def _count_stat(counter_name, value=1):
+    if state.run_stats is not None:
+        state.run_stats.add(counter_name, value)
+
+
+def _stats_summary(result):
+    duration = result.duration
+    stats_summary = "\n\t    wall time: " + CFILE_PATHS + "%.3fs" % duration + BASE_C
+    for phase_name, phase_duration in result.stats["times"].items():
+        stats_summary += "\n\t    %s: " % phase_name + CFILE_PATHS + "%.3fs" % phase_duration + BASE_C + \
+                         " (%.1f%%)" % (100 * phase_duration / duration if duration else 0)
+    for counter_name, value in result.stats["counters"].items():
+        stats_summary += "\n\t    %s: " % counter_name + CFILE_PATHS + "%s" % value + BASE_C
+    logger.info("run statistics, the phases of the jobs are summed over the workers:" + stats_summary)
+
+
+def _add_json_record(record):
+    state.json_records.append(json.dumps(record, ensure_ascii=False))
+    if len(state.json_records) >= JSON_FLUSH_RECORDS_NB:
+        _flush_json_records()
+
+
+def _flush_json_records():
+    if state.json_records:
+        sys.stdout.write("\n".join(state.json_records) + "\n")
+        sys.stdout.flush()
+        state.json_records.clear()
+
+
+def _json_match_record(file_path, line_nb, column, match, replacement):
+    return {"type": "match", "path": file_path, "line": line_nb, "column": column, "match": match,
+            "replacement": replacement}
+
+
+def _add_json_match_records(file_path, line, line_nb, occurrences):
+    # the columns start at 1, like the line numbers
+    for occurrence in occurrences:
+        _add_json_record(_json_match_record(file_path, line_nb, occurrence.start + 1,
+                                            line[occurrence.start:occurrence.end], occurrence.dest_str))
+
+
+def _add_json_file_record(file_path, file_found_nb, file_replaced_nb, bytes_written_nb, duration):
+    _add_json_record({"type": "file", "path": file_path, "found": file_found_nb, "replaced": file_replaced_nb,
+                      "bytes_written": bytes_written_nb, "time": round(duration, 6)})
+
+
+def _add_json_summary_record(matcher, result):
+    record = {"type": "summary", "found": result.found_nb, "replaced": result.replaced_nb,
+              "skipped": result.skipped_nb_by_reason, "time": round(result.duration, 6)}
+    if result.stats is not None:
+        record["stats"] = {"times": {phase_name: round(phase_duration, 6)
+                                     for phase_name, phase_duration in result.stats["times"].items()},
+                           "counters": result.stats["counters"]}
+    if isinstance(matcher, MultiStringMatcher):
+        record["by_initial_string"] = [{"initial_string": init_str, "destination_string": dest_str,
+                                        "found": result.found_nb_by_init_str.get(init_str, 0),
+                                        "replaced": result.replaced_nb_by_init_str.get(init_str, 0)}
+                                       for init_str, dest_str in matcher.pairs]
+    _add_json_record(record)
+
+
+def _check_no_ask_with_json(ask_replace):
+    if ask_replace:
+        logger.error("the json output can't be used while asking confirmation" +
+                     "\n\tuse one of these parameters %s or %s with it" % (NO_ASK_CONFIRMATION_INDICATORS_STRINGS,
+                                                                          DRY_RUN_INDICATORS_STRINGS))
+        exit(1)
+
 
+def _print_summaries(matcher, json_requested, result):
+    if json_requested:
+        _add_json_summary_record(matcher, result)
+        _flush_json_records()
+    else:
+        _occs_summary(matcher, result)
+        _skips_summary(result)
+        if result.stats is not None:
+            _stats_summary(result)
+
+
+def _check_watch_mode(specific, review_requested):
+    if specific:
+        logger.error("the watch mode watches a directory, it can't be used in the specific replace mode" +
+                     "\n\tuse the local or the recursive replace mode (-l or -r) with it")
+        exit(1)
+    if review_requested:
+        logger.error("the watch mode can't be used with the review mode" +
+                     "\n\tremove one of these parameters %s" % (REVIEW_INDICATORS_STRINGS + WATCH_INDICATORS_STRINGS))
+        exit(1)
 
-def _occs_summary(init_str):
-    global found_nb
-    global replaced_nb
+
+def _skips_summary(result):
+    skipped_nb_by_reason = result.skipped_nb_by_reason
+    skipped_summary = ""
+    for reason, skipped_nb in sorted(skipped_nb_by_reason.items()):
+        if reason != OWNED_BY_OTHER_USER:
+            skipped_summary += "\n\t    %s: " % reason + CFILE_PATHS + "%s" % skipped_nb + BASE_C
+    if skipped_summary:
+        logger.info("skipped files by reason:" + skipped_summary + ("" if state.verbosity >= VERBOSE_VERBOSITY else
+                                                                    "\n\tuse -v to list them"))
+    if OWNED_BY_OTHER_USER in skipped_nb_by_reason:
+        logger.info(CFILE_PATHS + "%s" % skipped_nb_by_reason[OWNED_BY_OTHER_USER] + BASE_C +
+                    " files are owned by another user than " + CFILE_PATHS + "%s" % _get_current_user() + BASE_C +
+                    ", might be necessary to manage their permissions")
+
+
+def _occs_summary(matcher, result):
+    found_nb = result.found_nb
+    replaced_nb = result.replaced_nb
+    init_str = matcher.init_str_label
     if found_nb == 0:
         logger.info(
             CFILE_PATHS + "\n\t0" + BASE_C + " occurrence of " + COCCURRENCES + "%s" % init_str + BASE_C + " found")
@@ -979,6 +2415,16 @@ def _occs_summary(init_str):
                     "%s" % init_str + BASE_C + " found and " + CFILE_PATHS + "%s" % replaced_nb +
                     BASE_C + " replaced")
 
+    if isinstance(matcher, MultiStringMatcher):
+        pairs_summary = ""
+        for init_str, dest_str in matcher.pairs:
+            pairs_summary += "\n\t    " + COCCURRENCES + "\"%s\"" % init_str + BASE_C + " -> " + COCCURRENCES + \
+                             "\"%s\"" % dest_str + BASE_C + ": " + CFILE_PATHS + \
+                             "%s" % result.found_nb_by_init_str.get(init_str, 0) + BASE_C + " found and " + \
+                             CFILE_PATHS + "%s" % result.replaced_nb_by_init_str.get(init_str, 0) + BASE_C + \
+                             " replaced"
+        logger.info("occurrences by initial string:" + pairs_summary)
+
 
 def _get_full_paths(dir_path_to_apply, file_paths_to_apply):
     if file_paths_to_apply:
@@ -1045,9 +2491,397 @@ def _check_integrity_of_mode_request(local, recursive, specific, dir_path_to_app
     return local, recursive, specific, dir_path_to_apply, file_paths_to_apply
 
 
+ReplaceResult = collections.namedtuple("ReplaceResult", ["found_nb", "replaced_nb", "found_nb_by_init_str",
+                                                          "replaced_nb_by_init_str", "skipped_nb_by_reason",
+                                                          "duration", "stats"])
+
+
+class ReplaceOptions:
+    """options of a Replacer
+
+    The defaults are the ones of the command line, except that the directories are walked recursively and that no
+    confirmation is asked. verbosity is one of the *_VERBOSITY levels, durability one of DURABILITIES. With a
+    journal_path, the replaced files are recorded in this undo journal, see undo.
+    """
+
+    def __init__(self, recursive=True, ask_replace=False, case_sensitive=True, black_list_extensions=True,
+                 binary_accepted=False, symlink_accepted=False, excluded_strings=(), excluded_extensions=(),
+                 excluded_paths=(), file_name_must_end_by=(), jobs_nb=1, use_index=False, rebuild_index=False,
+                 respect_gitignore=False, regex=False, durability=NO_DURABILITY, dry_run=False, json_output=False,
+                 verbosity=QUIET_VERBOSITY, stats=False, pipeline=False, journal_path=None):
+        if not isinstance(jobs_nb, int) or jobs_nb < 1:
+            raise ReplaceError("the number of jobs must be a positive integer and is: %s" % jobs_nb)
+        if durability not in DURABILITIES:
+            raise ReplaceError("the durability must be one of %s and is: %s" % (DURABILITIES, durability))
+        # nothing to confirm when nothing is replaced
+        ask_replace = ask_replace and not dry_run
+        if json_output and ask_replace:
+            raise ReplaceError("the json output can't be used while asking confirmation")
+        self.recursive = recursive
+        self.ask_replace = ask_replace
+        self.case_sensitive = case_sensitive
+        self.black_list_extensions = black_list_extensions
+        self.binary_accepted = binary_accepted
+        self.symlink_accepted = symlink_accepted
+        self.excluded_strings = list(excluded_strings)
+        self.excluded_extensions = list(excluded_extensions)
+        # prefixes of the absolute walked paths, like the ones of the command line: no glob
+        self.excluded_paths = [get_full_path_joined(excluded_path) for excluded_path in excluded_paths]
+        self.file_name_must_end_by = list(file_name_must_end_by)
+        self.jobs_nb = jobs_nb
+        self.use_index = use_index
+        self.rebuild_index = rebuild_index
+        self.respect_gitignore = respect_gitignore
+        self.regex = regex
+        self.durability = durability
+        self.dry_run = dry_run
+        self.json_output = json_output
+        self.verbosity = verbosity
+        self.stats = stats
+        self.pipeline = pipeline
+        self.journal_path = journal_path
+
+
+def _get_result(run_state, start_time):
+    run_stats_summary = None
+    if run_state.run_stats is not None:
+        run_stats_summary = {"times": dict(run_state.run_stats.ordered_times()),
+                             "counters": dict(run_state.run_stats.ordered_counters())}
+    return ReplaceResult(run_state.found_nb, run_state.replaced_nb, dict(run_state.found_nb_by_init_str),
+                         dict(run_state.replaced_nb_by_init_str), dict(run_state.skipped_nb_by_reason),
+                         time.perf_counter() - start_time, run_stats_summary)
+
+
+def _get_matcher(patterns, case_sensitive, regex):
+    # a pair is replaced alone, a dict of initial strings to destination strings at once like a mapping file
+    if isinstance(patterns, tuple):
+        patterns = [patterns]
+    multi = isinstance(patterns, dict)
+    pairs = list(patterns.items()) if multi else list(patterns)
+    if not pairs:
+        raise ReplaceError("no initial string to replace")
+    # like in a mapping file, an initial string has only one destination string
+    init_strs = set()
+    for init_str, _ in pairs:
+        if not init_str:
+            raise ReplaceError("the initial string can't be empty")
+        if init_str in init_strs:
+            raise ReplaceError("the initial string \"%s\" is given several times" % init_str)
+        init_strs.add(init_str)
+    if len(pairs) > 1 or multi:
+        if regex:
+            raise ReplaceError("several initial strings can't be used with the regex mode")
+        return MultiStringMatcher(pairs, case_sensitive)
+    init_str, dest_str = pairs[0]
+    if not regex:
+        return StringMatcher(init_str, dest_str, case_sensitive)
+    try:
+        return RegexMatcher(init_str, dest_str, case_sensitive)
+    except re.error as error:
+        raise ReplaceError("the initial string \"%s\" is not a valid regular expression: %s" % (init_str, error))
+
+
+class Replacer:
+    """search and replace of patterns, built once and run on as many paths as needed
+
+    patterns is an (initial string, destination string) pair, a list of them or a dict of them, see _get_matcher. The
+    matcher, the path filter and the content index are kept between the runs. The counters are the ones of the Replacer,
+    reset by each run: several Replacers may run at once in different threads, the runs of one Replacer can't overlap.
+    """
+
+    def __init__(self, patterns, options=None):
+        self.options = options if options is not None else ReplaceOptions()
+        self.matcher = _get_matcher(patterns, self.options.case_sensitive, self.options.regex)
+        self._path_filter = PathFilter(self.options.black_list_extensions, self.options.excluded_paths,
+                                       self.options.excluded_extensions, self.options.excluded_strings,
+                                       self.options.file_name_must_end_by)
+        self._content_index = None
+        self._state = _RunState()
+
+    def run(self, paths):
+        return self._run(paths, self.options.dry_run)
+
+    def review(self, paths, patch_path):
+        # read only: the replacements are written to patch_path as a unified diff, whose hunks left after the review
+        # are applied by apply_patch
+        try:
+            self._state.review_patch_file = open(patch_path, "w", encoding=ENCODING_INPUT_FILES, newline="")
+        except OSError as e:
+            raise ReplaceError("the review patch %s can not be written\n\t%s" % (patch_path, e))
+        self._state.reviewing = True
+        try:
+            return self._run(paths, True)
+        finally:
+            self._state.reviewing = False
+            self._state.review_patch_file.close()
+            self._state.review_patch_file = None
+
+    def apply_patch(self, patch_path):
+        # the files changed since the review are left as they are
+        try:
+            with open(patch_path, encoding=ENCODING_INPUT_FILES, newline="") as patch_file:
+                # split on \n only, like the lines of the reviewed files
+                file_patches = review.parse_patch(list(io.StringIO(patch_file.read())))
+        except (OSError, UnicodeDecodeError, review.PatchError) as e:
+            raise ReplaceError("the review patch %s can not be read\n\t%s" % (patch_path, e))
+
+        start_time = time.perf_counter()
+        with self._running(False):
+            for file_path, hunks in file_patches:
+                if hunks:
+                    _apply_file_hunks(file_path, hunks, self.matcher, self.options.durability)
+        return _get_result(self._state, start_time)
+
+    def watch(self, path, on_result=None, debounce=watch.DEBOUNCE_DELAY):
+        """runs on the directory path, then on the files changed in it each time some are, until interrupted
+
+        The changed files get the path rules of the walk. on_result is called with the ReplaceResult of each run. The
+        files replaced by a run are not processed again unless they change afterwards.
+        """
+        path = get_full_path_joined(path)
+        if not os.path.isdir(path):
+            raise ReplaceError("the watched path %s is not a directory" % path)
+        # the directories pruned by the walk are not watched. Watched before the first run, so that no change done
+        # meanwhile is missed
+        ignore_tree = ignore.IgnoreTree(path) if self.options.respect_gitignore else None
+        watcher = watch.create_watcher(path, functools.partial(self._directory_accepted, ignore_tree=ignore_tree),
+                                       self.options.recursive)
+        known_signatures = {}
+        self._state.replaced_file_signatures = {}
+        try:
+            result = self._run([path], self.options.dry_run)
+            known_signatures.update(self._state.replaced_file_signatures)
+            if on_result is not None:
+                on_result(result)
+            if isinstance(watcher, watch.PollingWatcher):
+                logger.warning("inotify is not available, the changes are polled every %s s" % watch.POLL_INTERVAL)
+            logger.info("watching " + CFILE_PATHS + "%s" % path + BASE_C + " for changes, [Ctrl+C] to stop")
+            while True:
+                changed_file_paths = []
+                for file_path in watcher.changed_paths(debounce):
+                    try:
+                        file_signature = watch.file_signature(os.stat(file_path))
+                    except OSError:
+                        # removed meanwhile, like the temporary files of the replacements
+                        continue
+                    if known_signatures.get(file_path) != file_signature:
+                        changed_file_paths.append(file_path)
+                if not changed_file_paths:
+                    continue
+                # the ignore files may have changed since the previous run
+                ignore_tree = ignore.IgnoreTree(path) if self.options.respect_gitignore else None
+                result = self._run_changed_files(changed_file_paths, ignore_tree)
+                known_signatures.update(self._state.replaced_file_signatures)
+                if on_result is not None:
+                    on_result(result)
+        finally:
+            self._state.replaced_file_signatures = None
+            watcher.close()
+
+    def _directory_accepted(self, directory_path, ignore_tree=None):
+        if ignore_tree is not None and ignore_tree.is_ignored(directory_path, True):
+            return False
+        return self._path_filter.classify_directory(directory_path) is None
+
+    def _run_changed_files(self, file_paths, ignore_tree=None):
+        # the files of a watched directory, processed one by one: a change only costs the files it touched
+        options = self.options
+        ask_replace = options.ask_replace and not options.dry_run
+        start_time = time.perf_counter()
+        content_index = self._get_content_index()
+        with self._running(options.dry_run):
+            for file_path in file_paths:
+                if not os.path.isfile(file_path):
+                    continue
+                if ignore_tree is not None and ignore_tree.is_ignored(file_path, False):
+                    continue
+                if _path_filtered(file_path, self._path_filter.classify(file_path)):
+                    continue
+                _process_file(file_path, self.matcher, ask_replace, options.binary_accepted,
+                              options.symlink_accepted, content_index, os.path.islink(file_path),
+                              options.durability, options.dry_run)
+        return _get_result(self._state, start_time)
+
+    def _run(self, paths, dry_run):
+        # a directory is walked, a file is processed alone with only the black list extensions filter
+        options = self.options
+        ask_replace = options.ask_replace and not dry_run
+        if isinstance(paths, str):
+            paths = [paths]
+        paths = [get_full_path_joined(path) for path in paths]
+        for path in paths:
+            if not os.path.exists(path):
+                raise ReplaceError("the path %s doesn't exist" % path)
+
+        start_time = time.perf_counter()
+        content_index = self._get_content_index()
+        with self._running(dry_run):
+            for path in paths:
+                if os.path.isdir(path):
+                    _replace_local_recursive(path, self.matcher, self._path_filter, not options.recursive,
+                                             ask_replace, options.binary_accepted, options.symlink_accepted,
+                                             options.jobs_nb, content_index, options.respect_gitignore,
+                                             options.durability, dry_run, options.pipeline)
+                else:
+                    _replace_specific([path], self.matcher, options.black_list_extensions, ask_replace,
+                                      options.binary_accepted, options.symlink_accepted, content_index,
+                                      options.durability, dry_run)
+        return _get_result(self._state, start_time)
+
+    @contextlib.contextmanager
+    def _running(self, dry_run):
+        # the counters, output mode and journal of a run, in the state of the Replacer
+        with _running_state(self._state, self.options.json_output, self.options.verbosity, self.options.stats):
+            # nothing is replaced by a dry run, nothing to journal
+            _open_undo_journal(self.options.journal_path if not dry_run else None)
+            try:
+                yield
+            finally:
+                # also after an abort, the files already replaced are synced
+                _sync_committed_files()
+                _flush_json_records()
+                _close_undo_journal()
+
+    def close(self):
+        if self._content_index is not None:
+            self._content_index.close()
+            self._content_index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_content_index(self):
+        # opened, and rebuilt when asked, by the first run only
+        if self.options.use_index and self._content_index is None:
+            try:
+                self._content_index = index.ContentIndex(rebuild=self.options.rebuild_index)
+            except (OSError, sqlite3.Error) as e:
+                raise ReplaceError("the content index %s can not be opened\n\t%s" % (index.default_index_path(), e) +
+                                   "\n\trebuild it or run without the index")
+        return self._content_index
+
+
+UndoResult = collections.namedtuple("UndoResult", ["restored_file_paths", "changed_file_paths", "duration"])
+
+
+def undo(journal_path, durability=BATCH_DURABILITY, verbosity=QUIET_VERBOSITY):
+    """restores the files recorded in the undo journal journal_path, the last replaced first
+
+    A file changed since its replacement is left as it is, its path is in the changed_file_paths of the result.
+    """
+    try:
+        records = journal.read_journal(journal_path)
+    except (OSError, journal.JournalError) as e:
+        raise ReplaceError("the undo journal %s can not be read\n\t%s" % (journal_path, e))
+
+    start_time = time.perf_counter()
+    restored_file_paths = []
+    changed_file_paths = []
+    # a file replaced by several runs is restored record after record: after the first one, its stat is the one of
+    # the content restored, no more the one of the record
+    restored_stats = {}
+    with _running_state(_RunState(), False, verbosity, False):
+        try:
+            for record in reversed(records):
+                file_stat = _get_file_stat(record.path)
+                if file_stat is None:
+                    continue
+                if not _journaled_content_kept(file_stat, record, restored_stats.get(record.path)):
+                    logger.warning(CFILE_PATHS + "%s" % record.path + BASE_C + " changed since its replacement, it "
+                                                                                 "is not restored")
+                    changed_file_paths.append(record.path)
+                    continue
+                restored_stat = _undo_file_changes(record, file_stat, durability)
+                if restored_stat is not None:
+                    restored_stats[record.path] = restored_stat
+                    restored_file_paths.append(record.path)
+        finally:
+            _sync_committed_files()
+    return UndoResult(list(dict.fromkeys(restored_file_paths)), list(dict.fromkeys(changed_file_paths)),
+                      time.perf_counter() - start_time)
+
+
+def _journaled_content_kept(file_stat, record, restored_stat=None):
+    # the size and modification time are the ones of the replaced content, or of the content restored by a newer
+    # record of the file
+    if file_stat.st_size != record.size:
+        return False
+    if restored_stat is not None:
+        return file_stat.st_mtime_ns == restored_stat.st_mtime_ns
+    return file_stat.st_mtime_ns == record.mtime_ns
+
+
+def _undo_file_changes(record, file_stat, durability):
+    # the spans between the changes are copied from the replaced content, the changes get their original bytes back.
+    # Returns the stat of the restored file
+    file_content = _read_file_content(record.path)
+    if file_content is None:
+        return None
+    try:
+        temporary_file = _create_temporary_file(record.path, _get_file_permission_mask(record.path, file_stat))
+        if temporary_file is None:
+            return None
+        temporary_file.set_source(None, file_content, record.path)
+        position = 0
+        for offset, length, original in record.changes:
+            temporary_file.copy_source(position, offset)
+            temporary_file.write_bytes(original)
+            position = offset + length
+        temporary_file.copy_source(position, len(file_content))
+    finally:
+        if isinstance(file_content, mmap.mmap):
+            file_content.close()
+    _replace_file_by_temporary(record.path, temporary_file, durability)
+    logger.info(CFILE_PATHS + "%s" % record.path + BASE_C + " restored")
+    return os.stat(record.path)
+
+
+def _edit_review_patch(patch_path):
+    editor = os.environ.get("VISUAL") or os.environ.get("EDITOR")
+    if not editor:
+        input("\n\tremove the hunks not to apply from the patch " + CFILE_PATHS + "%s" % patch_path + BASE_C +
+              "\n\t\t[Enter] to apply the others\t\t[Ctrl+C] to abort\n\t")
+        return
+    # like git, an editor exiting with an error aborts
+    if subprocess.call(shlex.split(editor) + [patch_path]) != 0:
+        raise Abort
+
+
+def _review_replacements(replacer, paths, review_patch_path):
+    # --review: a read only scan writing the patch, one review of the patch, then the hunks left applied at once.
+    # With --dry_run the patch is only written
+    patch_is_temporary = review_patch_path is None
+    if patch_is_temporary:
+        patch_fd, review_patch_path = tempfile.mkstemp(prefix="replacefs-review-", suffix=".patch")
+        os.close(patch_fd)
+    try:
+        review_result = replacer.review(paths, review_patch_path)
+        if replacer.options.dry_run or review_result.found_nb == 0:
+            if not patch_is_temporary:
+                logger.info("review patch written in " + CFILE_PATHS + "%s" % review_patch_path + BASE_C)
+            return review_result
+        try:
+            _edit_review_patch(review_patch_path)
+        except KeyboardInterrupt:
+            raise Abort
+        result = replacer.apply_patch(review_patch_path)
+    finally:
+        if patch_is_temporary:
+            os.remove(review_patch_path)
+    # the occurrences found and the files skipped are the ones of the scan
+    return result._replace(found_nb=review_result.found_nb, found_nb_by_init_str=review_result.found_nb_by_init_str,
+                           skipped_nb_by_reason=review_result.skipped_nb_by_reason,
+                           duration=review_result.duration + result.duration)
+
+
 def launch():
+    # the command line parses its arguments into a Replacer and prints the summaries of its result
     input_args = sys.argv[1:]
     _help_requested(input_args)
+    _undo_requested(input_args)
     _check_input_args(input_args)
     # file_name_must_end_by, local, recursive, specific, ask_replace, case_sensitive, \
     #     black_list_extensions, binary_accepted, symlink_accepted, excluded_strings, \
@@ -1059,7 +2893,10 @@ def launch():
     file_paths_to_apply, local, recursive, specific, ask_replace, \
     case_sensitive, black_list_extensions, binary_accepted, \
     symlink_accepted, excluded_strings, excluded_extensions, \
-    excluded_paths, args_not_used_indexes = _treat_input_args(input_args)
+    excluded_paths, jobs_nb, mapping_file_path, use_index, rebuild_index, \
+    respect_gitignore, regex, durability, dry_run, json_requested, verbosity_level, stats_requested, profile_path, \
+    pipeline, review_requested, review_patch_path, journal_path, watch_requested, \
+    args_not_used_indexes = _treat_input_args(input_args)
 
     _check_only_one_replace_mode_picked(local, specific, recursive)
 
@@ -1068,13 +2905,13 @@ def launch():
         dir_path_to_apply, dest_str, init_str = \
             _get_final_args_local_recursive(dir_path_to_apply, dest_str,
                                             init_str, local, recursive, input_args,
-                                            args_not_used_indexes)
+                                            args_not_used_indexes, mapping_file_path)
 
     elif specific:
         file_paths_to_apply, dest_str, init_str = \
             _get_final_args_specific(file_paths_to_apply, dest_str,
                                      init_str, specific, input_args,
-                                     args_not_used_indexes)
+                                     args_not_used_indexes, mapping_file_path)
     else:
         logger.error("the replace mode can only be \"local\", \"recursive\" or \"specific\"" +
                      "\n\tplease pick only one mode with the -l, -r or -s short options")
@@ -1085,38 +2922,57 @@ def launch():
     local, recursive, specific, dir_path_to_apply, file_paths_to_apply = \
         _check_integrity_of_mode_request(local, recursive, specific, dir_path_to_apply, file_paths_to_apply)
 
-    # apply the replace
-    # if local:
-    #     found_nb, replaced_nb = \
-    #         _replace_local_recursive(dir_path_to_apply, init_str, dest_str, black_list_extensions,
-    #                                  file_name_must_end_by, excluded_paths, excluded_strings, excluded_extensions,
-    #                                  local,
-    #                                  found_nb, replaced_nb, ask_replace, case_sensitive,
-    #                                  binary_accepted, symlink_accepted)
-    #
-    # elif recursive:
-    #     found_nb, replaced_nb = \
-    #         _replace_local_recursive(dir_path_to_apply, init_str, dest_str, black_list_extensions,
-    #                                  file_name_must_end_by, excluded_paths, excluded_strings, excluded_extensions,
-    #                                  local,
-    #                                  found_nb, replaced_nb, ask_replace, case_sensitive,
-    #                                  binary_accepted, symlink_accepted)
-
-    if local or recursive:
-        _replace_local_recursive(dir_path_to_apply, init_str, dest_str, black_list_extensions,
-                                 file_name_must_end_by, excluded_paths, excluded_strings, excluded_extensions,
-                                 local, ask_replace, case_sensitive,
-                                 binary_accepted, symlink_accepted)
-
-    elif specific:
-        _replace_specific(file_paths_to_apply, init_str, dest_str, black_list_extensions, ask_replace,
-                          case_sensitive, binary_accepted, symlink_accepted)
+    if mapping_file_path is not None:
+        _check_no_regex_with_mapping_file(regex)
+        patterns = dict(_read_mapping_file(get_full_path_joined(mapping_file_path)))
     else:
-        logger.error("the replace mode can only be \"local\", \"recursive\" or \"specific\"\n\t"
-                     "please pick only one mode with the -l, -r or -s short options")
+        patterns = (init_str, dest_str)
+    if json_requested:
+        _check_no_ask_with_json(ask_replace and not dry_run)
+    if watch_requested:
+        _check_watch_mode(specific, review_requested)
+    paths = [dir_path_to_apply] if local or recursive else file_paths_to_apply
+    # the output mode of the summaries printed once the runs are done, the runs set it again in their own state
+    _set_output_mode(json_requested, verbosity_level)
+
+    profiler = None
+    if profile_path is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        options = ReplaceOptions(recursive, ask_replace, case_sensitive, black_list_extensions, binary_accepted,
+                                 symlink_accepted, excluded_strings, excluded_extensions, excluded_paths,
+                                 file_name_must_end_by, jobs_nb, use_index, rebuild_index, respect_gitignore, regex,
+                                 durability, dry_run, json_requested, verbosity_level, stats_requested, pipeline,
+                                 journal_path)
+        with Replacer(patterns, options) as replacer:
+            if watch_requested:
+                replacer.watch(paths[0], functools.partial(_print_summaries, replacer.matcher, json_requested))
+            elif review_requested:
+                result = _review_replacements(replacer, paths, review_patch_path)
+            else:
+                result = replacer.run(paths)
+    except Abort:
+        logger.info(YELLOW + "\n\t\t\taborted ...\n\t\t\t\tSee you later" + BASE_C)
+        exit(0)
+    except ReplaceError as e:
+        logger.error("%s" % e)
         exit(1)
+    except KeyboardInterrupt:
+        if not watch_requested:
+            raise
+        logger.info(YELLOW + "\n\t\t\tstopped watching" + BASE_C)
+        exit(0)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
 
-    _occs_summary(init_str)
+    _print_summaries(replacer.matcher, json_requested, result)
+    if not json_requested and profile_path is not None:
+        logger.info("profile saved in " + CFILE_PATHS + "%s" % profile_path + BASE_C +
+                    ", read it with: python -m pstats %s" % profile_path)
 
 
 if __name__ == "__main__":
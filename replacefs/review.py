@@ -0,0 +1,126 @@
+"""unified diff patches of the proposed replacements, used by --review
+
+Each file owning occurrences gets one hunk per group of replaced lines, with REVIEW_CONTEXT_LINES_NB lines of context
+around them. The line endings of the files are kept as they are. Once the patch is reviewed, the hunks left are
+applied: each one is checked against the current content of its file first.
+"""
+import io
+
+REVIEW_CONTEXT_LINES_NB = 2
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+
+
+class PatchError(Exception):
+    pass
+
+
+def format_file_patch(file_path, lines, new_lines_by_index):
+    # lines are the lines of the file with their endings, new_lines_by_index the replaced ones by index in lines
+    changed_indexes = sorted(new_lines_by_index)
+    patch = ["--- %s\n" % file_path, "+++ %s\n" % file_path]
+    group_start = 0
+    for changed_index_index, changed_index in enumerate(changed_indexes):
+        is_last = changed_index_index + 1 == len(changed_indexes)
+        if not is_last and changed_indexes[changed_index_index + 1] - changed_index <= 2 * REVIEW_CONTEXT_LINES_NB:
+            continue
+        patch.extend(_format_hunk(lines, new_lines_by_index, changed_indexes[group_start:changed_index_index + 1]))
+        group_start = changed_index_index + 1
+    return "".join(patch)
+
+
+def _format_hunk(lines, new_lines_by_index, changed_indexes):
+    start = max(changed_indexes[0] - REVIEW_CONTEXT_LINES_NB, 0)
+    end = min(changed_indexes[-1] + REVIEW_CONTEXT_LINES_NB + 1, len(lines))
+    body = []
+    new_count = 0
+    for line_index in range(start, end):
+        line = lines[line_index]
+        if line_index not in new_lines_by_index:
+            body.extend(_hunk_lines(" ", [line]))
+            new_count += 1
+            continue
+        # a destination string may own newlines, the replaced line is then several lines. Split on \n only, like the
+        # lines of the file: \r, \x0b, \x0c, \x85 or \u2028 stay inside their line
+        new_lines = list(io.StringIO(new_lines_by_index[line_index]))
+        body.extend(_hunk_lines("-", [line]))
+        body.extend(_hunk_lines("+", new_lines))
+        new_count += len(new_lines)
+    header = "@@ -%s,%s +%s,%s @@\n" % (start + 1, end - start, start + 1, new_count)
+    return [header] + body
+
+
+def _hunk_lines(prefix, lines):
+    hunk_lines = []
+    for line in lines:
+        hunk_lines.append(prefix + line)
+        if not line.endswith("\n"):
+            hunk_lines.append("\n" + NO_NEWLINE_MARKER)
+    return hunk_lines
+
+
+def parse_patch(patch_lines):
+    # returns the [(file_path, hunks)] of the patch, a hunk being (old_start, old_lines, new_lines). The counts of the
+    # hunk headers are not trusted, the reviewer may have edited the hunks: a "--- " line is a file header when a
+    # "+++ " line follows it, a removed line otherwise
+    file_patches = []
+    hunk = None
+    last_sides = None
+    for line_index, line in enumerate(patch_lines):
+        line_nb = line_index + 1
+        next_line = patch_lines[line_index + 1] if line_index + 1 < len(patch_lines) else ""
+        if line.startswith("--- ") and next_line.startswith("+++ "):
+            hunk = None
+        elif line.startswith("+++ ") and hunk is None:
+            file_patches.append((line[4:].rstrip("\r\n"), []))
+        elif line.startswith("@@ "):
+            if not file_patches:
+                raise PatchError("the hunk of the line %s doesn't follow any file header" % line_nb)
+            try:
+                old_start = int(line.split()[1][1:].split(",")[0])
+            except (IndexError, ValueError):
+                raise PatchError("the hunk header of the line %s is not valid: %s" % (line_nb, line.rstrip()))
+            hunk = (old_start, [], [])
+            last_sides = None
+            file_patches[-1][1].append(hunk)
+        elif hunk is None:
+            # text around the files, like the comments of the reviewer
+            continue
+        elif line.startswith("\\"):
+            # the previous line has no newline at the end of the file, the patch added it
+            for side_lines in last_sides or []:
+                side_lines[-1] = side_lines[-1][:-1]
+        else:
+            # an empty line is an empty context line whose space was stripped by the editor
+            prefix, content = (line[:1], line[1:]) if line.strip("\r\n") else (" ", line)
+            last_sides = _hunk_sides(hunk, prefix)
+            if last_sides is None:
+                raise PatchError("the line %s of the patch is not a hunk line: %s" % (line_nb, line.rstrip()))
+            for side_lines in last_sides:
+                side_lines.append(content)
+    return file_patches
+
+
+def _hunk_sides(hunk, prefix):
+    # the lines of the hunk a line of the patch belongs to
+    _, old_lines, new_lines = hunk
+    if prefix == " ":
+        return [old_lines, new_lines]
+    if prefix == "-":
+        return [old_lines]
+    if prefix == "+":
+        return [new_lines]
+    return None
+
+
+def locate_hunks(lines, hunks):
+    # returns the (start, end, new_lines) replacing lines[start:end] for each hunk, in the order of the lines, or None
+    # when one of them doesn't match the lines anymore
+    located_hunks = []
+    position = 0
+    for old_start, old_lines, new_lines in sorted(hunks, key=lambda hunk: hunk[0]):
+        start = max(old_start - 1, 0)
+        if start < position or lines[start:start + len(old_lines)] != old_lines:
+            return None
+        position = start + len(old_lines)
+        located_hunks.append((start, position, new_lines))
+    return located_hunks
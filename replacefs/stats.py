@@ -0,0 +1,97 @@
+"""counters and phase timers of a run, shown by --stats
+
+The timers are monotonic and only cover the calls they wrap: the phases of the worker processes of --jobs are summed
+over the workers, the walk is timed in the main process.
+"""
+import time
+import contextlib
+
+# display order of the phases and counters
+PHASES = ["walk", "filter", "stat", "read", "binary check", "byte scan", "decode", "match", "rewrite", "commit",
+          "count"]
+COUNTERS = ["directories scanned", "files visited", "bytes read", "files memory mapped", "files prefetched",
+            "reads avoided by the index", "decodes avoided by the byte scan", "files replaced", "bytes written",
+            "bytes copied by the kernel"]
+
+
+class RunStats:
+    """cheap counters and phase timers, mergeable with the ones of another process"""
+
+    def __init__(self):
+        self.counters = {}
+        self.times = {}
+
+    def add(self, counter_name, value=1):
+        self.counters[counter_name] = self.counters.get(counter_name, 0) + value
+
+    def add_time(self, phase_name, duration):
+        self.times[phase_name] = self.times.get(phase_name, 0.0) + duration
+
+    def _nested_time(self, nested_phase_names):
+        return sum(self.times.get(nested_phase_name, 0.0) for nested_phase_name in nested_phase_names)
+
+    @contextlib.contextmanager
+    def phase(self, phase_name, nested_phase_names=()):
+        # the time of the nested phases timed meanwhile is not counted twice
+        nested_time = self._nested_time(nested_phase_names)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase_name, time.perf_counter() - start_time -
+                          (self._nested_time(nested_phase_names) - nested_time))
+
+    def timed_iterator(self, iterator, phase_name, nested_phase_names=()):
+        # the time taken to produce each item is added to phase_name, not the time the consumer keeps it
+        iterator = iter(iterator)
+        while True:
+            with self.phase(phase_name, nested_phase_names):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def timed_methods(self, instance, method_names, phase_name):
+        return _TimedMethods(self, instance, method_names, phase_name)
+
+    def take(self):
+        # the counters and times gathered so far, for the parent process, and a fresh start
+        taken = {"counters": self.counters, "times": self.times}
+        self.counters = {}
+        self.times = {}
+        return taken
+
+    def merge(self, taken):
+        for counter_name, value in taken["counters"].items():
+            self.add(counter_name, value)
+        for phase_name, duration in taken["times"].items():
+            self.add_time(phase_name, duration)
+
+    def ordered_times(self):
+        return [(phase_name, self.times[phase_name]) for phase_name in PHASES if phase_name in self.times]
+
+    def ordered_counters(self):
+        return [(counter_name, self.counters[counter_name]) for counter_name in COUNTERS
+                if counter_name in self.counters]
+
+
+class _TimedMethods:
+    """proxy of instance whose method_names calls are timed in phase_name"""
+
+    def __init__(self, run_stats, instance, method_names, phase_name):
+        self._instance = instance
+        for method_name in method_names:
+            setattr(self, method_name, self._timed(run_stats, getattr(instance, method_name), phase_name))
+
+    @staticmethod
+    def _timed(run_stats, method, phase_name):
+        def timed_method(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                run_stats.add_time(phase_name, time.perf_counter() - start_time)
+        return timed_method
+
+    def __getattr__(self, name):
+        return getattr(self._instance, name)
@@ -0,0 +1,214 @@
+"""changes of the files of a directory, used by --watch
+
+InotifyWatcher asks the Linux kernel, through ctypes, to report the files written, moved or created in each watched
+directory: the directories not touched cost nothing. Where inotify is not available, PollingWatcher compares stat
+snapshots of the watched directories every POLL_INTERVAL seconds instead. Both group the changes of a burst:
+changed_paths returns once no file changed for debounce seconds.
+"""
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+DEBOUNCE_DELAY = 0.2
+POLL_INTERVAL = 1.0
+READ_SIZE = 64 * 1024
+
+# inotify masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# a file is changed once its writer closes it or once it is renamed in the directory, like the atomic saves of the
+# editors and the commits of replacefs
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+# wd, mask, cookie and length of the name following each event
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class WatchError(Exception):
+    pass
+
+
+def _walk_directories(root_path, directory_accepted, recursive):
+    # the root directory and, when recursive, its sub directories accepted by directory_accepted, symlinks not followed
+    directory_paths = [root_path]
+    while directory_paths:
+        directory_path = directory_paths.pop()
+        yield directory_path
+        if not recursive:
+            continue
+        try:
+            with os.scandir(directory_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and directory_accepted(entry.path):
+                        directory_paths.append(entry.path)
+        except OSError:
+            continue
+
+
+def _list_files(directory_path):
+    try:
+        with os.scandir(directory_path) as entries:
+            return [entry.path for entry in entries if not entry.is_dir()]
+    except OSError:
+        return []
+
+
+class InotifyWatcher:
+    """changes of the files of root_path reported by inotify, one watch per accepted directory"""
+
+    def __init__(self, root_path, directory_accepted, recursive=True):
+        self.root_path = root_path
+        self._directory_accepted = directory_accepted
+        self._recursive = recursive
+        libc_name = ctypes.util.find_library("c")
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_init1
+            self._libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise WatchError("inotify is not available\n\t%s" % e)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatchError("inotify can not be initialized: %s" % os.strerror(ctypes.get_errno()))
+        self._directory_paths_by_wd = {}
+        try:
+            for directory_path in _walk_directories(root_path, directory_accepted, recursive):
+                self._add_watch(directory_path)
+        except WatchError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory_path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory_path), WATCH_MASK)
+        if wd >= 0:
+            self._directory_paths_by_wd[wd] = directory_path
+            return
+        error = ctypes.get_errno()
+        # a directory removed meanwhile is not an error, a watch limit reached is
+        if error not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+            raise WatchError("the directory %s can not be watched: %s" % (directory_path, os.strerror(error)))
+
+    def _add_directory(self, directory_path, changed_paths):
+        # the files of a new directory may have been written before its watch was added
+        for sub_directory_path in _walk_directories(directory_path, self._directory_accepted, True):
+            self._add_watch(sub_directory_path)
+            changed_paths.update(dict.fromkeys(_list_files(sub_directory_path)))
+
+    def changed_paths(self, debounce=DEBOUNCE_DELAY):
+        # blocks until a file changes, then returns the paths of the files changed until debounce seconds without change
+        changed_paths = {}
+        while True:
+            readable, _, _ = select.select([self._fd], [], [], debounce if changed_paths else None)
+            if not readable:
+                return list(changed_paths)
+            self._read_events(changed_paths)
+
+    def _read_events(self, changed_paths):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, all the files are considered changed
+                for directory_path in list(self._directory_paths_by_wd.values()):
+                    changed_paths.update(dict.fromkeys(_list_files(directory_path)))
+                continue
+            if mask & IN_IGNORED:
+                # the directory was removed
+                self._directory_paths_by_wd.pop(wd, None)
+                continue
+            directory_path = self._directory_paths_by_wd.get(wd)
+            if directory_path is None or not name:
+                continue
+            path = os.path.join(directory_path, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self._recursive and mask & (IN_CREATE | IN_MOVED_TO) and self._directory_accepted(path):
+                    self._add_directory(path, changed_paths)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed_paths[path] = None
+
+    def close(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+class PollingWatcher:
+    """changes of the files of root_path found by comparing stat snapshots of the accepted directories"""
+
+    def __init__(self, root_path, directory_accepted, recursive=True, poll_interval=POLL_INTERVAL):
+        self.root_path = root_path
+        self._directory_accepted = directory_accepted
+        self._recursive = recursive
+        self._poll_interval = poll_interval
+        self._signatures = self._snapshot()
+
+    def _snapshot(self):
+        signatures = {}
+        for directory_path in _walk_directories(self.root_path, self._directory_accepted, self._recursive):
+            try:
+                with os.scandir(directory_path) as entries:
+                    for entry in entries:
+                        try:
+                            if not entry.is_dir():
+                                signatures[entry.path] = file_signature(entry.stat())
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return signatures
+
+    def _poll(self, changed_paths):
+        signatures = self._snapshot()
+        changed_nb = len(changed_paths)
+        for path, signature in signatures.items():
+            if self._signatures.get(path) != signature:
+                changed_paths[path] = None
+        self._signatures = signatures
+        return len(changed_paths) > changed_nb
+
+    def changed_paths(self, debounce=DEBOUNCE_DELAY):
+        # same as InotifyWatcher.changed_paths, a change is only seen at the next poll
+        changed_paths = {}
+        while not self._poll(changed_paths):
+            time.sleep(self._poll_interval)
+        while True:
+            time.sleep(debounce)
+            if not self._poll(changed_paths):
+                return list(changed_paths)
+
+    def close(self):
+        self._signatures = {}
+
+
+def file_signature(file_stat):
+    # a file rewritten gets another inode, size or modification time
+    return file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
+
+
+def create_watcher(root_path, directory_accepted, recursive=True):
+    """an InotifyWatcher when the system provides inotify, a PollingWatcher otherwise
+
+    directory_accepted(directory_path) tells whether a sub directory is watched.
+    """
+    try:
+        return InotifyWatcher(root_path, directory_accepted, recursive)
+    except WatchError:
+        return PollingWatcher(root_path, directory_accepted, recursive)
@@ -6,7 +6,7 @@ with open("README.md", "r") as fh:
 setuptools.setup(
     name="replacefs",
     version="1.2.0",
-    python_requires='>=3',
+    python_requires='>=3.9',
     author="yoarch",
     author_email="yo.managements@gmail.com",
     description="Search and replace CLI tool for strings on the all system",
@@ -22,6 +22,7 @@ setuptools.setup(
     entry_points={
 	"console_scripts": [
 	"replacefs = replacefs.__main__:main",
-	"rp = replacefs.__main__:main"
+	"rp = replacefs.__main__:main",
+	"replacefs-bench = replacefs.bench:main"
         ]
     })
@@ -0,0 +1,48 @@
+from replacefs import Replacer, ReplaceOptions
+from replacefs import replacefs
+
+
+def _answering(monkeypatch, answer, on_ask=None):
+    # input() answers answer to each question, after on_ask(question_nb)
+    questions = []
+
+    def fake_input(prompt=""):
+        questions.append(prompt)
+        if on_ask is not None:
+            on_ask(len(questions))
+        return answer
+
+    monkeypatch.setattr("builtins.input", fake_input)
+    return questions
+
+
+def test_asked_replacements_are_searched_ahead(tmp_path, monkeypatch):
+    # the files are searched by the reader threads, asked in the walk order and committed by the committer thread
+    contents = {}
+    for file_nb in range(12):
+        path = tmp_path / ("%s.txt" % file_nb)
+        contents[path] = "a toto\nb\ntoto toto\n" if file_nb % 3 else "nothing\n"
+        path.write_text(contents[path])
+    questions = _answering(monkeypatch, "")
+
+    result = Replacer(("toto", "tata"), ReplaceOptions(ask_replace=True)).run(str(tmp_path))
+    assert result.found_nb == result.replaced_nb == 24
+    # one question by occurrence, also for the occurrences sharing a line
+    assert len(questions) == 24
+    for path, content in contents.items():
+        assert path.read_text() == content.replace("toto", "tata")
+
+
+def test_file_changed_while_asked_is_not_replaced(tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_text("toto\n")
+
+    def edit(question_nb):
+        path.write_text("edited meanwhile\n")
+
+    _answering(monkeypatch, "", edit)
+    result = Replacer(("toto", "tata"), ReplaceOptions(ask_replace=True)).run(str(tmp_path))
+    assert path.read_text() == "edited meanwhile\n"
+    assert result.found_nb == result.replaced_nb == 0
+    assert result.skipped_nb_by_reason == {replacefs.CHANGED_WHILE_ASKED: 1}
+    assert [file_path.name for file_path in tmp_path.iterdir()] == ["a.txt"]
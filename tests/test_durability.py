@@ -0,0 +1,68 @@
+import os
+import stat
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions, ReplaceError
+from replacefs import replacefs
+
+
+@pytest.fixture
+def synced_paths(monkeypatch):
+    # the path of each synced file descriptor, in the order of the syncs
+    paths = []
+    fsync = os.fsync
+
+    def recorded_fsync(fd):
+        paths.append(os.readlink("/proc/self/fd/%s" % fd))
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", recorded_fsync)
+    return paths
+
+
+def _make_tree(root_path):
+    (root_path / "sub").mkdir()
+    file_paths = [root_path / "a.txt", root_path / "b.txt", root_path / "sub" / "c.txt"]
+    for path in file_paths:
+        path.write_text("toto\n")
+    (root_path / "no_match.txt").write_text("nothing\n")
+    return file_paths
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="the synced paths are read from /proc")
+def test_file_durability_syncs_each_file_before_its_rename(tmp_path, synced_paths):
+    file_paths = _make_tree(tmp_path)
+    Replacer(("toto", "tata"), ReplaceOptions(durability=replacefs.FILE_DURABILITY)).run(str(tmp_path))
+    # the temporary file, renamed once synced, then the directory of the file
+    synced_file_paths = [path for path in synced_paths if not os.path.isdir(path)]
+    assert len(synced_file_paths) == 3
+    assert not any(os.path.exists(path) for path in synced_file_paths)
+    assert synced_paths.count(str(tmp_path)) == 2 and synced_paths.count(str(tmp_path / "sub")) == 1
+    for path in file_paths:
+        assert path.read_text() == "tata\n"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="the synced paths are read from /proc")
+def test_batch_durability_syncs_each_file_and_directory_once_at_the_end(tmp_path, synced_paths):
+    file_paths = _make_tree(tmp_path)
+    Replacer(("toto", "tata"), ReplaceOptions(durability=replacefs.BATCH_DURABILITY)).run(str(tmp_path))
+    # the replaced files, then their directories
+    assert sorted(synced_paths[:3]) == sorted(str(path) for path in file_paths)
+    assert sorted(synced_paths[3:]) == sorted([str(tmp_path), str(tmp_path / "sub")])
+
+
+@pytest.mark.parametrize("durability", replacefs.DURABILITIES)
+def test_replaced_file_keeps_its_mode_and_no_temporary_file(tmp_path, durability):
+    path = tmp_path / "a.sh"
+    path.write_text("toto\n")
+    path.chmod(0o751)
+    Replacer(("toto", "tata"), ReplaceOptions(durability=durability)).run(str(tmp_path))
+    assert path.read_text() == "tata\n"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o751
+    assert os.listdir(tmp_path) == ["a.sh"]
+
+
+def test_unknown_durability_is_refused():
+    with pytest.raises(ReplaceError, match="durability"):
+        ReplaceOptions(durability="always")
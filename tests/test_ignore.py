@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import ignore
+
+
+@pytest.mark.parametrize("line, path, matched", [
+    ("*.log", "a.log", True),
+    ("*.log", "sub/dir/a.log", True),
+    ("*.log", "a.log.txt", False),
+    ("/build", "build", True),
+    ("/build", "sub/build", False),
+    ("doc/*.txt", "doc/a.txt", True),
+    ("doc/*.txt", "doc/sub/a.txt", False),
+    ("doc/**/a.txt", "doc/x/y/a.txt", True),
+    ("doc/**/a.txt", "doc/a.txt", True),
+    ("a?c", "abc", True),
+    ("a?c", "a/c", False),
+    ("[!a]b", "cb", True),
+    ("[!a]b", "ab", False),
+    ("\\#not_a_comment", "#not_a_comment", True),
+    ("trailing\\ ", "trailing ", True),
+])
+def test_ignore_line_is_translated(line, path, matched):
+    assert bool(ignore.parse_ignore_line(line).regex.match(path)) == matched
+
+
+@pytest.mark.parametrize("line", ["", "   ", "# comment", "/"])
+def test_blank_and_comment_lines_have_no_rule(line):
+    assert ignore.parse_ignore_line(line) is None
+
+
+def test_deepest_and_last_rules_win(tmp_path):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "sub" / "deep").mkdir(parents=True)
+    (tmp_path / ".gitignore").write_text("*.log\nbuild/\n/top.txt\n")
+    (tmp_path / "sub" / ".ignore").write_text("!keep.log\n")
+    ignore_tree = ignore.IgnoreTree(str(tmp_path / "sub"))
+
+    def is_ignored(relative_path, is_directory=False):
+        return ignore_tree.is_ignored(os.path.join(str(tmp_path), relative_path), is_directory)
+
+    # the ignore files of the parent directories up to the repository root apply too
+    assert is_ignored("sub/a.log") and is_ignored("sub/deep/a.log")
+    assert not is_ignored("sub/keep.log") and not is_ignored("sub/deep/keep.log")
+    assert is_ignored("top.txt") and not is_ignored("sub/top.txt")
+    # a trailing / only matches directories
+    assert is_ignored("sub/build", True) and not is_ignored("sub/build")
+    assert is_ignored("sub/.git", True)
+
+
+def test_ignored_files_are_not_replaced(tmp_path):
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "out").mkdir()
+    (tmp_path / ".gitignore").write_text("out/\n*.tmp\n")
+    for path in tmp_path / "a.txt", tmp_path / "b.tmp", tmp_path / "out" / "c.txt", tmp_path / ".git" / "config":
+        path.write_text("toto\n")
+
+    result = Replacer(("toto", "tata"), ReplaceOptions(respect_gitignore=True)).run(str(tmp_path))
+    assert result.replaced_nb == 1
+    assert (tmp_path / "a.txt").read_text() == "tata\n"
+    for path in tmp_path / "b.tmp", tmp_path / "out" / "c.txt", tmp_path / ".git" / "config":
+        assert path.read_text() == "toto\n"
@@ -0,0 +1,45 @@
+import os
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import index
+
+
+def test_trigram_filter_excludes_the_missing_needles():
+    trigram_filter = index.TrigramFilter.from_content(b"hello world")
+    assert trigram_filter.may_contain(b"hello") and trigram_filter.may_contain(b"o wor")
+    assert not trigram_filter.may_contain(b"toto")
+    # needles shorter than a trigram can't be excluded
+    assert trigram_filter.may_contain(b"zz")
+
+
+def test_changed_file_has_no_filter(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello world\n")
+    content_index = index.ContentIndex(str(tmp_path / "index" / "index.sqlite"))
+    content_index.add(str(path), os.stat(path), path.read_bytes())
+    assert not content_index.get(str(path), os.stat(path)).may_contain(b"toto")
+
+    path.write_bytes(b"hello toto\n")
+    os.utime(path, ns=(0, 0))
+    assert content_index.get(str(path), os.stat(path)) is None
+    content_index.close()
+    # the index is kept on disk, it is rebuilt on demand
+    assert index.ContentIndex(str(tmp_path / "index" / "index.sqlite")).get(str(path), os.stat(path)) is None
+
+
+def test_indexed_runs_replace_like_the_first_one(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    directory_path = tmp_path / "tree"
+    directory_path.mkdir()
+    for file_nb in range(10):
+        (directory_path / ("%s.txt" % file_nb)).write_text("toto\n" if file_nb % 2 else "nothing here\n")
+    replacer = Replacer(("toto", "tata"), ReplaceOptions(use_index=True))
+    assert replacer.run(str(directory_path)).replaced_nb == 5
+    assert os.path.isfile(index.default_index_path())
+
+    # the files not changed since are skipped by their filter, the changed ones are read again
+    (directory_path / "0.txt").write_text("a new toto\n")
+    result = replacer.run(str(directory_path))
+    assert result.replaced_nb == 1
+    assert (directory_path / "0.txt").read_text() == "a new tata\n"
+    assert Replacer(("tata", "x"), ReplaceOptions(use_index=True)).run(str(directory_path)).replaced_nb == 6
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import replacefs
+
+
+def _make_tree(root_path, files_nb):
+    for file_nb in range(files_nb):
+        directory_path = root_path / ("d%s" % (file_nb % 7))
+        directory_path.mkdir(exist_ok=True)
+        content = "toto %s\n" % file_nb * (file_nb % 4) if file_nb % 5 else "\x00toto binary\n"
+        (directory_path / ("%s.txt" % file_nb)).write_text(content)
+
+
+def _tree_contents(root_path):
+    return {str(path.relative_to(root_path)): path.read_bytes() for path in root_path.rglob("*") if path.is_file()}
+
+
+def test_jobs_replace_like_one_job(tmp_path):
+    one_job_path = tmp_path / "one"
+    jobs_path = tmp_path / "jobs"
+    one_job_path.mkdir()
+    jobs_path.mkdir()
+    _make_tree(one_job_path, 100)
+    _make_tree(jobs_path, 100)
+
+    one_job_result = Replacer(("toto", "ti"), ReplaceOptions(durability=replacefs.BATCH_DURABILITY)).run(
+        str(one_job_path))
+    jobs_result = Replacer(("toto", "ti"), ReplaceOptions(jobs_nb=3, durability=replacefs.BATCH_DURABILITY)).run(
+        str(jobs_path))
+    assert _tree_contents(jobs_path) == _tree_contents(one_job_path)
+    assert jobs_result.replaced_nb == one_job_result.replaced_nb == 120
+    assert jobs_result.skipped_nb_by_reason == one_job_result.skipped_nb_by_reason == {replacefs.BINARY_FILE: 20}
+
+
+def test_jobs_are_submitted_through_a_window():
+    # the items are only taken once the results before them are consumed, in their order
+    taken = []
+
+    def items():
+        for item in range(100):
+            taken.append(item)
+            yield item
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = replacefs._submitted_in_order(executor, lambda item: item * 2, items(), 4)
+        assert next(results) == 0
+        assert len(taken) == 4
+        assert list(results) == [item * 2 for item in range(1, 100)]
+
+
+def test_jobs_output_goes_to_the_streams_it_was_written_to(tmp_path, capsys):
+    # the highlighted lines are printed to stdout, the logger records of the workers replayed to stderr
+    _make_tree(tmp_path, 20)
+    Replacer(("toto", "ti"), ReplaceOptions(jobs_nb=2, verbosity=replacefs.VERBOSE_VERBOSITY)).run(str(tmp_path))
+    captured = capsys.readouterr()
+    assert "toto" in captured.out and "[INFO]" not in captured.out and "[WARNING]" not in captured.out
+    assert "is a binary file" in captured.err and "occurrences replaced" not in captured.out
+    assert captured.err.count("[INFO]") > 10
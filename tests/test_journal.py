@@ -0,0 +1,43 @@
+from replacefs import Replacer, ReplaceOptions, undo
+
+
+def _replace_file(path, patterns, **options):
+    return Replacer(patterns, ReplaceOptions(**options)).run(str(path))
+
+
+def test_undo_restores_the_journaled_files(tmp_path):
+    directory_path = tmp_path / "tree"
+    (directory_path / "sub").mkdir(parents=True)
+    contents = {directory_path / "a.txt": "toto titi\r\ntoto\n",
+                directory_path / "sub" / "b.txt": "no match\n",
+                directory_path / "sub" / "c.txt": "é toto é\n" * 3}
+    for path, content in contents.items():
+        path.write_bytes(content.encode())
+    journal_path = str(tmp_path / "journal")
+
+    result = _replace_file(directory_path, ("toto", "tata"), journal_path=journal_path)
+    assert result.replaced_nb == 5
+    # a second run on the replaced files is undone first
+    _replace_file(directory_path, ("tata", "t"), journal_path=journal_path)
+    # the newlines of a replaced file are translated to \n, the undo gives the original ones back
+    assert (directory_path / "a.txt").read_bytes() == b"t titi\nt\n"
+
+    undo_result = undo(journal_path)
+    assert sorted(undo_result.restored_file_paths) == [str(directory_path / "a.txt"),
+                                                       str(directory_path / "sub" / "c.txt")]
+    assert undo_result.changed_file_paths == []
+    for path, content in contents.items():
+        assert path.read_bytes() == content.encode()
+
+
+def test_undo_keeps_the_files_changed_since(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"toto\n")
+    journal_path = str(tmp_path / "journal")
+    _replace_file(path, ("toto", "tata"), journal_path=journal_path)
+    path.write_bytes(b"edited since\n")
+
+    undo_result = undo(journal_path)
+    assert undo_result.restored_file_paths == []
+    assert undo_result.changed_file_paths == [str(path)]
+    assert path.read_bytes() == b"edited since\n"
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import replacefs
+
+
+def _json_records(capsys, path, patterns, **options):
+    Replacer(patterns, ReplaceOptions(json_output=True, **options)).run(str(path))
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_records_of_a_replaced_file(tmp_path, capsys):
+    path = tmp_path / "a.txt"
+    path.write_text("toto\nno\nx toto toto\n")
+    records = _json_records(capsys, path, ("toto", "ti"))
+    assert [(record["type"], record.get("line"), record.get("column")) for record in records] == \
+        [("match", 1, 1), ("match", 3, 3), ("match", 3, 8), ("file", None, None)]
+    assert records[0] == {"type": "match", "path": str(path), "line": 1, "column": 1, "match": "toto",
+                          "replacement": "ti"}
+    assert records[3]["found"] == records[3]["replaced"] == 3
+    assert records[3]["bytes_written"] == path.stat().st_size
+
+
+@pytest.mark.parametrize("content", [
+    "toto_totototo\r\nétoto\n\ntotXtoto é\n" * 9,
+    # a single long line
+    "é toto " * 40,
+])
+def test_streamed_file_has_the_match_records_of_a_line_by_line_one(tmp_path, capsys, monkeypatch, content):
+    streamed_path = tmp_path / "streamed" / "a.txt"
+    line_path = tmp_path / "line" / "a.txt"
+    for path in streamed_path, line_path:
+        path.parent.mkdir()
+        path.write_bytes(content.encode())
+    monkeypatch.setattr(replacefs, "STREAMING_CHUNK_SIZE", 7)
+    monkeypatch.setattr(replacefs, "STREAMING_MIN_FILE_SIZE", 0)
+    streamed_records = _json_records(capsys, streamed_path, {"toto": "ti", "é": "e"})
+    monkeypatch.setattr(replacefs, "STREAMING_MIN_FILE_SIZE", len(content) + 1)
+    line_records = _json_records(capsys, line_path, {"toto": "ti", "é": "e"})
+
+    def match_records(records):
+        return [dict(record, path=None) for record in records if record["type"] == "match"]
+
+    assert len(match_records(streamed_records)) > 20
+    assert match_records(streamed_records) == match_records(line_records)
+    assert streamed_records[-1]["type"] == line_records[-1]["type"] == "file"
+    assert streamed_records[-1]["found"] == line_records[-1]["found"]
+
+
+def test_streamed_file_not_unicode_has_no_records(tmp_path, capsys, monkeypatch):
+    # the decode fails after some chunks were already replaced
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"toto toto\n" * 10 + b"\xff\n")
+    monkeypatch.setattr(replacefs, "STREAMING_CHUNK_SIZE", 7)
+    monkeypatch.setattr(replacefs, "STREAMING_MIN_FILE_SIZE", 0)
+    assert _json_records(capsys, path, ("toto", "ti")) == []
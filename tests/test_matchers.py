@@ -0,0 +1,44 @@
+from replacefs import replacefs
+
+
+def _spans(matcher, line):
+    return [(occurrence.start, occurrence.end, occurrence.dest_str) for occurrence in matcher.find_occurrences(line)]
+
+
+def test_string_matcher_is_literal():
+    matcher = replacefs.StringMatcher("a.c", "x", True)
+    assert _spans(matcher, "abc a.c a.ca.c") == [(4, 7, "x"), (8, 11, "x"), (11, 14, "x")]
+    assert matcher.replace_all("a.c \\1 abc") == "x \\1 abc"
+    assert matcher.count_in_bytes(b"a.c abc a.c") == 2
+
+
+def test_string_matcher_case_insensitive():
+    matcher = replacefs.StringMatcher("Toto", "titi", False)
+    assert _spans(matcher, "toto TOTO tOtO tot") == [(0, 4, "titi"), (5, 9, "titi"), (10, 14, "titi")]
+    assert matcher.in_text("a\nTOTO\n")
+    assert not matcher.streamable
+    # the bytes are prefiltered by their lower case only when they are ascii
+    assert matcher.may_be_in_bytes(b"a TOTO b") and not matcher.may_be_in_bytes(b"a tot b")
+    assert matcher.may_be_in_bytes("a tot é".encode())
+
+
+def test_regex_matcher_expands_groups():
+    matcher = replacefs.RegexMatcher(r"(\w+)@(\w+)", r"\2 at \1", True)
+    assert matcher.replace_all("toto@home, titi@work") == "home at toto, work at titi"
+    assert _spans(matcher, "a@b") == [(0, 3, "b at a")]
+
+
+def test_regex_matcher_in_text_is_searched_line_by_line():
+    # same answer as the occurrences of the lines: ^ matches at each line start, no match spreads over two lines
+    matcher = replacefs.RegexMatcher("^titi", "toto", True)
+    assert matcher.in_text("toto\ntiti\n")
+    assert matcher.in_text("toto\r\ntiti\r\n")
+    assert not replacefs.RegexMatcher(r"c\sd", "x", True).in_text("abc\ndef\n")
+    assert replacefs.RegexMatcher("TITI$", "x", False).in_text("titi\ntoto")
+
+
+def test_multi_string_matcher_is_leftmost_longest():
+    matcher = replacefs.MultiStringMatcher([("ab", "1"), ("abc", "2"), ("bcd", "3")], True)
+    assert _spans(matcher, "abcd ab bcd") == [(0, 3, "2"), (5, 7, "1"), (8, 11, "3")]
+    assert matcher.replace_all("abcd ab bcd") == "2d 1 3"
+    assert replacefs.MultiStringMatcher([("AB", "1"), ("c", "2")], False).replace_all("ab C") == "1 2"
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from replacefs import Replacer
+from replacefs import output
+
+
+def _output_file(path):
+    return output.OutputFile(open(path, "wb", buffering=0), "utf8", str(path))
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = tmp_path / "source.txt"
+    path.write_bytes(b"0123456789" * 100)
+    return path
+
+
+def test_big_source_spans_are_copied_by_the_kernel(tmp_path, monkeypatch, source_path):
+    monkeypatch.setattr(output, "KERNEL_COPY_MIN_SIZE", 100)
+    source_content = source_path.read_bytes()
+    output_path = tmp_path / "output.txt"
+    output_file = _output_file(output_path)
+    output_file.set_source(source_content.decode(), source_content, str(source_path))
+    output_file.copy_source(0, 5)
+    output_file.write("é")
+    output_file.copy_source(10, 990)
+    output_file.copy_source(995, 1000)
+    output_file.close()
+    assert output_path.read_bytes() == source_content[:5] + "é".encode() + source_content[10:990] + \
+        source_content[995:]
+    assert output_file.size == os.path.getsize(output_path)
+    if hasattr(os, "copy_file_range") or hasattr(os, "sendfile"):
+        assert output_file.kernel_copied_size == 980
+
+
+def test_source_is_written_when_the_kernel_copy_fails(tmp_path, monkeypatch, source_path):
+    def failing_copy(*args):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(output, "KERNEL_COPY_MIN_SIZE", 100)
+    monkeypatch.setattr(os, "copy_file_range", failing_copy, raising=False)
+    monkeypatch.setattr(os, "sendfile", failing_copy, raising=False)
+    source_content = source_path.read_bytes()
+    output_path = tmp_path / "output.txt"
+    output_file = _output_file(output_path)
+    output_file.set_source(source_content.decode(), source_content, str(source_path))
+    for start in range(0, 1000, 200):
+        output_file.copy_source(start, start + 150)
+        output_file.write("|")
+    output_file.close()
+    assert output_path.read_bytes() == b"".join(source_content[start:start + 150] + b"|"
+                                                for start in range(0, 1000, 200))
+    assert output_file.kernel_copied_size == 0
+
+
+def test_writes_are_buffered_until_the_flush_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(output, "FLUSH_SIZE", 10)
+    output_path = tmp_path / "output.txt"
+    output_file = _output_file(output_path)
+    output_file.set_source("toto titi")
+    output_file.copy_source(0, 4)
+    output_file.write(" é ")
+    assert output_path.read_bytes() == b""
+    output_file.copy_source(5, 9)
+    assert output_path.read_bytes() == "toto é titi".encode()
+    output_file.close()
+
+
+def test_replaced_file_copied_by_the_kernel(tmp_path, monkeypatch):
+    monkeypatch.setattr(output, "KERNEL_COPY_MIN_SIZE", 10)
+    content = "toto\n" + "no match on this line\n" * 50 + "toto\n"
+    path = tmp_path / "a.txt"
+    path.write_text(content)
+    assert Replacer(("toto", "tata")).run(str(path)).replaced_nb == 2
+    assert path.read_text() == content.replace("toto", "tata")
@@ -0,0 +1,44 @@
+import pytest
+
+from replacefs import replacefs
+
+
+def _path_filter(excluded_paths=(), excluded_extensions=(), excluded_strings=(), file_name_must_end_by=()):
+    return replacefs.PathFilter(False, excluded_paths, excluded_extensions, excluded_strings, file_name_must_end_by)
+
+
+@pytest.mark.parametrize("file_path, reason_and_rule", [
+    ("/a/test_b.py", (replacefs.EXCLUDED_STRING, "test*")),
+    ("/a/mytest.py", None),
+    ("/build/a.py", (replacefs.EXCLUDED_STRING, "build*")),
+    ("/rebuild/a.py", None),
+    ("/a/x.rebuild.py", None),
+    ("/a/node_modules/b.js", (replacefs.EXCLUDED_STRING, "node_modules")),
+    ("/a/my_node_modules/b.js", (replacefs.EXCLUDED_STRING, "node_modules")),
+])
+def test_excluded_string_globs_match_whole_names(file_path, reason_and_rule):
+    # a glob matches a whole file or directory name, never a name in the middle, a plain string is found anywhere
+    assert _path_filter(excluded_strings=["test*", "build*", "node_modules"]).classify(file_path) == reason_and_rule
+
+
+def test_file_name_globs_match_whole_file_names():
+    path_filter = _path_filter(excluded_extensions=["*.m?n.js"], file_name_must_end_by=["?.py", ".txt"])
+    assert path_filter.classify("/a/b.py") is None
+    assert path_filter.classify("/a/abc.py") == (replacefs.FILE_NAME_MUST_END_BY, (".txt", "?.py"))
+    assert path_filter.classify("/a/notes.txt") is None
+    assert path_filter.classify("/a/b.min.js") == (replacefs.EXCLUDED_EXTENSION, "*.m?n.js")
+    assert path_filter.classify("/a/b.min.jsx") == (replacefs.FILE_NAME_MUST_END_BY, (".txt", "?.py"))
+
+
+def test_globs_with_several_stars_give_back_their_rule():
+    path_filter = _path_filter(excluded_strings=["a*b*c", "*.d"])
+    assert path_filter.classify("/x/axxbxc/e") == (replacefs.EXCLUDED_STRING, "a*b*c")
+    assert path_filter.classify("/x/e.d") == (replacefs.EXCLUDED_STRING, "*.d")
+    assert path_filter.classify("/x/zaxbxc/e") is None
+
+
+def test_excluded_paths_are_prefixes():
+    path_filter = _path_filter(excluded_paths=["/a/b"])
+    assert path_filter.classify("/a/b/c.py") == (replacefs.EXCLUDED_PATH, "/a/b")
+    assert path_filter.classify_directory("/a/b") == (replacefs.EXCLUDED_PATH, "/a/b")
+    assert path_filter.classify("/a/c.py") is None
@@ -0,0 +1,53 @@
+import mmap
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import replacefs
+
+
+def _make_tree(root_path, files_nb):
+    for file_nb in range(files_nb):
+        directory_path = root_path / ("d%s" % (file_nb % 3))
+        directory_path.mkdir(parents=True, exist_ok=True)
+        (directory_path / ("%s.txt" % file_nb)).write_text("line %s toto\n" % file_nb * (file_nb % 3) + "end\n")
+
+
+def _tree_contents(root_path):
+    return {str(path.relative_to(root_path)): path.read_bytes() for path in root_path.rglob("*") if path.is_file()}
+
+
+@pytest.fixture
+def mapped_contents(monkeypatch):
+    # every file is memory mapped, the mmaps created are kept to check that they are closed
+    mmaps = []
+
+    class TrackedMmap(mmap.mmap):
+        def __new__(cls, *args, **kwargs):
+            file_content = super().__new__(cls, *args, **kwargs)
+            mmaps.append(file_content)
+            return file_content
+
+    monkeypatch.setattr(mmap, "mmap", TrackedMmap)
+    monkeypatch.setattr(replacefs, "MMAP_MIN_FILE_SIZE", 1)
+    return mmaps
+
+
+def test_pipeline_replaces_like_the_sequential_run(tmp_path, mapped_contents):
+    _make_tree(tmp_path / "sequential", 60)
+    _make_tree(tmp_path / "pipeline", 60)
+    sequential_result = Replacer(("toto", "ti")).run(str(tmp_path / "sequential"))
+    pipeline_result = Replacer(("toto", "ti"), ReplaceOptions(pipeline=True)).run(str(tmp_path / "pipeline"))
+    assert _tree_contents(tmp_path / "pipeline") == _tree_contents(tmp_path / "sequential")
+    assert pipeline_result.replaced_nb == sequential_result.replaced_nb == 60
+    assert mapped_contents and all(file_content.closed for file_content in mapped_contents)
+
+
+def test_files_read_ahead_are_released_on_abort(tmp_path, monkeypatch, mapped_contents):
+    _make_tree(tmp_path, 60)
+    monkeypatch.setattr("builtins.input", lambda prompt="": "a")
+    with pytest.raises(replacefs.Abort):
+        Replacer(("toto", "ti"), ReplaceOptions(ask_replace=True)).run(str(tmp_path))
+    # the files read ahead but never processed as well
+    assert len(mapped_contents) > 1
+    assert all(file_content.closed for file_content in mapped_contents)
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions, ReplaceError
+from replacefs import replacefs
+
+
+@pytest.mark.parametrize("patterns, message", [
+    (("", "x"), "can't be empty"),
+    ([("a", "x"), ("a", "y")], "several times"),
+    ([("a", "x"), ("b", "y")], None),
+])
+def test_initial_strings_are_checked(patterns, message):
+    if message is None:
+        assert isinstance(replacefs._get_matcher(patterns, True, False), replacefs.MultiStringMatcher)
+        return
+    with pytest.raises(ReplaceError, match=message):
+        replacefs._get_matcher(patterns, True, False)
+
+
+def test_replacers_keep_their_own_counters(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"aa bb aa\n")
+    first_replacer = Replacer(("aa", "x"), ReplaceOptions(dry_run=True))
+    second_replacer = Replacer(("bb", "y"), ReplaceOptions(dry_run=True))
+    level = replacefs.logger.level
+    assert first_replacer.run(str(path)).found_nb == 2
+    assert second_replacer.run(str(path)).found_nb == 1
+    assert replacefs.logger.level == level
+
+
+def test_replacers_run_at_once_in_threads(tmp_path):
+    # each thread runs in the state of its Replacer, the committer threads of the batch durability in the same one
+    results = {}
+    for init_str, files_nb in ("aa", 30), ("bb", 20):
+        (tmp_path / init_str).mkdir()
+        for file_nb in range(files_nb):
+            (tmp_path / init_str / ("%s.txt" % file_nb)).write_bytes(init_str.encode() + b" c\n")
+
+    def run(init_str, verbosity):
+        replacer = Replacer((init_str, "x"), ReplaceOptions(verbosity=verbosity,
+                                                            durability=replacefs.BATCH_DURABILITY))
+        results[init_str] = [replacer.run(str(tmp_path / init_str)).replaced_nb for _ in range(3)]
+
+    threads = [threading.Thread(target=run, args=("aa", replacefs.QUIET_VERBOSITY)),
+               threading.Thread(target=run, args=("bb", replacefs.VERBOSE_VERBOSITY))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the files are replaced by the first run only
+    assert results == {"aa": [30, 0, 0], "bb": [20, 0, 0]}
+    assert replacefs.state.found_nb == 0
@@ -0,0 +1,44 @@
+import pytest
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import review
+
+
+@pytest.mark.parametrize("content, dest_str", [
+    ("a toto\nb\nc\nd\ne\nf\ng\ntoto h\n", "tata"),
+    # the line endings are kept, only \n ends a line
+    ("toto\r\nform\x0cfeed toto\x85next line\rcr toto\nlast toto", "tata"),
+    # a destination string owning a newline makes several lines of one
+    ("x toto y\nz\n", "ta\nta"),
+])
+def test_reviewed_patch_applied_as_is_replaces_everything(tmp_path, content, dest_str):
+    path = tmp_path / "a.txt"
+    path.write_bytes(content.encode())
+    patch_path = str(tmp_path / "review.patch")
+    replacer = Replacer(("toto", dest_str))
+
+    review_result = replacer.review(str(path), patch_path)
+    # read only until the patch is applied
+    assert path.read_bytes() == content.encode()
+    apply_result = replacer.apply_patch(patch_path)
+    assert path.read_bytes() == content.replace("toto", dest_str).encode()
+    assert review_result.found_nb == content.count("toto")
+    assert apply_result.replaced_nb == content.count("toto")
+
+
+def test_hunks_removed_from_the_patch_are_not_applied(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("toto 1\n" + "\n" * 9 + "toto 2\n")
+    patch_path = tmp_path / "review.patch"
+    replacer = Replacer(("toto", "tata"))
+    replacer.review(str(path), str(patch_path))
+
+    file_patches = review.parse_patch(patch_path.read_text().splitlines(keepends=True))
+    assert [len(hunks) for _, hunks in file_patches] == [2]
+    # the reviewer drops the first hunk
+    patch_lines = patch_path.read_text().splitlines(keepends=True)
+    second_hunk_index = max(index for index, line in enumerate(patch_lines) if line.startswith("@@"))
+    patch_path.write_text("".join(patch_lines[:2] + patch_lines[second_hunk_index:]))
+
+    replacer.apply_patch(str(patch_path))
+    assert path.read_text() == "toto 1\n" + "\n" * 9 + "tata 2\n"
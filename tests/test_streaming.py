@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from replacefs import Replacer
+from replacefs import replacefs
+
+
+def _replace_file(path, patterns):
+    return Replacer(patterns).run(str(path))
+
+
+def _stream_and_line_replace(tmp_path, monkeypatch, content, patterns):
+    # the same content replaced chunk by chunk, with tiny chunks, and line by line
+    streamed_path = tmp_path / "streamed.txt"
+    line_path = tmp_path / "line.txt"
+    streamed_path.write_bytes(content)
+    line_path.write_bytes(content)
+    monkeypatch.setattr(replacefs, "STREAMING_CHUNK_SIZE", 5)
+    monkeypatch.setattr(replacefs, "STREAMING_MIN_FILE_SIZE", 0)
+    streamed_result = _replace_file(streamed_path, patterns)
+    monkeypatch.setattr(replacefs, "STREAMING_MIN_FILE_SIZE", len(content) + 1)
+    line_result = _replace_file(line_path, patterns)
+    return streamed_path, streamed_result, line_path, line_result
+
+
+@pytest.mark.parametrize("patterns", [("toto", "ti"), {"to": "a", "toto": "bb", "é": "e"}])
+def test_streaming_replaces_like_line_by_line(tmp_path, monkeypatch, patterns):
+    # occurrences crossing the chunk boundaries, multi bytes chars and windows newlines
+    content = "toto_totototo\r\nétoto\ntotXtoto é\n".encode() * 7
+    streamed_path, streamed_result, line_path, line_result = _stream_and_line_replace(tmp_path, monkeypatch, content,
+                                                                                      patterns)
+    assert streamed_path.read_bytes() == line_path.read_bytes() != content
+    assert streamed_result.found_nb == streamed_result.replaced_nb == line_result.replaced_nb > 0
+    assert streamed_result.replaced_nb_by_init_str == line_result.replaced_nb_by_init_str
+
+
+def test_streaming_skips_invalid_utf8_like_line_by_line(tmp_path, monkeypatch):
+    # the invalid byte is only decoded after some chunks were already replaced
+    content = b"toto toto toto\n" * 5 + b"\xff toto\n"
+    streamed_path, streamed_result, line_path, line_result = _stream_and_line_replace(tmp_path, monkeypatch, content,
+                                                                                      ("toto", "ti"))
+    assert streamed_path.read_bytes() == line_path.read_bytes() == content
+    for result in streamed_result, line_result:
+        assert result.found_nb == result.replaced_nb == 0
+        assert result.skipped_nb_by_reason == {replacefs.NON_UNICODE_FILE: 1}
+    assert sorted(os.listdir(tmp_path)) == ["line.txt", "streamed.txt"]
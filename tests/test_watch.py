@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from replacefs import Replacer, ReplaceOptions
+from replacefs import watch
+
+
+def _inotify_watcher(root_path, directory_accepted):
+    try:
+        return watch.InotifyWatcher(root_path, directory_accepted)
+    except watch.WatchError as e:
+        pytest.skip(str(e))
+
+
+def _polling_watcher(root_path, directory_accepted):
+    return watch.PollingWatcher(root_path, directory_accepted, poll_interval=0.01)
+
+
+@pytest.mark.parametrize("create_watcher", [_inotify_watcher, _polling_watcher])
+def test_watcher_reports_the_files_changed(tmp_path, create_watcher):
+    (tmp_path / "excluded").mkdir()
+    (tmp_path / "a.txt").write_text("a\n")
+    (tmp_path / "b.txt").write_text("b\n")
+    watcher = create_watcher(str(tmp_path), lambda directory_path: os.path.basename(directory_path) != "excluded")
+    try:
+        (tmp_path / "a.txt").write_text("a changed\n")
+        (tmp_path / "excluded" / "c.txt").write_text("c\n")
+        # the files of a new directory, maybe written before it is watched
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new" / "d.txt").write_text("d\n")
+        # an atomic save
+        (tmp_path / "e.tmp").write_text("e\n")
+        os.replace(str(tmp_path / "e.tmp"), str(tmp_path / "e.txt"))
+        changed_paths = set(watcher.changed_paths(0.05))
+    finally:
+        watcher.close()
+    changed_paths.discard(str(tmp_path / "e.tmp"))
+    assert changed_paths == {str(tmp_path / "a.txt"), str(tmp_path / "new" / "d.txt"), str(tmp_path / "e.txt")}
+
+
+class StopWatch(Exception):
+    pass
+
+
+def test_watch_replaces_the_files_changed_since_the_previous_run(tmp_path):
+    (tmp_path / "a.txt").write_text("toto\n")
+    (tmp_path / "b.txt").write_text("nothing\n")
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == 1:
+            # the file replaced by the first run is not processed again
+            (tmp_path / "b.txt").write_text("a new toto\n")
+        else:
+            raise StopWatch()
+
+    with pytest.raises(StopWatch):
+        Replacer(("toto", "tata"), ReplaceOptions()).watch(str(tmp_path), on_result, debounce=0.05)
+    assert [(result.found_nb, result.replaced_nb) for result in results] == [(1, 1), (1, 1)]
+    assert (tmp_path / "a.txt").read_text() == "tata\n"
+    assert (tmp_path / "b.txt").read_text() == "a new tata\n"
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.txt"]